@@ -0,0 +1,452 @@
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+
+from utils import data_manager, serialization
+from utils.job_store import JobStore
+from utils.reminders import ReminderEngine
+from utils.smart_rules import RuleEngine
+from utils.standup import StandupFanout, DAILY_PROMPT
+from utils.dispatcher import MessageDispatcher
+from utils.scheduler import Scheduler
+from utils.task import Task
+from utils.task_index import TaskIndex
+from utils.triggers import TriggerMatcher, DEFAULT_TRIGGERS
+from fake_servers import FakeSlackAPI
+from slack_sdk import WebClient
+
+
+def _legacy_task(task_id):
+    return {
+        'description': f'Synthetic task {task_id}',
+        'priority': ('Low', 'Normal', 'High')[task_id % 3],
+        'category': ('Frontend', 'Backend', 'General')[task_id % 3],
+        'status': 'Open',
+        'created_by': 'bench_user',
+        'created_at': datetime.now().isoformat(),
+        'due_date': None,
+        'estimated_hours': None,
+        'assigned_to': None,
+        'completed_at': None,
+        'actual_hours': None,
+        'comments': [],
+        'attachments': []
+    }
+
+
+def _fill_tasks(count):
+    data_manager.tasks.clear()
+    for task_id in range(1, count + 1):
+        data_manager.tasks[task_id] = Task.from_dict(_legacy_task(task_id))
+    data_manager.current_store().task_counter = count + 1
+
+
+def bench_write_latency(sizes=(1000, 10000, 50000), writes=50):
+    """Latency of a single /task-status flip in json vs journal storage mode"""
+    print(f"{'tasks':>8} {'mode':>8} {'avg ms':>10} {'max ms':>10}")
+    original_mode = data_manager.STORAGE_MODE
+    with tempfile.TemporaryDirectory() as tmp:
+        data_manager.DATA_FILE = os.path.join(tmp, 'bot_data.json')
+        data_manager.JOURNAL_FILE = os.path.join(tmp, 'bot_data.journal')
+        data_manager.COMPACTING_FILE = os.path.join(tmp, 'bot_data.journal.compacting')
+        for size in sizes:
+            _fill_tasks(size)
+            for mode in ('json', 'journal'):
+                data_manager.STORAGE_MODE = mode
+                data_manager.save_data()
+                timings = []
+                for i in range(writes):
+                    task_id = (i % size) + 1
+                    data_manager.tasks[task_id]['status'] = 'Completed' if i % 2 else 'Open'
+                    start = time.perf_counter()
+                    data_manager.save_data('tasks', task_id)
+                    timings.append((time.perf_counter() - start) * 1000)
+                data_manager.wait_for_compaction()
+                print(f"{size:>8} {mode:>8} {sum(timings) / len(timings):>10.3f} {max(timings):>10.3f}")
+    data_manager.STORAGE_MODE = original_mode
+
+
+def bench_snapshot_formats(sizes=(10000, 100000, 1000000)):
+    """Save time, load time and file size of each available snapshot format"""
+    formats = [fmt for fmt in serialization.FORMATS
+               if fmt == 'json' or getattr(serialization, fmt) is not None]
+    print(f"{'tasks':>8} {'format':>8} {'save s':>8} {'load s':>8} {'size MB':>8}")
+    original = (data_manager.STORAGE_MODE, data_manager.WRITE_BEHIND, data_manager.SNAPSHOT_FORMAT)
+    data_manager.STORAGE_MODE = 'json'
+    data_manager.WRITE_BEHIND = False
+    with tempfile.TemporaryDirectory() as tmp:
+        data_manager.DATA_FILE = os.path.join(tmp, 'bot_data.json')
+        data_manager.JOURNAL_FILE = os.path.join(tmp, 'bot_data.journal')
+        for size in sizes:
+            _fill_tasks(size)
+            data_manager.reminders['bench_user'] = {
+                'channel_id': 'C0', 'text': 'Synthetic reminder', 'time': datetime.now()
+            }
+            for fmt in formats:
+                data_manager.SNAPSHOT_FORMAT = fmt
+                start = time.perf_counter()
+                data_manager.save_data()
+                save_seconds = time.perf_counter() - start
+                size_mb = os.path.getsize(data_manager.DATA_FILE) / 1024 / 1024
+
+                start = time.perf_counter()
+                data_manager.load_data()
+                len(data_manager.tasks)
+                load_seconds = time.perf_counter() - start
+                print(f"{size:>8} {fmt:>8} {save_seconds:>8.3f} {load_seconds:>8.3f} {size_mb:>8.1f}")
+    data_manager.STORAGE_MODE, data_manager.WRITE_BEHIND, data_manager.SNAPSHOT_FORMAT = original
+
+
+def bench_task_memory(count=100000):
+    """Bytes per task held as a 13-key dict versus a slotted Task record"""
+    builders = {
+        'dict': _legacy_task,
+        'Task': lambda task_id: Task.from_dict(_legacy_task(task_id)),
+    }
+    print(f"{'record':>8} {'bytes/task':>12}")
+    for name, build in builders.items():
+        tracemalloc.start()
+        records = {task_id: build(task_id) for task_id in range(count)}
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{name:>8} {current / count:>12.0f}")
+        del records
+
+
+def _legacy_triggers(text, trigger_sets):
+    """How handle_message used to check each phrase list"""
+    return [name for name, phrases in trigger_sets if any(word in text.lower() for word in phrases)]
+
+
+def bench_message_triggers(messages=20000, set_counts=(2, 12, 48)):
+    """Messages per second through the old any() phrase loops versus the compiled matcher"""
+    rng = random.Random(3)
+    words = ['the', 'deploy', 'ticket', 'review', 'standup', 'build', 'frontend', 'merge', 'today', 'client']
+    texts = []
+    for _ in range(messages):
+        text = ' '.join(rng.choice(words) for _ in range(rng.randint(5, 30)))
+        if rng.random() < 0.1:
+            text += ' great work'
+        texts.append(text)
+    print(f"{'sets':>6} {'legacy msg/s':>14} {'compiled msg/s':>16}")
+    for count in set_counts:
+        triggers = DEFAULT_TRIGGERS[:2] + [
+            {'name': f'set{i}', 'phrases': [f'phrase{i}a', f'phrase {i} b', f'keyword{i}'], 'action': 'react'}
+            for i in range(count - 2)
+        ]
+        trigger_sets = [(t['name'], t['phrases']) for t in triggers]
+        matcher = TriggerMatcher(triggers)
+
+        start = time.perf_counter()
+        for text in texts:
+            _legacy_triggers(text, trigger_sets)
+        legacy = messages / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for text in texts:
+            matcher.match(text)
+        compiled = messages / (time.perf_counter() - start)
+        print(f"{count:>6} {legacy:>14.0f} {compiled:>16.0f}")
+
+
+def bench_bulk_create(existing=10000, count=50):
+    """Time to add count tasks with a save per task vs one batch() save"""
+    print(f"{'mode':>8} {'one by one ms':>14} {'batch ms':>10}")
+    original_mode = data_manager.STORAGE_MODE
+    with tempfile.TemporaryDirectory() as tmp:
+        data_manager.DATA_FILE = os.path.join(tmp, 'bot_data.json')
+        data_manager.JOURNAL_FILE = os.path.join(tmp, 'bot_data.journal')
+        data_manager.COMPACTING_FILE = os.path.join(tmp, 'bot_data.journal.compacting')
+        for mode in ('json', 'journal'):
+            data_manager.STORAGE_MODE = mode
+            timings = []
+            for batched in (False, True):
+                _fill_tasks(existing)
+                data_manager.save_data()
+                start = time.perf_counter()
+                with data_manager.batch() if batched else nullcontext():
+                    for _ in range(count):
+                        task_id = data_manager.next_task_id()
+                        data_manager.tasks[task_id] = Task(f'Sprint task {task_id}')
+                        data_manager.save_data('tasks', task_id)
+                timings.append((time.perf_counter() - start) * 1000)
+            data_manager.wait_for_compaction()
+            print(f"{mode:>8} {timings[0]:>14.1f} {timings[1]:>10.1f}")
+    data_manager.STORAGE_MODE = original_mode
+
+
+_STARTUP_SCRIPT = """
+import threading, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+threads = threading.active_count()
+client = main.app.test_client()
+client.post('/list-project-summaries', data={'user_id': 'bench_user'})
+first = time.perf_counter()
+client.post('/list-project-summaries', data={'user_id': 'bench_user'})
+second = time.perf_counter()
+print((imported - start) * 1000, (first - imported) * 1000, (second - first) * 1000, threads)
+"""
+
+
+def bench_app_startup(runs=5):
+    """Time to import main in a fresh interpreter, and to serve the first and second request"""
+    print(f"{'import ms':>10} {'first ms':>10} {'second ms':>10} {'threads after import':>22}")
+    root = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=root, SLACK_BOT_TOKEN='xoxb-bench', SIGNING_SECRET='bench')
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for _ in range(runs):
+            output = subprocess.run([sys.executable, '-c', _STARTUP_SCRIPT], cwd=tmp, env=env,
+                                    capture_output=True, text=True, check=True).stdout
+            results.append([float(value) for value in output.split()[-4:]])
+    imported, first, second, threads = (sorted(column)[len(column) // 2] for column in zip(*results))
+    print(f"{imported:>10.1f} {first:>10.1f} {second:>10.1f} {threads:>22.0f}")
+
+
+def bench_scheduler(jobs=100000, idle_seconds=3, due=200):
+    """Idle wakeups and CPU with jobs registered, against a loop polling every second
+    as the standup thread used to, and how late jobs run with that many waiting"""
+    far = datetime.now() + timedelta(days=1)
+    scheduler = Scheduler()
+    start = time.perf_counter()
+    for i in range(jobs):
+        scheduler.add_job(lambda: None, trigger='date', run_date=far + timedelta(seconds=i))
+    added = time.perf_counter() - start
+    print(f"{jobs} jobs added in {added * 1000:.0f} ms")
+
+    print(f"{'loop':>10} {'wakeups':>9} {'cpu ms':>8}")
+    scheduler.start()
+    cpu = time.process_time()
+    time.sleep(idle_seconds)
+    print(f"{'heap':>10} {scheduler.stats['wakeups']:>9} {(time.process_time() - cpu) * 1000:>8.1f}")
+
+    pending = list(scheduler.get_jobs())
+    stop = threading.Event()
+    polls = []
+
+    def poll():
+        while not stop.wait(1):
+            now = datetime.now()
+            [job for job in pending if job.next_run <= now]
+            polls.append(now)
+
+    poller = threading.Thread(target=poll)
+    cpu = time.process_time()
+    poller.start()
+    time.sleep(idle_seconds + 0.1)
+    stop.set()
+    poller.join()
+    print(f"{'polling':>10} {len(polls):>9} {(time.process_time() - cpu) * 1000:>8.1f}")
+
+    lateness = []
+    finished = threading.Event()
+
+    def record(run_date):
+        lateness.append((datetime.now() - run_date).total_seconds() * 1000)
+        if len(lateness) == due:
+            finished.set()
+
+    now = datetime.now()
+    for i in range(due):
+        run_date = now + timedelta(milliseconds=200 + random.randrange(800))
+        scheduler.add_job(lambda run_date=run_date: record(run_date), trigger='date', run_date=run_date)
+    finished.wait(10)
+    scheduler.shutdown()
+    lateness.sort()
+    print(f"dispatch lateness over {len(lateness)} jobs: median {lateness[len(lateness) // 2]:.2f} ms, "
+          f"p99 {lateness[int(len(lateness) * 0.99)]:.2f} ms, max {lateness[-1]:.2f} ms")
+
+
+def bench_job_store(jobs=50000, days=30):
+    """Start-up cost of a scheduler with stored jobs spread over the coming days, loading one
+    window of them against loading them all"""
+    print(f"{'window':>10} {'loaded':>8} {'start ms':>9}")
+    now = datetime.now()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'scheduled_jobs.db')
+        store = JobStore(path)
+        rows = []
+        for i in range(jobs):
+            run_date = now + timedelta(seconds=random.randrange(days * 86400))
+            rows.append((f'job-{i}', run_date.timestamp(), 'post_message',
+                         {'channel': 'C1', 'text': f'Reminder {i}'},
+                         {'trigger': 'date', 'run_date': run_date.isoformat()}))
+        store.put_many(rows)
+        store.close()
+        for label, window in (('1 hour', 3600), ('all', (days + 1) * 86400)):
+            start = time.perf_counter()
+            scheduler = Scheduler(store=JobStore(path), actions={'post_message': lambda **kwargs: None},
+                                  load_window=window)
+            scheduler.run_due()
+            elapsed = time.perf_counter() - start
+            print(f"{label:>10} {scheduler.stats['loaded']:>8} {elapsed * 1000:>9.1f}")
+            scheduler.store.close()
+
+
+class _CountingClient:
+    def __init__(self):
+        self.sent = 0
+
+    def chat_postMessage(self, **kwargs):
+        self.sent += 1
+
+
+def bench_reminders(count=100000, days=30):
+    """Adding, cancelling and firing count pending reminders, and their memory per reminder"""
+    original_mode = data_manager.STORAGE_MODE
+    now = datetime(2024, 5, 1, 8, 0)
+    client = _CountingClient()
+    with tempfile.TemporaryDirectory() as tmp:
+        data_manager.DATA_FILE = os.path.join(tmp, 'bot_data.json')
+        data_manager.JOURNAL_FILE = os.path.join(tmp, 'bot_data.journal')
+        data_manager.COMPACTING_FILE = os.path.join(tmp, 'bot_data.journal.compacting')
+        data_manager.STORAGE_MODE = 'journal'
+        data_manager.load_data()
+        engine = ReminderEngine(client=client, clock=lambda: now)
+
+        due = lambda: now + timedelta(seconds=random.randrange(days * 86400))
+        # Memory is sampled on an empty collection, tracing slows adding down too much to time it
+        sample = ReminderEngine(client=client, clock=lambda: now)
+        tracemalloc.start()
+        with data_manager.batch():
+            sample_ids = [sample.add('U1', 'C1', f'Reminder {i}', due()) for i in range(count // 10)]
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        with data_manager.batch():
+            for reminder_id in sample_ids:
+                sample.cancel(reminder_id)
+
+        start = time.perf_counter()
+        with data_manager.batch():
+            ids = [engine.add(f'U{i % 500}', 'C1', f'Reminder {i}', due()) for i in range(count)]
+        added = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with data_manager.batch():
+            for reminder_id in ids[::10]:
+                engine.cancel(reminder_id)
+        cancelled = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with data_manager.batch():
+            for _ in range(days * 24):
+                now += timedelta(hours=1)
+                engine.run_due()
+        fired = time.perf_counter() - start
+        data_manager.wait_for_compaction()
+        data_manager.close_storage()
+
+    print(f"add {count}: {added * 1000:.0f} ms, {current / len(sample_ids):.0f} bytes/reminder")
+    print(f"cancel {len(ids[::10])}: {cancelled * 1000:.0f} ms")
+    print(f"fire {client.sent}: {fired * 1000:.0f} ms")
+    data_manager.STORAGE_MODE = original_mode
+
+
+def bench_smart_rules(task_count=10000, rule_counts=(0, 100, 5000), changes=2000):
+    """Cost of a task change with standing smart-notify rules, against one scan of every
+    task as the one-shot check did"""
+    original_mode = data_manager.STORAGE_MODE
+    now = datetime(2024, 5, 1, 8, 0)
+    with tempfile.TemporaryDirectory() as tmp:
+        data_manager.DATA_FILE = os.path.join(tmp, 'bot_data.json')
+        data_manager.JOURNAL_FILE = os.path.join(tmp, 'bot_data.journal')
+        data_manager.COMPACTING_FILE = os.path.join(tmp, 'bot_data.journal.compacting')
+        data_manager.STORAGE_MODE = 'journal'
+        print(f"{'rules':>6} {'us/change':>10}")
+        for rule_count in rule_counts:
+            _fill_tasks(task_count)
+            for task in data_manager.tasks.values():
+                task['priority'] = 'High'
+            engine = RuleEngine(client=_CountingClient(), clock=lambda: now)
+            data_manager.add_change_listener(engine.on_change)
+            with data_manager.batch():
+                for i in range(rule_count):
+                    engine.add_rule('task_completion', f'Rule {i}', 'C1')
+            start = time.perf_counter()
+            with data_manager.batch():
+                for i in range(changes):
+                    task_id = 1 + i % task_count
+                    data_manager.tasks[task_id]['status'] = 'In Progress' if i % 2 else 'Open'
+                    data_manager.save_data('tasks', task_id)
+            elapsed = time.perf_counter() - start
+            data_manager._change_listeners.remove(engine.on_change)
+            print(f"{rule_count:>6} {elapsed / changes * 1e6:>10.1f}")
+        start = time.perf_counter()
+        [t for t in data_manager.tasks.values() if t['priority'].lower() == 'high' and t['status'].lower() != 'completed']
+        print(f"one full scan of {task_count} tasks: {(time.perf_counter() - start) * 1e6:.0f} us")
+        data_manager.wait_for_compaction()
+        data_manager.close_storage()
+    data_manager.STORAGE_MODE = original_mode
+
+
+def bench_standup_fanout(members=300, channels=5, latency=0.05):
+    """A standup sent to channels and as a DM to members, one after another as before and
+    through the fan-out, against a local fake Slack API answering after latency seconds"""
+    users = [f'U{i:05}' for i in range(members)]
+    project_channels = [f'C{i:03}' for i in range(channels)]
+    with FakeSlackAPI() as api:
+        api.latency = latency
+        client = WebClient(token='xoxb-bench', base_url=api.base_url)
+
+        start = time.perf_counter()
+        for channel in project_channels:
+            client.chat_postMessage(channel=channel, text=DAILY_PROMPT)
+        for user_id in users:
+            dm = client.conversations_open(users=user_id)['channel']['id']
+            client.chat_postMessage(channel=dm, text=DAILY_PROMPT)
+        print(f"serial: {time.perf_counter() - start:.2f} s for {members + channels} recipients")
+
+        dispatcher = MessageDispatcher(client)
+        fanout = StandupFanout(dispatcher)
+        for run in ('first', 'cached'):
+            start = time.perf_counter()
+            results = fanout.send(DAILY_PROMPT, project_channels, users).result()
+            elapsed = time.perf_counter() - start
+            delivered = sum(result == 'ok' for result in results.values())
+            print(f"fan-out ({run} DMs): {elapsed:.2f} s, {delivered}/{len(results)} delivered")
+
+
+def bench_task_pages(sizes=(10000, 100000, 400000), pages=200):
+    """Time to read one 21 task page from the middle of the task index, unfiltered and filtered"""
+    print(f"{'tasks':>8} {'all ms':>8} {'open ms':>8} {'high ms':>8}")
+    for size in sizes:
+        index = TaskIndex()
+        index.rebuild({task_id: _legacy_task(task_id) for task_id in range(1, size + 1)})
+        timings = []
+        for filters in ({}, {'status': 'open'}, {'priority': 'high'}):
+            start = time.perf_counter()
+            for _ in range(pages):
+                index.ids(after=size // 2, limit=21, **filters)
+            timings.append((time.perf_counter() - start) / pages * 1000)
+        print(f"{size:>8} " + ' '.join(f"{timing:>8.3f}" for timing in timings))
+
+
+BENCHMARKS = {
+    'write_latency': bench_write_latency,
+    'snapshot_formats': bench_snapshot_formats,
+    'task_memory': bench_task_memory,
+    'message_triggers': bench_message_triggers,
+    'app_startup': bench_app_startup,
+    'bulk_create': bench_bulk_create,
+    'scheduler': bench_scheduler,
+    'job_store': bench_job_store,
+    'reminders': bench_reminders,
+    'smart_rules': bench_smart_rules,
+    'standup_fanout': bench_standup_fanout,
+    'task_pages': bench_task_pages,
+}
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        print(f"== {name} ==")
+        BENCHMARKS[name]()
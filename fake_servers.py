@@ -0,0 +1,157 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+
+class FakeServer:
+    """Local HTTP stand-in for Slack endpoints such as a command's response_url.
+
+    Records every request it receives. Replies come from respond(path, body),
+    which returns (status, headers, json body) and defaults to 200 {"ok": true}.
+    """
+
+    def __init__(self, respond=None):
+        self.respond = respond or (lambda path, body: (200, {}, {'ok': True}))
+        self.requests = []
+        self._condition = threading.Condition()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                path, _, query = self.path.partition('?')
+                raw = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                body = dict(parse_qsl(query))
+                if self.headers.get('Content-Type', '').startswith('application/json'):
+                    body.update(json.loads(raw or b'{}'))
+                else:
+                    body.update(parse_qsl(raw.decode()))
+                status, headers, reply = server.respond(path, body)
+                with server._condition:
+                    server.requests.append({'path': path, 'headers': dict(self.headers), 'body': body})
+                    server._condition.notify_all()
+                data = json.dumps(reply).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, str(value))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def wait_for(self, count, timeout=5):
+        """Block until at least count requests arrived, returns whether they did"""
+        with self._condition:
+            return self._condition.wait_for(lambda: len(self.requests) >= count, timeout)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class FakeSlackAPI(FakeServer):
+    """A Slack Web API stand-in to point a WebClient at with base_url=api.base_url.
+
+    chat.postMessage succeeds and is recorded in messages, with its arrival time.
+    throttle(count, retry_after) makes the next count calls answer 429, and
+    fail_channel(channel, error) makes posts to a channel, or opening a DM with a
+    user id, fail with that error.
+    users.info and paginated users.list answer from the users dict, and conversations.open
+    opens a DM channel D<user id>, recorded in opened. Every call waits latency seconds first.
+    """
+
+    def __init__(self):
+        super().__init__(self._respond)
+        self.messages = []
+        self.attempts = 0
+        self._throttled = 0
+        self._retry_after = 1
+        self._failing = {}
+        self.users = {}
+        self.opened = []
+        self.latency = 0
+
+    @property
+    def base_url(self):
+        return self.url + '/api/'
+
+    def throttle(self, count, retry_after=1):
+        self._throttled = count
+        self._retry_after = retry_after
+
+    def fail_channel(self, channel, error='channel_not_found'):
+        self._failing[channel] = error
+
+    def add_user(self, user_id, real_name, email=None, display_name=''):
+        self.users[user_id] = {
+            'id': user_id, 'name': real_name.lower().replace(' ', '.'), 'real_name': real_name,
+            'profile': {'real_name': real_name, 'display_name': display_name, 'email': email}
+        }
+
+    def _users_list(self, body):
+        ids = sorted(self.users)
+        start = int(body.get('cursor') or 0)
+        end = start + int(body.get('limit') or 100)
+        next_cursor = str(end) if end < len(ids) else ''
+        return {'ok': True, 'members': [self.users[i] for i in ids[start:end]],
+                'response_metadata': {'next_cursor': next_cursor}}
+
+    def _conversations_open(self, body):
+        with self._condition:
+            if self._throttled:
+                self._throttled -= 1
+                return 429, {'Retry-After': self._retry_after}, {'ok': False, 'error': 'ratelimited'}
+            if body.get('users') in self._failing:
+                return 200, {}, {'ok': False, 'error': self._failing[body['users']]}
+            self.opened.append(body.get('users'))
+        return 200, {}, {'ok': True, 'channel': {'id': f"D{body.get('users')}"}}
+
+    def _respond(self, path, body):
+        if self.latency:
+            time.sleep(self.latency)
+        if path == '/api/conversations.open':
+            return self._conversations_open(body)
+        if path == '/api/users.info':
+            if body.get('user') not in self.users:
+                return 200, {}, {'ok': False, 'error': 'user_not_found'}
+            return 200, {}, {'ok': True, 'user': self.users[body['user']]}
+        if path == '/api/users.list':
+            return 200, {}, self._users_list(body)
+        if path != '/api/chat.postMessage':
+            return 200, {}, {'ok': True}
+        with self._condition:
+            self.attempts += 1
+            if self._throttled:
+                self._throttled -= 1
+                return 429, {'Retry-After': self._retry_after}, {'ok': False, 'error': 'ratelimited'}
+            if body.get('channel') in self._failing:
+                return 200, {}, {'ok': False, 'error': self._failing[body['channel']]}
+            self.messages.append(dict(body, received_at=time.monotonic()))
+        return 200, {}, {'ok': True, 'channel': body.get('channel'), 'ts': f'{time.time():.6f}'}
@@ -1,31 +1,23 @@
-import slack
+import atexit
 import os
-import json
-from dotenv import load_dotenv
+import logging
+import threading
+from contextlib import ExitStack
+from functools import wraps
 from pathlib import Path
+
 import certifi
-import schedule
-import time
-from datetime import date, datetime, timedelta
+from dotenv import load_dotenv
+from flask import Blueprint, Flask, current_app, request, Response, jsonify, g
 from slack_sdk import WebClient
-from slack_sdk.webhook import WebhookClient
 from slackeventsapi import SlackEventAdapter
-from flask import Flask, request, Response, jsonify
-import logging
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.date import DateTrigger
-from slack_sdk.errors import SlackApiError
-import requests
-import random
-from typing import Dict, List, Optional, Any
-import threading
 
-from utils.data_manager import load_data, save_data, tasks
-from modules.task_management import (
+from utils.data_manager import use_tenant, TENANCY
+from modules.task_managment import (
     create_task, update_task, set_task_status, list_tasks,
-    assign_task, unassign_task, set_task_priority, clear_tasks
+    assign_task, unassign_task, set_task_priority, clear_tasks, bulk_update
 )
-from modules.project_management import (
+from modules.project_managment import (
     create_project, update_project_progress, create_project_summary,
     list_project_summaries, get_project_analytics
 )
@@ -34,202 +26,384 @@ from modules.team_collaboration import (
 )
 from modules.scheduling import (
     schedule_meeting, set_recurring_reminder, notify_me,
-    set_reminder, send_reminder, smart_notify
+    set_reminder, cancel_reminder, smart_notify
 )
-from modules.file_management import add_file_link, list_files
+from modules.file_managment import add_file_link, list_files
 from modules.integrations import get_weather, get_motivational_quote
+from modules.interactions import handle_interaction
 from utils.standup import (
-    send_standup_prompt, send_weekly_standup_prompt, send_monthly_standup_prompt
+    send_standup, standup_fanout, DAILY_PROMPT, WEEKLY_PROMPT, MONTHLY_PROMPT
 )
 from utils.bot_intro import get_bot_intro
+from utils.deferred import deferred
+from utils.dispatcher import MessageDispatcher, log_failure
+from utils.scheduler import Scheduler, JOB_STORE_FILE
+from utils.job_store import JobStore
+from utils.user_directory import user_directory, USER_CACHE_REFRESH
+from utils.reminders import reminder_engine
+from utils.smart_rules import rule_engine
+from utils.event_dedup import event_deduplicator
+from utils.triggers import run_triggers
 
 os.environ['SSL_CERT_FILE'] = certifi.where()
 
 env_path = Path('.') / '.env'
 load_dotenv(dotenv_path=env_path)
 
-app = Flask(__name__)
-
-slack_event_adapter = SlackEventAdapter(os.environ['SIGNING_SECRET'], '/slack/events', app)
-client = slack.WebClient(token=os.environ['SLACK_BOT_TOKEN'])
-BOT_ID = client.api_call("auth.test")['user_id']
 SLACK_CHANNEL = os.environ.get('SLACK_CHANNEL', '')
 
 logging.basicConfig(level=logging.DEBUG)
 
-scheduler = BackgroundScheduler()
-scheduler.start()
-
-load_data()
-
-@app.route('/create-task', methods=['POST'])
+class Services:
+    """The Slack client and scheduler of one app.
+
+    Nothing is created, called or started until it is first used: the client on the
+    first Slack call, the bot's user id on the first message event, and the
+    scheduler and standup jobs (when background_jobs is set) by start(), which
+    main.start() calls at launch and the first request calls otherwise.
+    """
+
+    def __init__(self, client=None, scheduler=None, background_jobs=True):
+        self._client = client
+        self._scheduler = scheduler
+        if scheduler is not None:
+            scheduler.actions.setdefault('post_message', self.post_message)
+        self.background_jobs = background_jobs
+        self._bot_user_id = None
+        self._started = False
+        self._lock = threading.RLock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    # Every chat_postMessage goes through the dispatcher's rate limited queue
+                    client = MessageDispatcher(WebClient(token=os.environ.get('SLACK_BOT_TOKEN')))
+                    atexit.register(client.drain, 5)
+                    self._client = client
+        return self._client
+
+    @property
+    def scheduler(self):
+        if self._scheduler is None:
+            with self._lock:
+                if self._scheduler is None:
+                    store = JobStore(JOB_STORE_FILE) if JOB_STORE_FILE else None
+                    scheduler = Scheduler(store=store, actions={'post_message': self.post_message})
+                    scheduler.start()
+                    self._scheduler = scheduler
+        return self._scheduler
+
+    def post_message(self, channel, text):
+        """The action stored reminders and meeting notices run"""
+        return log_failure(self.client.chat_postMessage(channel=channel, text=text), channel, 'scheduled message')
+
+    def bot_user_id(self):
+        """The bot's own user id, from auth.test the first time it is asked for"""
+        if self._bot_user_id is None:
+            self._bot_user_id = self.client.auth_test()['user_id']
+        return self._bot_user_id
+
+    def start(self):
+        """Hand the client to the user directory, reminder and rule engines and standup fan-out and, with
+        background_jobs, warm the directory and start the reminders, smart notification timers,
+        standup and refresh jobs. Runs once, from main.start() or else on the first request"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        client = self.client
+        user_directory.client = client
+        reminder_engine.client = client
+        rule_engine.client = client
+        standup_fanout.client = client
+        if not self.background_jobs:
+            return
+
+        user_directory.warm_in_background()
+        # Every timed job of the bot shares one scheduler
+        reminder_engine.scheduler = self.scheduler
+        rule_engine.scheduler = self.scheduler
+        reminder_engine.start()
+        rule_engine.start()
+
+        self.scheduler.add_job(
+            func=lambda: send_standup(DAILY_PROMPT, SLACK_CHANNEL),
+            trigger='cron',
+            day_of_week='mon-fri',
+            hour=9,
+            minute=0,
+            id='daily_standup'
+        )
+
+        self.scheduler.add_job(
+            func=lambda: send_standup(WEEKLY_PROMPT, SLACK_CHANNEL),
+            trigger='cron',
+            day_of_week='mon',
+            hour=9,
+            minute=0,
+            id='weekly_standup'
+        )
+
+        self.scheduler.add_job(
+            func=user_directory.warm,
+            trigger='interval',
+            seconds=USER_CACHE_REFRESH,
+            id='user_directory_refresh'
+        )
+
+        self.scheduler.add_job(
+            func=lambda: send_standup(MONTHLY_PROMPT, SLACK_CHANNEL),
+            trigger='cron',
+            day=1,
+            hour=9,
+            minute=0,
+            id='monthly_standup'
+        )
+
+def services():
+    """The Services of the app handling the current request"""
+    return current_app.extensions['slack_bot']
+
+bot = Blueprint('bot', __name__)
+
+@bot.before_app_request
+def start_services():
+    services().start()
+
+@bot.before_app_request
+def select_tenant():
+    g.tenant = ExitStack()
+    # Cache the raw body first, routes check Slack's signature of it after the form is parsed
+    request.get_data(cache=True)
+    g.tenant.enter_context(use_tenant(request.form.get('team_id'), request.form.get('channel_id')))
+
+@bot.after_app_request
+def no_retry_for_duplicates(response):
+    """Tell Slack to stop redelivering an event that was already handled"""
+    if g.pop('duplicate_event', False):
+        response.headers['X-Slack-No-Retry'] = '1'
+    return response
+
+@bot.teardown_app_request
+def release_tenant(exc):
+    tenant = g.pop('tenant', None)
+    if tenant is not None:
+        tenant.close()
+
+@bot.route('/slack/event-stats', methods=['GET'])
+def event_stats_route():
+    return jsonify(event_deduplicator.counters())
+
+@bot.route('/create-task', methods=['POST'])
 def create_task_route():
     return create_task()
 
-@app.route('/update-task', methods=['POST'])
+@bot.route('/update-task', methods=['POST'])
 def update_task_route():
     return update_task()
 
-@app.route('/task-status', methods=['POST'])
+@bot.route('/bulk-update', methods=['POST'])
+def bulk_update_route():
+    return bulk_update()
+
+@bot.route('/task-status', methods=['POST'])
 def set_task_status_route():
     return set_task_status()
 
-@app.route('/list-tasks', methods=['POST'])
+@bot.route('/list-tasks', methods=['POST'])
+@deferred
 def list_tasks_route():
     return list_tasks()
 
-@app.route('/assign-task', methods=['POST'])
+@bot.route('/assign-task', methods=['POST'])
 def assign_task_route():
     return assign_task()
 
-@app.route('/unassign-task', methods=['POST'])
+@bot.route('/unassign-task', methods=['POST'])
 def unassign_task_route():
     return unassign_task()
 
-@app.route('/task-priority', methods=['POST'])
+@bot.route('/task-priority', methods=['POST'])
 def set_task_priority_route():
     return set_task_priority()
 
-@app.route('/clear-tasks', methods=['POST'])
+@bot.route('/clear-tasks', methods=['POST'])
 def clear_tasks_route():
     return clear_tasks()
 
-@app.route('/create-project', methods=['POST'])
+@bot.route('/create-project', methods=['POST'])
 def create_project_route():
     return create_project()
 
-@app.route('/project-progress', methods=['POST'])
+@bot.route('/project-progress', methods=['POST'])
 def update_project_progress_route():
     return update_project_progress()
 
-@app.route('/create-project-summary', methods=['POST'])
+@bot.route('/create-project-summary', methods=['POST'])
 def create_project_summary_route():
     return create_project_summary()
 
-@app.route('/list-project-summaries', methods=['POST'])
+@bot.route('/list-project-summaries', methods=['POST'])
 def list_project_summaries_route():
     return list_project_summaries()
 
-@app.route('/project-analytics', methods=['POST'])
+@bot.route('/project-analytics', methods=['POST'])
+@deferred
 def get_project_analytics_route():
     return get_project_analytics()
 
-@app.route('/add-team-member', methods=['POST'])
+@bot.route('/add-team-member', methods=['POST'])
 def add_team_member_route():
     return add_team_member()
 
-@app.route('/team-stats', methods=['POST'])
+@bot.route('/team-stats', methods=['POST'])
+@deferred
 def get_team_stats_route():
     return get_team_stats()
 
-@app.route('/get-contact-info', methods=['POST'])
+@bot.route('/get-contact-info', methods=['POST'])
+@deferred
 def get_contact_info_route():
     return get_contact_info()
 
-@app.route('/schedule-meeting', methods=['POST'])
+@bot.route('/schedule-meeting', methods=['POST'])
 def schedule_meeting_route():
-    return schedule_meeting(client, scheduler)
+    return schedule_meeting(services().scheduler)
 
-@app.route('/recurring-reminder', methods=['POST'])
+@bot.route('/recurring-reminder', methods=['POST'])
 def set_recurring_reminder_route():
-    return set_recurring_reminder(client, scheduler)
+    return set_recurring_reminder(services().scheduler)
 
-@app.route('/notify-me', methods=['POST'])
+@bot.route('/notify-me', methods=['POST'])
 def notify_me_route():
-    return notify_me(client, scheduler)
+    return notify_me(services().scheduler)
 
-@app.route('/set-reminder', methods=['POST'])
+@bot.route('/set-reminder', methods=['POST'])
 def set_reminder_route():
-    return set_reminder(client)
+    return set_reminder(services().client)
+
+@bot.route('/cancel-reminder', methods=['POST'])
+def cancel_reminder_route():
+    return cancel_reminder()
 
-@app.route('/smart-notify', methods=['POST'])
+@bot.route('/smart-notify', methods=['POST'])
 def smart_notify_route():
-    return smart_notify(client)
+    return smart_notify()
 
-@app.route('/add-file-link', methods=['POST'])
+@bot.route('/add-file-link', methods=['POST'])
 def add_file_link_route():
     return add_file_link()
 
-@app.route('/list-files', methods=['POST'])
+@bot.route('/list-files', methods=['POST'])
 def list_files_route():
     return list_files()
 
-@app.route('/weather', methods=['POST'])
+@bot.route('/weather', methods=['POST'])
+@deferred
 def get_weather_route():
     return get_weather()
 
-@app.route('/motivational-quote', methods=['POST'])
+@bot.route('/motivational-quote', methods=['POST'])
 def get_motivational_quote_route():
     return get_motivational_quote()
 
-@app.route('/bot-intro', methods=['POST'])
+@bot.route('/slack/interactions', methods=['POST'])
+def interactions_route():
+    return handle_interaction()
+
+@bot.route('/bot-intro', methods=['POST'])
 def bot_intro():
     data = request.form
     channel_id = data.get('channel_id')
     intro_message = get_bot_intro()
-    client.chat_postMessage(channel=channel_id, text=intro_message)
+    log_failure(services().client.chat_postMessage(channel=channel_id, text=intro_message), channel_id, 'bot intro')
     return Response(), 200
 
-@slack_event_adapter.on('message')
+def deduplicated(handler):
+    """Run a Slack event handler once per event_id. The adapter only calls it for
+    requests with a valid signature. A redelivery that arrives while the handler runs
+    is dropped, and the id is forgotten again if the handler raises, so Slack's retry
+    of a failed event runs it again"""
+    @wraps(handler)
+    def handle(event_data):
+        event_id = event_data.get('event_id')
+        if event_deduplicator.is_duplicate(event_id, request.headers.get('X-Slack-Retry-Num')):
+            g.duplicate_event = True
+            return None
+        try:
+            return handler(event_data)
+        except Exception:
+            event_deduplicator.forget(event_id)
+            raise
+    return handle
+
+def log_event_error(error):
+    logging.warning(f"Rejected Slack event request: {error}")
+
 def handle_message(event_data):
     event = event_data['event']
-    
+
     if 'subtype' in event:
         return
-    
+
     user = event.get('user')
     text = event.get('text')
     channel = event.get('channel')
-    
-    if channel == SLACK_CHANNEL:  
-        logging.info(f"Received message from user {user}: {text}")
-        
-        if any(word in text.lower() for word in ['good job', 'great work', 'excellent', 'awesome']):
-            try:
-                client.reactions_add(channel=channel, timestamp=event['ts'], name='thumbsup')
-            except:
-                pass
-        
-        if any(word in text.lower() for word in ['overdue', 'late', 'missed deadline']):
-            overdue_tasks = [t for t in tasks.values() if t.get('due_date') and datetime.fromisoformat(t['due_date']).date() < date.today() and t['status'].lower() != 'completed']
-            if overdue_tasks:
-                overdue_message = "⚠️ **Overdue Tasks Detected:**\n"
-                for task in overdue_tasks[:5]:
-                    overdue_message += f"• {task['description']} (Due: {task['due_date'][:10]})\n"
-                client.chat_postMessage(channel=channel, text=overdue_message)
-
-    return Response(), 200
 
+    if channel != SLACK_CHANNEL and TENANCY == 'none':
+        return Response(), 200
 
-schedule.every().monday.at("09:00").do(lambda: send_standup_prompt(client, SLACK_CHANNEL))
-schedule.every().tuesday.at("09:00").do(lambda: send_standup_prompt(client, SLACK_CHANNEL))
-schedule.every().wednesday.at("09:00").do(lambda: send_standup_prompt(client, SLACK_CHANNEL))
-schedule.every().thursday.at("09:00").do(lambda: send_standup_prompt(client, SLACK_CHANNEL))
-schedule.every().friday.at("09:00").do(lambda: send_standup_prompt(client, SLACK_CHANNEL))
+    # The bot's own replies can contain trigger words, answering them would loop
+    if user == services().bot_user_id():
+        return Response(), 200
 
-scheduler.add_job(
-    func=lambda: send_weekly_standup_prompt(client, SLACK_CHANNEL),
-    trigger='cron',
-    day_of_week='mon',
-    hour=9,
-    minute=0
-)
+    with use_tenant(event_data.get('team_id'), channel):
+        logging.info(f"Received message from user {user}: {text}")
+        run_triggers(services().client, event)
 
-scheduler.add_job(
-    func=lambda: send_monthly_standup_prompt(client, SLACK_CHANNEL),
-    trigger='cron',
-    day=1,
-    hour=9,
-    minute=0
-)
+    return Response(), 200
 
-def run_scheduler():
-    while True:
-        schedule.run_pending()
-        time.sleep(1)
+def handle_user_change(event_data):
+    user_directory.update(event_data['event']['user'])
+    return Response(), 200
 
-scheduler_thread = threading.Thread(target=run_scheduler, daemon=True)
-scheduler_thread.start()
+def create_app(client=None, scheduler=None, background_jobs=True, signing_secret=None):
+    """Build the bot's Flask app.
+
+    client and scheduler replace the Slack WebClient and utils.scheduler.Scheduler that are
+    otherwise created on first use. With background_jobs off, the standup jobs and the
+    user directory refresh are never started, as in tests. Data files are read by the
+    first request that needs them.
+    """
+    app = Flask(__name__)
+    app.extensions['slack_bot'] = Services(client, scheduler, background_jobs)
+    app.register_blueprint(bot)
+
+    if signing_secret is None:
+        signing_secret = os.environ.get('SIGNING_SECRET', '')
+    # Also checked on /slack/interactions and before a deferred command is queued
+    app.config['SLACK_SIGNING_SECRET'] = signing_secret
+    slack_event_adapter = SlackEventAdapter(signing_secret, '/slack/events', app)
+    slack_event_adapter.on('error', log_event_error)
+    slack_event_adapter.on('message', deduplicated(handle_message))
+    slack_event_adapter.on('user_change', deduplicated(handle_user_change))
+    slack_event_adapter.on('team_join', deduplicated(handle_user_change))
+    return app
+
+def start(target=None):
+    """Start the scheduler, reminders, smart notification timers and standup jobs of an
+    app (main.app by default) without waiting for its first request, returns the app.
+    WSGI servers can load the bot with gunicorn 'main:start()'"""
+    target = target or app
+    target.extensions['slack_bot'].start()
+    return target
+
+app = create_app()
 
 if __name__ == "__main__":
-    app.run(debug=True, port=5003) 
\ No newline at end of file
+    # The reloader runs this script twice, only the child process that serves starts the jobs
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start()
+    app.run(debug=True, port=5003)
@@ -1,6 +1,12 @@
+import os
 from datetime import datetime
-from flask import request
+from flask import request, jsonify
 from utils.data_manager import file_links, save_data
+from utils.blocks import LIST_PAGE_SIZE, section, page_blocks, page_message
+
+# Most file numbers one /list-files page looks at, a category with few matches then
+# takes several pages to go through instead of one page reading every link
+FILE_SCAN_LIMIT = int(os.environ.get('FILE_SCAN_LIMIT', '1000'))
 
 def add_file_link():
     """Add a file link"""
@@ -18,43 +24,71 @@ def add_file_link():
     url = parts[1].strip()
     category = parts[2].strip() if len(parts) > 2 else 'General'
     
-    file_id = f"file_{len(file_links) + 1}"
-    file_links[file_id] = {
-        'name': name,
-        'url': url,
-        'category': category,
-        'added_at': datetime.now().isoformat(),
-        'added_by': data.get('user_id')
-    }
+    # Under the lock so two links added at once don't get the same id
+    with file_links.lock:
+        file_id = f"file_{len(file_links) + 1}"
+        file_links[file_id] = {
+            'name': name,
+            'url': url,
+            'category': category,
+            'added_at': datetime.now().isoformat(),
+            'added_by': data.get('user_id')
+        }
     
-    save_data()
+    save_data('file_links', file_id)
     return f"📎 File link added: {name}\n🔗 URL: {url}\n📁 Category: {category}"
 
 def list_files():
-    """List files with optional category filtering"""
+    """List files with optional category filtering, one page at a time"""
     data = request.form
     command_text = data.get('text', '').strip()
     
     if not file_links:
         return "📎 No file links available."
     
-    category_filter = command_text if command_text else None
-    
-    filtered_files = {}
-    for file_id, file_info in file_links.items():
-        if category_filter and file_info['category'].lower() != category_filter.lower():
-            continue
-        filtered_files[file_id] = file_info
-    
-    if not filtered_files:
+    message = file_page({'category': command_text or None, 'after': 0, 'shown': 0})
+    if message is None:
         return "📎 No files match the specified category."
+    return jsonify(**message)
+
+def _file_block(file_info):
+    return section('\n'.join((
+        f"📄 *{file_info['name']}*",
+        f"   🔗 {file_info['url']}",
+        f"   📁 Category: {file_info['category']}",
+        f"   📅 Added: {file_info['added_at'][:10]}"
+    )))
+
+def file_page(cursor):
+    """Block Kit message for the page of files after file number cursor['after'], None if nothing matches.
+    Links are saved as file_1, file_2, ... in the order they were added, so a page is read from
+    its cursor on instead of skipping every earlier page, and links added meanwhile don't shift it.
+    At most FILE_SCAN_LIMIT numbers are looked at, a page cut short there carries on from where it stopped"""
+    category_filter = cursor['category']
+    page = []
+    number = cursor['after']
+    last = len(file_links)
+    stop = min(last, number + FILE_SCAN_LIMIT)
+    while number < stop and len(page) <= LIST_PAGE_SIZE:
+        number += 1
+        file_info = file_links.get(f'file_{number}')
+        if file_info is None:
+            continue
+        if not category_filter or file_info['category'].lower() == category_filter.lower():
+            page.append((number, file_info))
+    shown = cursor['shown'] + min(len(page), LIST_PAGE_SIZE)
+    next_cursor = None
+    if len(page) > LIST_PAGE_SIZE:
+        next_cursor = {'category': category_filter, 'after': page[LIST_PAGE_SIZE - 1][0], 'shown': shown}
+    elif number < last:
+        next_cursor = {'category': category_filter, 'after': number, 'shown': shown}
+    if not page and next_cursor is None and cursor['after'] == 0:
+        return None
     
-    response_text = f"📎 Files ({len(filtered_files)} found):\n\n"
-    
-    for file_id, file_info in filtered_files.items():
-        response_text += f"📄 **{file_info['name']}**\n"
-        response_text += f"   🔗 {file_info['url']}\n"
-        response_text += f"   📁 Category: {file_info['category']}\n"
-        response_text += f"   📅 Added: {file_info['added_at'][:10]}\n\n"
-    
-    return response_text 
\ No newline at end of file
+    if page:
+        header = f"📎 Files: {cursor['shown'] + 1}-{shown}" + (f" of {len(file_links)}" if not category_filter else "")
+    else:
+        header = f"📎 Files: no matches in files {cursor['after'] + 1}-{number}"
+    blocks = page_blocks(header, (_file_block(file_info) for _, file_info in page[:LIST_PAGE_SIZE]),
+                         'list_files_next', next_cursor)
+    return page_message(header, blocks)
@@ -1,6 +1,15 @@
-import requests
+import os
 import random
 from flask import request
+from utils.http_client import IntegrationClient, IntegrationError
+
+WEATHER_API_URL = os.environ.get('WEATHER_API_URL', 'http://api.openweathermap.org/data/2.5/weather')
+WEATHER_API_KEY = os.environ.get('WEATHER_API_KEY', 'YOUR_API_KEY')
+# Weather changes slowly, and a city that wasn't found stays unknown for a while
+WEATHER_CACHE_TTL = float(os.environ.get('WEATHER_CACHE_TTL', '600'))
+WEATHER_NEGATIVE_TTL = float(os.environ.get('WEATHER_NEGATIVE_TTL', '60'))
+
+weather_client = IntegrationClient(ttl=WEATHER_CACHE_TTL, negative_ttl=WEATHER_NEGATIVE_TTL)
 
 def get_weather():
     """Get weather information for a city"""
@@ -11,21 +20,25 @@ def get_weather():
         return "Format: /weather <city>"
     
     try:
-        url = f"http://api.openweathermap.org/data/2.5/weather?q={command_text}&appid=YOUR_API_KEY&units=metric"
-        response = requests.get(url, timeout=5)
-        
-        if response.status_code == 200:
-            weather_data = response.json()
-            temp = weather_data['main']['temp']
-            description = weather_data['weather'][0]['description']
-            humidity = weather_data['main']['humidity']
-            
-            return f"🌤️ Weather in {command_text}:\n🌡️ Temperature: {temp}°C\n☁️ Conditions: {description}\n💧 Humidity: {humidity}%"
-        else:
+        weather_data = weather_client.get_json(
+            WEATHER_API_URL,
+            params={'q': command_text, 'appid': WEATHER_API_KEY, 'units': 'metric'},
+            key=command_text.lower()
+        )
+    except IntegrationError as e:
+        if e.status is not None and e.status < 500:
             return f"❌ Could not fetch weather for {command_text}"
-    except:
         return f"❌ Error fetching weather data for {command_text}"
 
+    try:
+        temp = weather_data['main']['temp']
+        description = weather_data['weather'][0]['description']
+        humidity = weather_data['main']['humidity']
+    except (KeyError, IndexError, TypeError):
+        return f"❌ Error fetching weather data for {command_text}"
+
+    return f"🌤️ Weather in {command_text}:\n🌡️ Temperature: {temp}°C\n☁️ Conditions: {description}\n💧 Humidity: {humidity}%"
+
 def get_motivational_quote():
     """Get a random motivational quote"""
     quotes = [
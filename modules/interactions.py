@@ -0,0 +1,36 @@
+import json
+import requests
+from flask import request, Response
+from utils.blocks import decode_cursor
+from utils.data_manager import use_tenant
+from utils.slack_requests import is_slack_request, is_response_url
+from modules.task_managment import task_page
+from modules.file_managment import file_page
+
+# Block Kit action_id -> function rendering the page its button value points at
+PAGE_ACTIONS = {
+    'list_tasks_next': task_page,
+    'list_files_next': file_page
+}
+
+def handle_interaction():
+    """Handle a Block Kit button press by replacing the message with the requested page.
+    The payload picks the tenant and where the page goes, so it must be signed by Slack"""
+    if not is_slack_request():
+        return Response(status=403)
+    payload = json.loads(request.form.get('payload', '{}'))
+    if not is_response_url(payload.get('response_url')):
+        return Response(status=400)
+    team_id = payload.get('team', {}).get('id')
+    channel_id = payload.get('channel', {}).get('id')
+    
+    for action in payload.get('actions', []):
+        render_page = PAGE_ACTIONS.get(action.get('action_id'))
+        if render_page is None:
+            continue
+        with use_tenant(team_id, channel_id):
+            message = render_page(decode_cursor(action['value']))
+        if message is not None:
+            requests.post(payload['response_url'], json=dict(message, replace_original=True), timeout=5)
+    
+    return Response(), 200
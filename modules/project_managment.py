@@ -20,22 +20,24 @@ def create_project():
     deadline = parts[2].strip() if len(parts) > 2 else None
     budget = parts[3].strip() if len(parts) > 3 else None
     
-    project_id = f"proj_{len(project_summaries) + 1}"
-    project_summaries[project_id] = {
-        'name': name,
-        'description': description,
-        'deadline': deadline,
-        'budget': budget,
-        'created_by': user_id,
-        'created_at': datetime.now().isoformat(),
-        'status': 'Active',
-        'progress': 0,
-        'tasks': [],
-        'team_members': [],
-        'milestones': []
-    }
-    
-    save_data()
+    # The id comes from the count, so two creates must not count at the same time
+    with project_summaries.lock:
+        project_id = f"proj_{len(project_summaries) + 1}"
+        project_summaries[project_id] = {
+            'name': name,
+            'description': description,
+            'deadline': deadline,
+            'budget': budget,
+            'created_by': user_id,
+            'created_at': datetime.now().isoformat(),
+            'status': 'Active',
+            'progress': 0,
+            'tasks': [],
+            'team_members': [],
+            'milestones': []
+        }
+    
+    save_data('project_summaries', project_id)
     return f"🚀 Project created: {name}\n📋 ID: {project_id}\n📝 Description: {description}"
 
 def update_project_progress():
@@ -55,7 +57,7 @@ def update_project_progress():
         
         if project_id in project_summaries:
             project_summaries[project_id]['progress'] = progress
-            save_data()
+            save_data('project_summaries', project_id)
             return f"📊 Project {project_id} progress updated to {progress}%"
         else:
             return "❌ Project not found"
@@ -79,7 +81,7 @@ def create_project_summary():
     project_name = project_name.strip()
     summary = summary.strip()
     project_summaries[project_name] = summary
-    save_data()
+    save_data('project_summaries', project_name)
     return f"Project summary for '{project_name}' created."
 
 def list_project_summaries():
@@ -99,30 +101,31 @@ def get_project_analytics():
     
     response_text = "📊 Project Analytics:\n\n"
     
-    total_projects = len(project_summaries)
-    active_projects = len([p for p in project_summaries.values() if isinstance(p, dict) and p.get('status') == 'Active'])
-    completed_projects = len([p for p in project_summaries.values() if isinstance(p, dict) and p.get('status') == 'Completed'])
+    from utils.data_manager import count_projects
+    total_projects = count_projects()
+    active_projects = count_projects(status='Active')
+    completed_projects = count_projects(status='Completed')
     
     response_text += f"📈 Project Overview:\n"
     response_text += f"   🚀 Total Projects: {total_projects}\n"
     response_text += f"   🔄 Active Projects: {active_projects}\n"
     response_text += f"   ✅ Completed Projects: {completed_projects}\n\n"
     
-    from utils.data_manager import tasks
-    total_tasks = len(tasks)
-    completed_tasks = len([t for t in tasks.values() if t['status'].lower() == 'completed'])
-    overdue_tasks = len([t for t in tasks.values() if t.get('due_date') and datetime.fromisoformat(t['due_date']).date() < date.today() and t['status'].lower() != 'completed'])
+    from utils.data_manager import count_tasks, count_tasks_by, get_task_hours
+    total_tasks = count_tasks()
+    completed_tasks = count_tasks(status='completed')
+    overdue_tasks = count_tasks(overdue=True)
+    completion_rate = (completed_tasks / total_tasks * 100) if total_tasks > 0 else 0
+    completed_hours, open_hours = get_task_hours()
     
     response_text += f"📋 Task Analytics:\n"
     response_text += f"   📊 Total Tasks: {total_tasks}\n"
     response_text += f"   ✅ Completed: {completed_tasks}\n"
     response_text += f"   ⚠️ Overdue: {overdue_tasks}\n"
-    response_text += f"   📈 Completion Rate: {(completed_tasks/total_tasks*100):.1f}%\n\n"
+    response_text += f"   📈 Completion Rate: {completion_rate:.1f}%\n"
+    response_text += f"   ⏱️ Hours: {completed_hours:.1f}h completed | {open_hours:.1f}h open\n\n"
     
-    priority_counts = {}
-    for task in tasks.values():
-        priority = task['priority']
-        priority_counts[priority] = priority_counts.get(priority, 0) + 1
+    priority_counts = count_tasks_by('priority')
     
     response_text += f"🎯 Priority Breakdown:\n"
     for priority, count in priority_counts.items():
@@ -1,9 +1,10 @@
 from datetime import datetime, timedelta
 from flask import request, Response
-from utils.data_manager import reminders, save_data
-from apscheduler.triggers.date import DateTrigger
+from utils.dispatcher import log_failure
+from utils.reminders import reminder_engine, ReminderLimitError
+from utils.smart_rules import rule_engine, CONDITIONS
 
-def schedule_meeting(client, scheduler):
+def schedule_meeting(scheduler):
     """Schedule a meeting"""
     data = request.form
     command_text = data.get('text', '').strip()
@@ -29,20 +30,21 @@ def schedule_meeting(client, scheduler):
         reminder_time = meeting_datetime - timedelta(minutes=15)
         if reminder_time > datetime.now():
             scheduler.add_job(
-                func=lambda: client.chat_postMessage(
-                    channel=channel_id,
-                    text=f"🔔 Meeting reminder: {title} starts in 15 minutes!"
-                ),
-                trigger=DateTrigger(run_date=reminder_time),
+                action='post_message',
+                args={'channel': channel_id, 'text': f"🔔 Meeting reminder: {title} starts in 15 minutes!"},
+                trigger='date',
+                run_date=reminder_time,
                 id=f"meeting_reminder_{title}_{meeting_datetime.isoformat()}"
             )
         
         scheduler.add_job(
-            func=lambda: client.chat_postMessage(
-                channel=channel_id,
-                text=f"🎯 Meeting starting: {title}\n⏱️ Duration: {duration} minutes\n👥 Participants: {', '.join(participants) if participants else 'All team members'}"
-            ),
-            trigger=DateTrigger(run_date=meeting_datetime),
+            action='post_message',
+            args={
+                'channel': channel_id,
+                'text': f"🎯 Meeting starting: {title}\n⏱️ Duration: {duration} minutes\n👥 Participants: {', '.join(participants) if participants else 'All team members'}"
+            },
+            trigger='date',
+            run_date=meeting_datetime,
             id=f"meeting_start_{title}_{meeting_datetime.isoformat()}"
         )
         
@@ -51,7 +53,7 @@ def schedule_meeting(client, scheduler):
     except ValueError as e:
         return f"❌ Invalid date/time format: {e}"
 
-def set_recurring_reminder(client, scheduler):
+def set_recurring_reminder(scheduler):
     """Set a recurring reminder"""
     data = request.form
     command_text = data.get('text', '').strip()
@@ -74,7 +76,8 @@ def set_recurring_reminder(client, scheduler):
         
         if frequency == 'daily':
             scheduler.add_job(
-                func=lambda: client.chat_postMessage(channel=channel_id, text=f"🔄 Daily reminder: {message}"),
+                action='post_message',
+                args={'channel': channel_id, 'text': f"🔄 Daily reminder: {message}"},
                 trigger='cron',
                 hour=hour,
                 minute=minute,
@@ -82,7 +85,8 @@ def set_recurring_reminder(client, scheduler):
             )
         elif frequency == 'weekly':
             scheduler.add_job(
-                func=lambda: client.chat_postMessage(channel=channel_id, text=f"🔄 Weekly reminder: {message}"),
+                action='post_message',
+                args={'channel': channel_id, 'text': f"🔄 Weekly reminder: {message}"},
                 trigger='cron',
                 day_of_week='mon',
                 hour=hour,
@@ -91,7 +95,8 @@ def set_recurring_reminder(client, scheduler):
             )
         elif frequency == 'monthly':
             scheduler.add_job(
-                func=lambda: client.chat_postMessage(channel=channel_id, text=f"🔄 Monthly reminder: {message}"),
+                action='post_message',
+                args={'channel': channel_id, 'text': f"🔄 Monthly reminder: {message}"},
                 trigger='cron',
                 day=1,
                 hour=hour,
@@ -106,7 +111,7 @@ def set_recurring_reminder(client, scheduler):
     except ValueError:
         return "❌ Invalid time format. Use HH:MM"
 
-def notify_me(client, scheduler):
+def notify_me(scheduler):
     """Set a one-time notification"""
     data = request.form
     user_id = data.get('user_id')
@@ -129,8 +134,10 @@ def notify_me(client, scheduler):
             notify_datetime += timedelta(days=1)
         
         scheduler.add_job(
-            func=lambda: client.chat_postMessage(channel=channel_id, text=f"🔔 Reminder: {message}"),
-            trigger=DateTrigger(run_date=notify_datetime),
+            action='post_message',
+            args={'channel': channel_id, 'text': f"🔔 Reminder: {message}"},
+            trigger='date',
+            run_date=notify_datetime,
             id=str(user_id) + '-' + str(notify_time)
         )
 
@@ -146,28 +153,46 @@ def set_reminder(client):
     channel_id = data.get('channel_id')
     text = data.get('text')
 
-    reminders[user_id] = {
-        'channel_id': channel_id,
-        'text': text,
-        'time': datetime.now() + timedelta(hours=24)
-    }
+    try:
+        reminder_id = reminder_engine.add(user_id, channel_id, text, datetime.now() + timedelta(hours=24),
+                                          team_id=data.get('team_id'))
+    except ReminderLimitError:
+        return "❌ Too many reminders are pending, try again later"
 
-    client.chat_postMessage(channel=channel_id, text=f"🔔 Reminder set for 24 hours: {text}")
+    sent = client.chat_postMessage(channel=channel_id, text=f"🔔 Reminder set for 24 hours: {text} (ID: {reminder_id})")
+    log_failure(sent, channel_id, f"confirmation of reminder {reminder_id}")
     return Response(), 200
 
-def send_reminder(client, user_id):
-    """Send a reminder to a user"""
-    reminder = reminders.get(user_id)
-    if reminder:
-        client.chat_postMessage(channel=reminder['channel_id'], text=f"🔔 Reminder: {reminder['text']}")
-        del reminders[user_id]
+def cancel_reminder():
+    """Cancel one of your pending reminders, or list them when no ID is given"""
+    data = request.form
+    user_id = data.get('user_id')
+    reminder_id = data.get('text', '').strip()
+
+    if not reminder_id:
+        pending = reminder_engine.pending(user_id)
+        if not pending:
+            return "You have no pending reminders"
+        lines = [f"• {reminder_id}: {reminder['text']} ({reminder['time'].strftime('%Y-%m-%d %H:%M')})"
+                 for reminder_id, reminder in pending]
+        return "🔔 Your reminders:\n" + "\n".join(lines)
 
-def smart_notify(client):
-    """Send smart notifications based on conditions"""
+    if reminder_engine.cancel(reminder_id, user_id):
+        return f"✅ Reminder {reminder_id} cancelled"
+    return f"❌ You have no reminder {reminder_id}"
+
+def smart_notify():
+    """Set a standing smart notification, or cancel one with: cancel <id>"""
     data = request.form
     command_text = data.get('text', '').strip()
     user_id = data.get('user_id')
     channel_id = data.get('channel_id')
+
+    if command_text.lower().startswith('cancel '):
+        rule_id = command_text[len('cancel '):].strip()
+        if rule_engine.remove_rule(rule_id, user_id):
+            return f"✅ Smart notification {rule_id} cancelled"
+        return f"❌ You have no smart notification {rule_id}"
     
     if '|' not in command_text:
         return "Format: /smart-notify <message> | <condition> | <time>"
@@ -177,28 +202,17 @@ def smart_notify(client):
         return "Format: /smart-notify <message> | <condition> | <time>"
     
     message = parts[0].strip()
-    condition = parts[1].strip()
+    condition = parts[1].strip().lower()
     time_str = parts[2].strip()
-    
-    from utils.data_manager import tasks, project_summaries
-    
-    if condition.lower() == 'task_completion':
-        high_priority_tasks = [t for t in tasks.values() if t['priority'].lower() == 'high' and t['status'].lower() != 'completed']
-        if not high_priority_tasks:
-            client.chat_postMessage(channel=channel_id, text=f"🎉 Smart notification: {message}")
-            return "✅ Smart notification sent!"
-    
-    elif condition.lower() == 'project_deadline':
-        today = datetime.now().date()
-        for project_id, project in project_summaries.items():
-            if isinstance(project, dict) and project.get('deadline'):
-                try:
-                    deadline = datetime.strptime(project['deadline'], '%Y-%m-%d').date()
-                    days_until_deadline = (deadline - today).days
-                    if days_until_deadline <= 7:
-                        client.chat_postMessage(channel=channel_id, text=f"⚠️ Project deadline alert: {message}")
-                        return "✅ Smart notification sent!"
-                except:
-                    pass
-    
-    return "❌ Condition not met for smart notification" 
\ No newline at end of file
+
+    if condition not in CONDITIONS:
+        return f"❌ Invalid condition. Use: {', '.join(CONDITIONS)}"
+
+    try:
+        rule_id = rule_engine.add_rule(condition, message, channel_id, user_id, at=time_str or None,
+                                       team_id=data.get('team_id'))
+    except ValueError:
+        return "❌ Invalid time format. Use HH:MM"
+
+    return (f"🔔 Smart notification set: {message}\n📋 Condition: {condition}\n"
+            f"⏰ Delivered at: {time_str or 'once it happens'}\n🆔 ID: {rule_id} (`/smart-notify cancel {rule_id}` to stop it)")
@@ -1,17 +1,17 @@
 from datetime import datetime, date
 from flask import request, jsonify
-from utils.data_manager import tasks, save_data, get_task_counter, increment_task_counter
+from utils.data_manager import tasks, save_data, next_task_id, find_tasks, count_tasks, batch
+from utils.blocks import LIST_PAGE_SIZE, section, page_blocks, page_message
+from utils.task import Task
+from utils.user_directory import user_directory
 
-def create_task():
-    """Create a new task"""
-    data = request.form
-    command_text = data.get('text', '').strip()
-    user_id = data.get('user_id')
+UPDATABLE_FIELDS = ('status', 'priority', 'category', 'description', 'due_date', 'estimated_hours')
+FILTER_PREFIXES = ('status:', 'priority:', 'category:', 'assigned:')
 
-    if not command_text:
-        return "Please provide a task description. Format: /create-task <description> [due_date] [priority] [category]"
-
-    parts = command_text.split('|')
+def _parse_task(text, user_id, strict=False):
+    """Build a Task from '<description> | [due_date] | [priority] | [category] | [estimated_hours]'.
+    A due date or estimate that doesn't parse is left out, or raises ValueError when strict"""
+    parts = text.split('|')
     description = parts[0].strip()
     
     due_date = None
@@ -19,11 +19,15 @@ def create_task():
     category = 'General'
     estimated_hours = None
     
+    if strict and not description:
+        raise ValueError("missing description")
+    
     if len(parts) > 1 and parts[1].strip():
         try:
             due_date = datetime.strptime(parts[1].strip(), '%Y-%m-%d').date()
         except ValueError:
-            pass
+            if strict:
+                raise ValueError(f"invalid due date '{parts[1].strip()}', use YYYY-MM-DD")
     
     if len(parts) > 2 and parts[2].strip():
         priority = parts[2].strip()
@@ -35,28 +39,80 @@ def create_task():
         try:
             estimated_hours = float(parts[4].strip())
         except ValueError:
-            pass
+            if strict:
+                raise ValueError(f"invalid estimated hours '{parts[4].strip()}'")
+
+    return Task(
+        description=description,
+        priority=priority,
+        category=category,
+        status='Open',
+        created_by=user_id,
+        created_at=datetime.now().isoformat(),
+        due_date=due_date.isoformat() if due_date else None,
+        estimated_hours=estimated_hours
+    )
+
+def create_task():
+    """Create a new task, or one task per line"""
+    data = request.form
+    command_text = data.get('text', '').strip()
+    user_id = data.get('user_id')
 
-    task_id = get_task_counter()
-    tasks[task_id] = {
-        'description': description,
-        'priority': priority,
-        'category': category,
-        'status': 'Open',
-        'created_by': user_id,
-        'created_at': datetime.now().isoformat(),
-        'due_date': due_date.isoformat() if due_date else None,
-        'estimated_hours': estimated_hours,
-        'assigned_to': None,
-        'completed_at': None,
-        'actual_hours': None,
-        'comments': [],
-        'attachments': []
-    }
-    increment_task_counter()
-    save_data()
+    if not command_text:
+        return "Please provide a task description. Format: /create-task <description> [due_date] [priority] [category]"
+
+    lines = [line.strip() for line in command_text.splitlines() if line.strip()]
+    if len(lines) > 1:
+        return _create_tasks(lines, user_id)
+
+    task = _parse_task(command_text, user_id)
+    task_id = next_task_id()
+    tasks[task_id] = task
+    save_data('tasks', task_id)
     
-    return f"✅ Task created: {description}\n📋 ID: {task_id} | Priority: {priority} | Category: {category}"
+    return f"✅ Task created: {task['description']}\n📋 ID: {task_id} | Priority: {task['priority']} | Category: {task['category']}"
+
+def _create_tasks(lines, user_id):
+    """Create a task from each line, saved with one write. Lines that don't parse are reported and skipped"""
+    created = []
+    errors = []
+    with batch():
+        for number, line in enumerate(lines, 1):
+            try:
+                task = _parse_task(line, user_id, strict=True)
+            except ValueError as e:
+                errors.append(f"❌ Line {number}: {e}")
+                continue
+            task_id = next_task_id()
+            tasks[task_id] = task
+            save_data('tasks', task_id)
+            created.append(f"📋 {task_id}: {task['description']} | Priority: {task['priority']} | Category: {task['category']}")
+    
+    return '\n'.join([f"✅ Created {len(created)} of {len(lines)} tasks"] + created + errors)
+
+def _field_value(field, value):
+    """The value to store for field, raises ValueError with the reply to give for a bad one"""
+    if field not in UPDATABLE_FIELDS:
+        raise ValueError(f"❌ Invalid field. Use: {', '.join(UPDATABLE_FIELDS)}")
+    if field == 'due_date':
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date().isoformat()
+        except ValueError:
+            raise ValueError("❌ Invalid date format. Use YYYY-MM-DD")
+    if field == 'estimated_hours':
+        try:
+            return float(value)
+        except ValueError:
+            raise ValueError("❌ Invalid hours format")
+    return value
+
+def _set_field(task, field, value):
+    # Under the lock so a concurrent save sees both fields change or neither
+    with tasks.lock:
+        task[field] = value
+        if field == 'status' and value.lower() == 'completed':
+            task['completed_at'] = datetime.now().isoformat()
 
 def update_task():
     """Update an existing task"""
@@ -72,43 +128,65 @@ def update_task():
     
     try:
         task_id = int(parts[0])
-        field = parts[1].lower()
-        value = parts[2]
-        
-        if task_id not in tasks:
-            return "❌ Task ID not found."
-        
-        task = tasks[task_id]
-        
-        if field == 'status':
-            task['status'] = value
-            if value.lower() == 'completed':
-                task['completed_at'] = datetime.now().isoformat()
-        elif field == 'priority':
-            task['priority'] = value
-        elif field == 'category':
-            task['category'] = value
-        elif field == 'description':
-            task['description'] = value
-        elif field == 'due_date':
-            try:
-                due_date = datetime.strptime(value, '%Y-%m-%d').date()
-                task['due_date'] = due_date.isoformat()
-            except ValueError:
-                return "❌ Invalid date format. Use YYYY-MM-DD"
-        elif field == 'estimated_hours':
-            try:
-                task['estimated_hours'] = float(value)
-            except ValueError:
-                return "❌ Invalid hours format"
-        else:
-            return "❌ Invalid field. Use: status, priority, category, description, due_date, estimated_hours"
-        
-        save_data()
-        return f"✅ Task {task_id} updated: {field} = {value}"
-        
     except ValueError:
         return "❌ Invalid task ID"
+    field = parts[1].lower()
+    value = parts[2]
+    
+    if task_id not in tasks:
+        return "❌ Task ID not found."
+    
+    try:
+        stored_value = _field_value(field, value)
+    except ValueError as e:
+        return str(e)
+    
+    _set_field(tasks[task_id], field, stored_value)
+    save_data('tasks', task_id)
+    return f"✅ Task {task_id} updated: {field} = {value}"
+
+def bulk_update():
+    """Set one field on every task matching list-tasks style filters, saved with one write"""
+    command_text = request.form.get('text', '').strip()
+    usage = "Format: /bulk-update <filters> <field> <value>, e.g. /bulk-update status:Open priority:High status in_progress"
+    
+    filter_words = []
+    rest = command_text
+    while rest.startswith(FILTER_PREFIXES):
+        word, _, rest = rest.partition(' ')
+        filter_words.append(word)
+        rest = rest.strip()
+    field, _, value = rest.partition(' ')
+    field = field.lower()
+    value = value.strip()
+    if not filter_words or not field or not value:
+        return usage
+    
+    try:
+        stored_value = _field_value(field, value)
+    except ValueError as e:
+        return str(e)
+    
+    matched = find_tasks(**_task_filters(' '.join(filter_words)))
+    if not matched:
+        return "📝 No tasks match the specified filters."
+    
+    updated = []
+    errors = []
+    with batch():
+        for task_id in matched:
+            task = tasks.get(task_id)
+            if task is None:
+                errors.append(f"❌ Task {task_id}: deleted while updating")
+                continue
+            _set_field(task, field, stored_value)
+            save_data('tasks', task_id)
+            updated.append(task_id)
+    
+    ids = ', '.join(str(task_id) for task_id in updated[:50])
+    if len(updated) > 50:
+        ids += f" and {len(updated) - 50} more"
+    return '\n'.join([f"✅ Updated {field} = {value} on {len(updated)} tasks: {ids}"] + errors)
 
 def set_task_status():
     """Set task status"""
@@ -123,10 +201,8 @@ def set_task_status():
     try:
         task_id = int(task_id_str)
         if task_id in tasks:
-            tasks[task_id]['status'] = status
-            if status.lower() == 'completed':
-                tasks[task_id]['completed_at'] = datetime.now().isoformat()
-            save_data()
+            _set_field(tasks[task_id], 'status', status)
+            save_data('tasks', task_id)
             return f"✅ Task {task_id} status updated to: {status}"
         else:
             return "❌ Task ID not found."
@@ -134,77 +210,79 @@ def set_task_status():
         return "❌ Invalid task ID"
 
 def list_tasks():
-    """List tasks with optional filtering"""
+    """List tasks with optional filtering, one page at a time"""
     data = request.form
     command_text = data.get('text', '').strip()
     
     if not tasks:
         return "📝 No tasks available."
     
-    status_filter = None
-    priority_filter = None
-    category_filter = None
-    assigned_filter = None
-    
-    if command_text:
-        filters = command_text.split()
-        for filter_item in filters:
-            if filter_item.startswith('status:'):
-                status_filter = filter_item.split(':')[1]
-            elif filter_item.startswith('priority:'):
-                priority_filter = filter_item.split(':')[1]
-            elif filter_item.startswith('category:'):
-                category_filter = filter_item.split(':')[1]
-            elif filter_item.startswith('assigned:'):
-                assigned_filter = filter_item.split(':')[1]
+    message = task_page({'text': command_text, 'after': None, 'shown': 0})
+    if message is None:
+        return "📝 No tasks match the specified filters."
+    return jsonify(**message)
+
+def _task_filters(command_text):
+    filters = {'status': None, 'priority': None, 'category': None, 'assigned_to': None}
+    for filter_item in command_text.split():
+        if filter_item.startswith('status:'):
+            filters['status'] = filter_item.split(':')[1]
+        elif filter_item.startswith('priority:'):
+            filters['priority'] = filter_item.split(':')[1]
+        elif filter_item.startswith('category:'):
+            filters['category'] = filter_item.split(':')[1]
+        elif filter_item.startswith('assigned:'):
+            filters['assigned_to'] = filter_item.split(':')[1]
+    return filters
+
+def _task_block(task_id, task):
+    status_emoji = {
+        'open': '🔴',
+        'in_progress': '🟡',
+        'review': '🟠',
+        'completed': '🟢',
+        'blocked': '🔴'
+    }.get(task['status'].lower(), '⚪')
     
-    filtered_tasks = {}
-    for task_id, task in tasks.items():
-        if status_filter and task['status'].lower() != status_filter.lower():
-            continue
-        if priority_filter and task['priority'].lower() != priority_filter.lower():
-            continue
-        if category_filter and task['category'].lower() != category_filter.lower():
-            continue
-        if assigned_filter and task.get('assigned_to') != assigned_filter:
-            continue
-        filtered_tasks[task_id] = task
+    priority_emoji = {
+        'low': '🟢',
+        'normal': '🟡',
+        'high': '🟠',
+        'urgent': '🔴'
+    }.get(task['priority'].lower(), '⚪')
     
-    if not filtered_tasks:
-        return "📝 No tasks match the specified filters."
+    assigned_to = user_directory.display_name(task.get('assigned_to', "Unassigned"))
+    due_date = task.get('due_date', 'No due date')
+    if due_date and due_date != 'No due date':
+        try:
+            due_date = datetime.fromisoformat(due_date).strftime('%Y-%m-%d')
+        except:
+            pass
     
-    response_text = f"📋 Tasks ({len(filtered_tasks)} found):\n\n"
+    return section('\n'.join((
+        f"{status_emoji} *{task_id}*: {task['description']}",
+        f"   {priority_emoji} Priority: {task['priority']} | 📁 Category: {task['category']}",
+        f"   👤 Assigned: {assigned_to} | 📅 Due: {due_date}",
+        f"   ⏱️ Est: {task.get('estimated_hours', 'N/A')}h | 🏷️ Status: {task['status']}"
+    )))
+
+def task_page(cursor):
+    """Block Kit message for the page of tasks after cursor['after'], None if nothing matches"""
+    filters = _task_filters(cursor['text'])
+    page = find_tasks(after=cursor['after'], limit=LIST_PAGE_SIZE + 1, **filters)
+    if not page and cursor['after'] is None:
+        return None
     
-    for task_id, task in filtered_tasks.items():
-        status_emoji = {
-            'open': '🔴',
-            'in_progress': '🟡',
-            'review': '🟠',
-            'completed': '🟢',
-            'blocked': '🔴'
-        }.get(task['status'].lower(), '⚪')
-        
-        priority_emoji = {
-            'low': '🟢',
-            'normal': '🟡',
-            'high': '🟠',
-            'urgent': '🔴'
-        }.get(task['priority'].lower(), '⚪')
-        
-        assigned_to = task.get('assigned_to', "Unassigned")
-        due_date = task.get('due_date', 'No due date')
-        if due_date and due_date != 'No due date':
-            try:
-                due_date = datetime.fromisoformat(due_date).strftime('%Y-%m-%d')
-            except:
-                pass
-        
-        response_text += f"{status_emoji} **{task_id}**: {task['description']}\n"
-        response_text += f"   {priority_emoji} Priority: {task['priority']} | 📁 Category: {task['category']}\n"
-        response_text += f"   👤 Assigned: {assigned_to} | 📅 Due: {due_date}\n"
-        response_text += f"   ⏱️ Est: {task.get('estimated_hours', 'N/A')}h | 🏷️ Status: {task['status']}\n\n"
+    page_ids = list(page)[:LIST_PAGE_SIZE]
+    shown = cursor['shown'] + len(page_ids)
+    next_cursor = None
+    if len(page) > LIST_PAGE_SIZE:
+        next_cursor = {'text': cursor['text'], 'after': page_ids[-1], 'shown': shown}
     
-    return response_text
+    header = f"📋 Tasks: {cursor['shown'] + 1}-{shown} of {count_tasks(**filters)}"
+    blocks = page_blocks(header, (_task_block(task_id, page[task_id]) for task_id in page_ids),
+                         'list_tasks_next', next_cursor)
+    return page_message(header, blocks)
 
 def assign_task():
     """Assign a task to a user"""
@@ -215,7 +293,7 @@ def assign_task():
 
     if task_id in tasks:
         tasks[task_id]['assigned_to'] = user_id
-        save_data()
+        save_data('tasks', task_id)
         response_message = f"✅ Task '{task_id}' has been assigned to user '{user_id}'."
     else:
         response_message = f"❌ Task ID '{task_id}' not found."
@@ -230,7 +308,7 @@ def unassign_task():
 
     if task_id in tasks:
         tasks[task_id]['assigned_to'] = None
-        save_data()
+        save_data('tasks', task_id)
         response_message = f"✅ Task '{task_id}' has been unassigned."
     else:
         response_message = f"❌ Task ID '{task_id}' not found."
@@ -249,7 +327,7 @@ def set_task_priority():
         
         if task_id in tasks:
             tasks[task_id]['priority'] = new_priority
-            save_data()
+            save_data('tasks', task_id)
             return f"✅ Priority for task ID {task_id} updated to {new_priority}."
         else:
             return "❌ Task ID not found."
@@ -260,5 +338,5 @@ def set_task_priority():
 def clear_tasks():
     """Clear all tasks"""
     tasks.clear()
-    save_data()
+    save_data('tasks')
     return "✅ All tasks have been cleared." 
\ No newline at end of file
@@ -1,6 +1,7 @@
 from datetime import datetime
 from flask import request
-from utils.data_manager import team_members, user_roles, tasks, save_data
+from utils.data_manager import team_members, user_roles, save_data, count_tasks
+from utils.user_directory import user_directory
 
 def add_team_member():
     """Add a team member"""
@@ -18,7 +19,8 @@ def add_team_member():
         'current_tasks': []
     }
     user_roles[user_id] = role
-    save_data()
+    save_data('team_members', user_id)
+    save_data('user_roles', user_id)
     return f"👥 Added {user_id} to team as {role}"
 
 def get_team_stats():
@@ -28,18 +30,18 @@ def get_team_stats():
     
     response_text = "📊 Team Statistics:\n\n"
     
-    total_tasks = len(tasks)
-    completed_tasks = len([t for t in tasks.values() if t['status'].lower() == 'completed'])
+    total_tasks = count_tasks()
+    completed_tasks = count_tasks(status='completed')
     completion_rate = (completed_tasks / total_tasks * 100) if total_tasks > 0 else 0
     
     response_text += f"📈 Overall Progress: {completion_rate:.1f}% ({completed_tasks}/{total_tasks} tasks)\n\n"
     
     for user_id, member in team_members.items():
-        user_tasks = [t for t in tasks.values() if t.get('assigned_to') == user_id]
-        completed_user_tasks = [t for t in user_tasks if t['status'].lower() == 'completed']
+        user_tasks = count_tasks(assigned_to=user_id)
+        completed_user_tasks = count_tasks(assigned_to=user_id, status='completed')
         
-        response_text += f"👤 **{user_id}** ({member['role']})\n"
-        response_text += f"   📋 Tasks: {len(completed_user_tasks)}/{len(user_tasks)} completed\n"
+        response_text += f"👤 **{user_directory.display_name(user_id)}** ({member['role']})\n"
+        response_text += f"   📋 Tasks: {completed_user_tasks}/{user_tasks} completed\n"
         response_text += f"   📅 Joined: {member['joined_at'][:10]}\n\n"
     
     return response_text
@@ -55,10 +57,10 @@ def get_contact_info():
     user_id = command_text
     
     try:
-        from main import client
-        response = client.users_info(user=user_id)
-        user = response['user']
-        email = user['profile'].get('email', 'Email not found')
+        user = user_directory.lookup(user_id)
+        if user is None:
+            return "❌ Error getting the user info."
+        email = user['email'] or 'Email not found'
         real_name = user['real_name']
         contact_info = f"👤 User: {real_name}\n📧 Email: {email}"
 
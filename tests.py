@@ -1,7 +1,108 @@
+import threading
 import unittest
-from main import app
+from concurrent.futures import Future
+from flask import Flask, jsonify, request
+import main
+from main import create_app
+from utils import data_manager, serialization, deferred
+from utils.dispatcher import MessageDispatcher, log_failure
+from utils.user_directory import UserDirectory
+from utils.event_dedup import EventDeduplicator
+from utils.http_client import IntegrationClient, IntegrationError, CircuitOpenError, CircuitBreaker
+from modules import integrations, file_managment
+from utils import slack_requests
+from utils import triggers
+from utils.blocks import decode_cursor, MAX_SECTION_TEXT
+from modules.task_managment import list_tasks, create_task, set_task_status, assign_task, bulk_update
+from modules.file_managment import add_file_link, list_files
+from modules.interactions import handle_interaction
+from fake_servers import FakeServer, FakeSlackAPI
+from slack_sdk import WebClient
+from slack_sdk.errors import SlackApiError
+from utils.task import Task
+from utils.scheduler import Scheduler
+from utils.job_store import JobStore
+from utils.reminders import ReminderEngine, ReminderLimitError
+from utils.smart_rules import RuleEngine
+from utils import standup
+from utils.standup import StandupFanout
+from datetime import datetime, timedelta
+import hashlib
+import hmac
 import json
 import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlencode
+
+# The app's Slack calls go to a local stand-in so no test reaches slack.com
+slack_api = FakeSlackAPI().start()
+app = create_app(
+    client=MessageDispatcher(WebClient(token='xoxb-test', base_url=slack_api.base_url)),
+    scheduler=Scheduler(), background_jobs=False
+)
+
+def tearDownModule():
+    app.extensions['slack_bot'].client.drain(5)
+    slack_api.stop()
+
+def signed(form, secret='secret', timestamp=None):
+    """Keyword arguments for a test client post of form signed the way Slack signs requests"""
+    body = urlencode(form)
+    timestamp = str(int(time.time()) if timestamp is None else timestamp)
+    signature = 'v0=' + hmac.new(secret.encode(), f'v0:{timestamp}:{body}'.encode(), hashlib.sha256).hexdigest()
+    return {'data': body, 'content_type': 'application/x-www-form-urlencoded',
+            'headers': {'X-Slack-Request-Timestamp': timestamp, 'X-Slack-Signature': signature}}
+
+class StorageTestCase(unittest.TestCase):
+    """Runs each test on empty data files in STORAGE_MODE, None for the mode already set.
+    The mode is restored and every data file the test wrote is deleted afterwards"""
+
+    STORAGE_MODE = 'journal'
+
+    def setUp(self):
+        self.mode = data_manager.STORAGE_MODE
+        self._start(self.STORAGE_MODE or self.mode)
+
+    def tearDown(self):
+        data_manager.STORAGE_MODE = self.mode
+        self._remove_files()
+        data_manager.load_data()
+
+    def _remove_files(self):
+        data_manager.close_storage()
+        for path in (data_manager.DATA_FILE, data_manager.JOURNAL_FILE, data_manager.COMPACTING_FILE,
+                     data_manager.SQLITE_FILE):
+            if os.path.exists(path):
+                os.remove(path)
+        shutil.rmtree(data_manager.SHARD_DIR, ignore_errors=True)
+
+    def _start(self, mode):
+        """Switch to mode with no data"""
+        data_manager.STORAGE_MODE = mode
+        self._remove_files()
+        data_manager.load_data()
+
+    def _team_tenancy(self):
+        """Give every team a store of its own under a temporary TENANT_DIR until the test ends"""
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        self.addCleanup(setattr, data_manager, 'TENANT_DIR', data_manager.TENANT_DIR)
+        self.addCleanup(setattr, data_manager, 'TENANCY', data_manager.TENANCY)
+        data_manager.TENANCY = 'team'
+        data_manager.TENANT_DIR = os.path.join(tmp, 'tenants')
+
+    def _add_task(self, description=None, **fields):
+        """Create and save a task the way /create-task does, returns its id"""
+        task_id = data_manager.get_task_counter()
+        data_manager.tasks[task_id] = Task(description or f'Task {task_id}', **fields)
+        data_manager.increment_task_counter()
+        data_manager.save_data('tasks', task_id)
+        return task_id
 
 class SlackBotTestCase(unittest.TestCase):
     def setUp(self):
@@ -276,5 +377,1981 @@ class SlackBotTestCase(unittest.TestCase):
         self.assertIn('1', data['tasks'])
         self.assertEqual(data['tasks']['1']['description'], 'Persistent task')
 
+class TaskRecordTestCase(unittest.TestCase):
+    LEGACY_TASK = {
+        'description': 'Design homepage',
+        'priority': 'High',
+        'category': 'Frontend',
+        'status': 'Open',
+        'created_by': 'test_user',
+        'created_at': '2024-01-01T09:00:00',
+        'due_date': '2024-01-15',
+        'estimated_hours': 8.0,
+        'assigned_to': None,
+        'completed_at': None,
+        'actual_hours': None,
+        'comments': [],
+        'attachments': []
+    }
+
+    def test_serializes_to_the_legacy_dict(self):
+        task = Task.from_dict(self.LEGACY_TASK)
+        self.assertEqual(task.to_dict(), self.LEGACY_TASK)
+        self.assertEqual(json.loads(serialization.dumps_json(task)), self.LEGACY_TASK)
+
+    def test_reads_and_writes_like_a_dict(self):
+        task = Task.from_dict(self.LEGACY_TASK)
+        task['status'] = 'Completed'
+        task['assigned_to'] = 'U1'
+        self.assertEqual(task['status'], 'Completed')
+        self.assertEqual(task.get('assigned_to', 'Unassigned'), 'U1')
+        self.assertEqual(task.get('missing', 'default'), 'default')
+        self.assertRaises(KeyError, lambda: task['missing'])
+
+    def test_lists_are_created_lazily(self):
+        task = Task('Lazy')
+        self.assertIsNone(task._comments)
+        task['comments'].append('First comment')
+        self.assertEqual(task.to_dict()['comments'], ['First comment'])
+        self.assertEqual(task.to_dict()['attachments'], [])
+
+    def test_status_priority_and_category_are_shared(self):
+        first = Task('First', priority=''.join(['Hi', 'gh']))
+        second = Task('Second', priority=''.join(['Hig', 'h']))
+        self.assertIs(first['priority'], second['priority'])
+
+    def test_unknown_keys_are_kept(self):
+        task = Task.from_dict(dict(self.LEGACY_TASK, sprint='Sprint 4'))
+        self.assertEqual(task['sprint'], 'Sprint 4')
+        self.assertEqual(task.to_dict()['sprint'], 'Sprint 4')
+
+class TaskIndexTestCase(StorageTestCase):
+    STATUSES = ['Open', 'open', 'in_progress', 'Completed', 'blocked']
+    PRIORITIES = ['Low', 'Normal', 'High', 'high', 'Urgent']
+    CATEGORIES = ['General', 'Frontend', 'backend']
+    ASSIGNEES = [None, 'U1', 'U2', 'U3']
+    DUE_DATES = [None, '2000-01-01', '2001-06-15', '2001-06-15', '2999-01-01']
+
+    def setUp(self):
+        super().setUp()
+        self.random = random.Random(7)
+
+    def _create(self):
+        self._add_task(
+            status=self.random.choice(self.STATUSES),
+            priority=self.random.choice(self.PRIORITIES),
+            category=self.random.choice(self.CATEGORIES),
+            assigned_to=self.random.choice(self.ASSIGNEES),
+            due_date=self.random.choice(self.DUE_DATES)
+        )
+
+    def _mutate(self):
+        task_id = self.random.choice(list(data_manager.tasks))
+        field, values = self.random.choice([
+            ('status', self.STATUSES), ('priority', self.PRIORITIES),
+            ('category', self.CATEGORIES), ('assigned_to', self.ASSIGNEES), ('due_date', self.DUE_DATES)
+        ])
+        data_manager.tasks[task_id][field] = self.random.choice(values)
+        data_manager.save_data('tasks', task_id)
+
+    def _delete(self):
+        task_id = self.random.choice(list(data_manager.tasks))
+        del data_manager.tasks[task_id]
+        data_manager.save_data('tasks', task_id)
+
+    def _assert_consistent(self):
+        data_manager.count_tasks()
+        self.assertEqual(data_manager.current_store()._task_index, data_manager.rebuild_task_index())
+        for status in self.STATUSES:
+            for assignee in self.ASSIGNEES[1:]:
+                expected = [
+                    task_id for task_id, task in data_manager.tasks.items()
+                    if task['status'].lower() == status.lower() and task['assigned_to'] == assignee
+                ]
+                self.assertEqual(list(data_manager.find_tasks(status=status, assigned_to=assignee)), expected)
+                self.assertEqual(data_manager.count_tasks(status=status, assigned_to=assignee), len(expected))
+        overdue = sorted(
+            (task['due_date'], task_id) for task_id, task in data_manager.tasks.items()
+            if task['due_date'] and task['due_date'] < '2100-01-01' and task['status'].lower() != 'completed'
+        )
+        self.assertEqual(list(data_manager.find_overdue_tasks()), [task_id for _, task_id in overdue])
+        self.assertEqual(list(data_manager.find_overdue_tasks(limit=3)), [task_id for _, task_id in overdue[:3]])
+        self.assertEqual(data_manager.count_tasks(overdue=True), len(overdue))
+        for filters in ({}, {'status': 'open'}, {'priority': 'high', 'category': 'Frontend'}):
+            self.assertEqual(self._pages(7, **filters), list(data_manager.find_tasks(**filters)))
+
+    def _pages(self, size, **filters):
+        """Every id found by following after cursors one page at a time"""
+        ids, after = [], None
+        while True:
+            page = list(data_manager.find_tasks(after=after, limit=size, **filters))
+            self.assertLessEqual(len(page), size)
+            ids.extend(page)
+            if len(page) < size:
+                return ids
+            after = page[-1]
+
+    def test_index_matches_rebuild_after_random_changes(self):
+        for step in range(500):
+            action = self.random.random()
+            if action < 0.4 or not data_manager.tasks:
+                self._create()
+            elif action < 0.9:
+                self._mutate()
+            else:
+                self._delete()
+            if step % 100 == 0:
+                self._assert_consistent()
+        self._assert_consistent()
+
+    def test_overdue_tasks_leave_the_index_when_completed(self):
+        for due_date in ('2001-06-15', '2000-01-01', '2999-01-01', None):
+            self._add_task(f'Due {due_date}', due_date=due_date)
+        self.assertEqual(list(data_manager.find_overdue_tasks()), [2, 1])
+
+        data_manager.tasks[2]['status'] = 'Completed'
+        data_manager.save_data('tasks', 2)
+        self.assertEqual(list(data_manager.find_overdue_tasks(limit=5)), [1])
+        self.assertEqual(data_manager.count_tasks(overdue=True), 1)
+
+    def test_clear_and_reload_rebuild_the_index(self):
+        for _ in range(20):
+            self._create()
+        self._assert_consistent()
+
+        data_manager.tasks.clear()
+        data_manager.save_data('tasks')
+        self.assertEqual(data_manager.count_tasks(), 0)
+        self._create()
+        self._assert_consistent()
+
+        data_manager.load_data()
+        self._assert_consistent()
+
+class TaskStatsTestCase(StorageTestCase):
+    STATUSES = ['Open', 'in_progress', 'Completed', 'completed']
+    PRIORITIES = ['Low', 'Normal', 'High']
+    ASSIGNEES = [None, 'U1', 'U2']
+    HOURS = [None, 1, 2.5, 8]
+
+    def setUp(self):
+        super().setUp()
+        self.random = random.Random(11)
+
+    def _change_task(self):
+        action = self.random.random()
+        if action < 0.4 or not data_manager.tasks:
+            task_id = data_manager.get_task_counter()
+            data_manager.tasks[task_id] = Task(
+                f'Task {task_id}',
+                status=self.random.choice(self.STATUSES),
+                priority=self.random.choice(self.PRIORITIES),
+                assigned_to=self.random.choice(self.ASSIGNEES),
+                estimated_hours=self.random.choice(self.HOURS)
+            )
+            data_manager.increment_task_counter()
+        elif action < 0.9:
+            task_id = self.random.choice(list(data_manager.tasks))
+            field, values = self.random.choice([
+                ('status', self.STATUSES), ('priority', self.PRIORITIES), ('assigned_to', self.ASSIGNEES),
+                ('estimated_hours', self.HOURS), ('actual_hours', self.HOURS)
+            ])
+            data_manager.tasks[task_id][field] = self.random.choice(values)
+        else:
+            task_id = self.random.choice(list(data_manager.tasks))
+            del data_manager.tasks[task_id]
+        data_manager.save_data('tasks', task_id)
+
+    def _change_project(self):
+        project_id = f'P{self.random.randrange(10)}'
+        if self.random.random() < 0.2:
+            data_manager.project_summaries.pop(project_id, None)
+        else:
+            data_manager.project_summaries[project_id] = {
+                'name': project_id, 'status': self.random.choice(['Active', 'Completed', 'On Hold'])
+            }
+        data_manager.save_data('project_summaries', project_id)
+
+    def _assert_counts(self):
+        self.assertEqual(data_manager.verify_aggregates(), [])
+        tasks = list(data_manager.tasks.values())
+        self.assertEqual(data_manager.count_tasks(), len(tasks))
+        self.assertEqual(data_manager.count_tasks(status='completed'),
+                         len([t for t in tasks if t['status'].lower() == 'completed']))
+        self.assertEqual(data_manager.count_tasks(assigned_to='U1', status='Open'),
+                         len([t for t in tasks if t['assigned_to'] == 'U1' and t['status'] == 'Open']))
+        for priority in self.PRIORITIES:
+            self.assertEqual(data_manager.count_tasks_by('priority').get(priority, 0),
+                             len([t for t in tasks if t['priority'] == priority]))
+        open_hours = sum(t['estimated_hours'] or 0 for t in tasks if t['status'].lower() != 'completed')
+        self.assertAlmostEqual(data_manager.get_task_hours()[1], open_hours)
+        self.assertEqual(data_manager.count_projects(status='Active'),
+                         len([p for p in data_manager.project_summaries.values() if p['status'] == 'Active']))
+
+    def test_counters_match_recount_after_random_changes(self):
+        for step in range(400):
+            if self.random.random() < 0.8:
+                self._change_task()
+            else:
+                self._change_project()
+            if step % 100 == 0:
+                self._assert_counts()
+        self._assert_counts()
+
+        data_manager.load_data()
+        self._assert_counts()
+
+    def test_completed_hours_prefer_actual_hours(self):
+        data_manager.tasks[1] = Task('Estimated only', status='Completed', estimated_hours=3)
+        data_manager.tasks[2] = Task('Logged', status='Completed', estimated_hours=3, actual_hours=5)
+        data_manager.tasks[3] = Task('Still open', estimated_hours=2)
+        for task_id in (1, 2, 3):
+            data_manager.save_data('tasks', task_id)
+        self.assertEqual(data_manager.get_task_hours(), (8.0, 2.0))
+
+    def test_verify_reports_drift(self):
+        for _ in range(10):
+            self._change_task()
+        data_manager.count_tasks()
+        # Simulate a change that bypassed save_data
+        data_manager.current_store()._task_stats.total += 1
+        self.assertEqual(data_manager.verify_aggregates(), ['tasks.total'])
+        data_manager.load_data()
+        self.assertEqual(data_manager.verify_aggregates(), [])
+
+class JournalStorageTestCase(StorageTestCase):
+    def setUp(self):
+        self.threshold = data_manager.JOURNAL_COMPACT_THRESHOLD
+        super().setUp()
+
+    def tearDown(self):
+        data_manager.JOURNAL_COMPACT_THRESHOLD = self.threshold
+        data_manager.wait_for_compaction()
+        super().tearDown()
+
+    def test_save_appends_single_record(self):
+        self._add_task('First')
+        self._add_task('Second')
+        self.assertFalse(os.path.exists(data_manager.DATA_FILE))
+        with open(data_manager.JOURNAL_FILE) as f:
+            self.assertEqual(len(f.readlines()), 2)
+
+    def test_replay_after_restart(self):
+        first = self._add_task('First')
+        second = self._add_task('Second')
+        data_manager.tasks[first]['status'] = 'Completed'
+        data_manager.save_data('tasks', first)
+        del data_manager.tasks[second]
+        data_manager.save_data('tasks', second)
+
+        data_manager.tasks.clear()
+        data_manager.load_data()
+        self.assertEqual(list(data_manager.tasks), [first])
+        self.assertEqual(data_manager.tasks[first]['status'], 'Completed')
+        self.assertEqual(data_manager.get_task_counter(), 3)
+
+    def test_compaction_folds_journal_into_snapshot(self):
+        data_manager.JOURNAL_COMPACT_THRESHOLD = 3
+        for i in range(4):
+            self._add_task(f'Task {i}')
+        data_manager.wait_for_compaction()
+
+        with open(data_manager.DATA_FILE) as f:
+            self.assertEqual(len(json.load(f)['tasks']), 3)
+        self.assertFalse(os.path.exists(data_manager.COMPACTING_FILE))
+
+        data_manager.load_data()
+        self.assertEqual(len(data_manager.tasks), 4)
+
+    def test_compaction_keeps_the_records_of_a_failed_one(self):
+        data_manager.JOURNAL_COMPACT_THRESHOLD = 2
+        # The snapshot can't be written while a directory is in its place
+        os.mkdir(data_manager.DATA_FILE)
+        self._add_task('First')
+        self._add_task('Second')
+        data_manager.wait_for_compaction()
+        self.assertTrue(os.path.exists(data_manager.COMPACTING_FILE))
+
+        os.rmdir(data_manager.DATA_FILE)
+        self._add_task('Third')
+        self._add_task('Fourth')
+        data_manager.wait_for_compaction()
+
+        self.assertFalse(os.path.exists(data_manager.COMPACTING_FILE))
+        with open(data_manager.DATA_FILE) as f:
+            self.assertEqual(len(json.load(f)['tasks']), 4)
+        data_manager.load_data()
+        self.assertEqual(sorted(data_manager.tasks), [1, 2, 3, 4])
+
+    def test_torn_final_record_is_ignored(self):
+        self._add_task('Kept')
+        with open(data_manager.JOURNAL_FILE, 'a') as f:
+            f.write('{"c": "tasks", "k": 2, "v": {"descr')
+
+        data_manager.load_data()
+        self.assertEqual(list(data_manager.tasks), [1])
+
+        self._add_task('Appended after crash')
+        data_manager.load_data()
+        self.assertEqual(sorted(data_manager.tasks), [1, 2])
+
+class SqliteStorageTestCase(StorageTestCase):
+    STORAGE_MODE = 'sqlite'
+
+    def _add_sample_tasks(self):
+        self._add_task('Homepage', priority='High', category='Frontend', assigned_to='U1', due_date='2000-01-01')
+        self._add_task('API', status='Completed', priority='high', category='Backend', assigned_to='U1', due_date='2000-01-01')
+        self._add_task('Docs', priority='Low', assigned_to='U2')
+
+    def test_indexed_queries_match_json_scan(self):
+        self._add_sample_tasks()
+        queries = [
+            {}, {'status': 'open'}, {'priority': 'HIGH'}, {'category': 'frontend'},
+            {'assigned_to': 'U1'}, {'assigned_to': 'U1', 'status': 'completed'}, {'overdue': True}
+        ]
+        sqlite_results = [(data_manager.find_tasks(**q), data_manager.count_tasks(**q)) for q in queries]
+        sqlite_priorities = data_manager.count_tasks_by('priority')
+
+        data_manager.STORAGE_MODE = 'json'
+        self.assertEqual(sqlite_results, [(data_manager.find_tasks(**q), data_manager.count_tasks(**q)) for q in queries])
+        self.assertEqual(sqlite_priorities, data_manager.count_tasks_by('priority'))
+        self.assertEqual(sqlite_priorities, {'High': 1, 'high': 1, 'Low': 1})
+
+    def test_task_filters_use_indexes(self):
+        conn = data_manager.current_store()._sqlite()
+        for column in ('status', 'priority', 'category', 'assigned_to', 'due_date'):
+            plan = ' '.join(str(row) for row in conn.execute(f"EXPLAIN QUERY PLAN SELECT id FROM tasks WHERE {column} = ?", ('x',)))
+            self.assertIn(f'idx_tasks_{column}', plan)
+
+    def test_changes_survive_reload(self):
+        task_id = self._add_task('Persisted')
+        data_manager.tasks[task_id]['status'] = 'Completed'
+        data_manager.save_data('tasks', task_id)
+        data_manager.file_links['file_1'] = {'name': 'Spec', 'url': 'https://example.com', 'category': 'Docs'}
+        data_manager.save_data('file_links', 'file_1')
+
+        data_manager.load_data()
+        self.assertEqual(data_manager.tasks[task_id]['status'], 'Completed')
+        self.assertEqual(data_manager.file_links['file_1']['name'], 'Spec')
+        self.assertEqual(data_manager.get_task_counter(), task_id + 1)
+
+    def test_migrate_between_json_and_sqlite(self):
+        self._add_sample_tasks()
+        expected = dict(data_manager.tasks)
+
+        data_manager.migrate('sqlite', 'json')
+        data_manager.close_storage()
+        os.remove(data_manager.SQLITE_FILE)
+        data_manager.migrate('json', 'sqlite')
+
+        data_manager.load_data()
+        self.assertEqual(data_manager.tasks, expected)
+        self.assertEqual(data_manager.get_task_counter(), 4)
+
+class ShardedStorageTestCase(StorageTestCase):
+    STORAGE_MODE = 'sharded'
+
+    def _shard_mtime(self, name):
+        return os.stat(os.path.join(data_manager.SHARD_DIR, f'{name}.json')).st_mtime_ns
+
+    def test_collections_load_on_first_access(self):
+        data_manager.tasks[1] = Task('Sharded')
+        data_manager.file_links['file_1'] = {'name': 'Spec'}
+        data_manager.save_data()
+
+        data_manager.load_data()
+        self.assertFalse(data_manager.tasks.loaded)
+        self.assertFalse(data_manager.file_links.loaded)
+
+        self.assertEqual(data_manager.file_links['file_1'], {'name': 'Spec'})
+        self.assertTrue(data_manager.file_links.loaded)
+        self.assertFalse(data_manager.tasks.loaded)
+        self.assertEqual(data_manager.tasks, {1: Task('Sharded')})
+
+    def test_only_dirty_collection_is_written(self):
+        data_manager.tasks[1] = Task('Untouched')
+        data_manager.save_data('tasks', 1)
+        tasks_written = self._shard_mtime('tasks')
+        time.sleep(0.01)
+
+        data_manager.file_links['file_1'] = {'name': 'Spec'}
+        data_manager.save_data('file_links', 'file_1')
+        self.assertEqual(self._shard_mtime('tasks'), tasks_written)
+        self.assertTrue(os.path.exists(os.path.join(data_manager.SHARD_DIR, 'file_links.json')))
+        self.assertFalse(os.path.exists(os.path.join(data_manager.SHARD_DIR, 'reminders.json')))
+
+    def test_task_counter_survives_reload(self):
+        task_id = self._add_task('Counted')
+
+        data_manager.load_data()
+        self.assertEqual(data_manager.get_task_counter(), task_id + 1)
+        self.assertIn(task_id, data_manager.tasks)
+
+    def test_migrate_between_json_and_sharded(self):
+        data_manager.tasks[1] = Task('Moved')
+        data_manager.team_members['U1'] = {'role': 'Developer'}
+        data_manager.save_data()
+
+        data_manager.migrate('sharded', 'json')
+        shutil.rmtree(data_manager.SHARD_DIR)
+        data_manager.migrate('json', 'sharded')
+
+        data_manager.load_data()
+        self.assertEqual(data_manager.tasks, {1: Task('Moved')})
+        self.assertEqual(data_manager.team_members, {'U1': {'role': 'Developer'}})
+
+class TenantStoreTestCase(StorageTestCase):
+    STORAGE_MODE = 'json'
+
+    def setUp(self):
+        self.settings = (data_manager.TENANCY, data_manager.TENANT_DIR)
+        self.tmp = tempfile.mkdtemp()
+        data_manager.TENANCY = 'team'
+        data_manager.TENANT_DIR = os.path.join(self.tmp, 'tenants')
+        super().setUp()
+
+    def tearDown(self):
+        data_manager.close_storage()
+        data_manager.TENANCY, data_manager.TENANT_DIR = self.settings
+        shutil.rmtree(self.tmp)
+        super().tearDown()
+
+    def test_tenants_have_separate_tasks_and_counters(self):
+        with data_manager.use_tenant('T1', 'C1'):
+            self.assertEqual(self._add_task('Team one task'), 1)
+            self.assertEqual(self._add_task('Team one task'), 2)
+        with data_manager.use_tenant('T2', 'C1'):
+            self.assertEqual(len(data_manager.tasks), 0)
+            self.assertEqual(self._add_task('Team two task'), 1)
+            self.assertEqual(data_manager.count_tasks(), 1)
+        with data_manager.use_tenant('T1', 'C9'):
+            self.assertEqual(data_manager.count_tasks(), 2)
+        self.assertTrue(os.path.exists(os.path.join(data_manager.TENANT_DIR, 'T1', 'bot_data.json')))
+        self.assertTrue(os.path.exists(os.path.join(data_manager.TENANT_DIR, 'T2', 'bot_data.json')))
+
+    def test_idle_tenants_are_evicted_and_reloaded(self):
+        with data_manager.use_tenant('T1'):
+            self._add_task('Survives eviction')
+        with data_manager.use_tenant('T2'):
+            pass
+        self.assertEqual(data_manager.loaded_tenants(), ['T1', 'T2'])
+
+        with data_manager.use_tenant('T2'):
+            self.assertEqual(data_manager.evict_idle_tenants(0), 1)
+            self.assertEqual(data_manager.loaded_tenants(), ['T2'])
+
+        with data_manager.use_tenant('T1'):
+            self.assertEqual(data_manager.tasks[1]['description'], 'Survives eviction')
+            self.assertEqual(data_manager.get_task_counter(), 2)
+
+    def test_channel_tenancy_and_default_store(self):
+        data_manager.TENANCY = 'channel'
+        self.assertEqual(data_manager.tenant_key('T1', 'C1'), 'C1')
+        self.assertIsNone(data_manager.tenant_key('T1', None))
+        with data_manager.use_tenant('T1', None) as store:
+            self.assertIs(store, data_manager.current_store())
+            self.assertIsNone(store.root)
+        data_manager.TENANCY = 'team_channel'
+        self.assertEqual(data_manager.tenant_key('T1', 'C1'), 'T1-C1')
+        self.assertEqual(data_manager.tenant_key('T1', '../x'), 'T1-___x')
+
+class SnapshotFormatTestCase(StorageTestCase):
+    STORAGE_MODE = None
+
+    def setUp(self):
+        self.format = data_manager.SNAPSHOT_FORMAT
+        super().setUp()
+
+    def tearDown(self):
+        data_manager.SNAPSHOT_FORMAT = self.format
+        super().tearDown()
+
+    def _round_trip(self, fmt):
+        data_manager.SNAPSHOT_FORMAT = fmt
+        data_manager.load_data()
+        due = datetime(2024, 1, 15, 9, 30, 12, 345)
+        data_manager.tasks[1] = Task('Typed', due_date='2024-01-15')
+        data_manager.reminders['U1'] = {'channel_id': 'C1', 'text': 'Standup', 'time': due}
+        data_manager.current_store().task_counter = 2
+        data_manager.save_data()
+
+        data_manager.SNAPSHOT_FORMAT = 'json'
+        data_manager.load_data()
+        self.assertEqual(data_manager.tasks[1]['description'], 'Typed')
+        self.assertEqual(data_manager.reminders['U1']['time'], due)
+        self.assertIsInstance(data_manager.reminders['U1']['time'], datetime)
+        self.assertEqual(data_manager.get_task_counter(), 2)
+
+    def test_json_round_trips_datetimes(self):
+        self._round_trip('json')
+
+    @unittest.skipIf(serialization.orjson is None, "orjson not installed")
+    def test_orjson_round_trips_datetimes(self):
+        self._round_trip('orjson')
+
+    @unittest.skipIf(serialization.msgpack is None, "msgpack not installed")
+    def test_msgpack_round_trips_datetimes(self):
+        self._round_trip('msgpack')
+        with open(data_manager.DATA_FILE, 'rb') as f:
+            self.assertNotEqual(f.read(1), b'{')
+
+    def test_legacy_string_reminder_times_are_upgraded(self):
+        with open(data_manager.DATA_FILE, 'w') as f:
+            json.dump({'reminders': {'U1': {'text': 'Old', 'time': '2024-01-15 09:30:00.000345'}}}, f)
+
+        data_manager.load_data()
+        self.assertEqual(data_manager.reminders['U1']['time'], datetime(2024, 1, 15, 9, 30, 0, 345))
+
+CRASH_WRITER = """
+import sys
+sys.path.insert(0, {root!r})
+from utils import data_manager
+data_manager.WRITE_BEHIND = True
+data_manager.FLUSH_INTERVAL = 3600
+for task_id in range(1, 20001):
+    data_manager.tasks[task_id] = {{'description': 'Crash test task ' * 4, 'status': 'Open'}}
+rounds = 0
+while True:
+    rounds += 1
+    data_manager.tasks[1]['status'] = f'Round {{rounds}}'
+    data_manager.save_data('tasks', 1)
+    data_manager.flush()
+    print(rounds, flush=True)
+"""
+
+class WriteBehindTestCase(StorageTestCase):
+    STORAGE_MODE = None
+
+    def setUp(self):
+        self.settings = (data_manager.WRITE_BEHIND, data_manager.FLUSH_INTERVAL, data_manager.FLUSH_MAX_PENDING)
+        data_manager.WRITE_BEHIND = True
+        data_manager.FLUSH_INTERVAL = 3600
+        data_manager.FLUSH_MAX_PENDING = 1000
+        super().setUp()
+
+    def tearDown(self):
+        data_manager.flush()
+        data_manager.WRITE_BEHIND, data_manager.FLUSH_INTERVAL, data_manager.FLUSH_MAX_PENDING = self.settings
+        super().tearDown()
+
+    def test_saves_are_coalesced_until_flush(self):
+        for i in range(50):
+            self._add_task(f'Task {i}')
+        self.assertFalse(os.path.exists(data_manager.DATA_FILE))
+
+        self.assertTrue(data_manager.flush())
+        self.assertFalse(data_manager.flush())
+        with open(data_manager.DATA_FILE) as f:
+            self.assertEqual(len(json.load(f)['tasks']), 50)
+
+    def test_flusher_writes_after_max_pending_changes(self):
+        data_manager.FLUSH_MAX_PENDING = 5
+        for i in range(5):
+            self._add_task(f'Task {i}')
+
+        deadline = time.monotonic() + 5
+        while not os.path.exists(data_manager.DATA_FILE) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        with open(data_manager.DATA_FILE) as f:
+            self.assertEqual(len(json.load(f)['tasks']), 5)
+
+    def test_flusher_writes_after_interval(self):
+        data_manager.FLUSH_INTERVAL = 0.05
+        self._add_task('Only change')
+
+        deadline = time.monotonic() + 5
+        while not os.path.exists(data_manager.DATA_FILE) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(os.path.exists(data_manager.DATA_FILE))
+
+    def test_killed_mid_write_never_truncates(self):
+        root = os.path.dirname(os.path.abspath(__file__))
+        with tempfile.TemporaryDirectory() as tmp:
+            data_file = os.path.join(tmp, data_manager.DATA_FILE)
+            for _ in range(5):
+                process = subprocess.Popen(
+                    [sys.executable, '-c', CRASH_WRITER.format(root=root)],
+                    cwd=tmp, stdout=subprocess.PIPE, text=True
+                )
+                process.stdout.readline()
+                time.sleep(random.uniform(0, 0.2))
+                process.kill()
+                process.wait()
+                process.stdout.close()
+
+                with open(data_file) as f:
+                    data = json.load(f)
+                self.assertEqual(len(data['tasks']), 20000)
+
+class DeferredCommandTestCase(unittest.TestCase):
+    def setUp(self):
+        self.depth = deferred.DEFERRED_QUEUE_DEPTH
+        self.server = FakeServer().start()
+        self.release = threading.Event()
+        self.app = Flask(__name__)
+
+        @self.app.route('/slow', methods=['POST'])
+        @deferred.deferred
+        def slow():
+            self.release.wait(5)
+            return f"Done: {request.form.get('text')}"
+
+        @self.app.route('/json', methods=['POST'])
+        @deferred.deferred
+        def as_json():
+            return jsonify(response_type='in_channel', text='Shared result')
+
+        self.app.config['SLACK_SIGNING_SECRET'] = 'secret'
+        self.client = self.app.test_client()
+        self.prefixes = slack_requests.RESPONSE_URL_PREFIXES
+        slack_requests.RESPONSE_URL_PREFIXES = (self.server.url + '/',)
+
+    def tearDown(self):
+        self.release.set()
+        deferred.wait_for_deferred()
+        deferred.DEFERRED_QUEUE_DEPTH = self.depth
+        slack_requests.RESPONSE_URL_PREFIXES = self.prefixes
+        self.server.stop()
+
+    def test_acks_at_once_and_posts_to_response_url(self):
+        response = self.client.post('/slow', **signed({'text': 'report', 'response_url': self.server.url + '/hook'}))
+        self.assertEqual(response.get_data(as_text=True), deferred.ACK_TEXT)
+        self.assertEqual(self.server.requests, [])
+
+        self.release.set()
+        self.assertTrue(self.server.wait_for(1))
+        self.assertEqual(self.server.requests[0]['path'], '/hook')
+        self.assertEqual(self.server.requests[0]['body'], {'response_type': 'ephemeral', 'text': 'Done: report'})
+
+    def test_json_replies_are_posted_as_is(self):
+        self.client.post('/json', **signed({'response_url': self.server.url + '/'}))
+        self.assertTrue(self.server.wait_for(1))
+        self.assertEqual(self.server.requests[0]['body'], {'response_type': 'in_channel', 'text': 'Shared result'})
+
+    def test_runs_inline_without_response_url(self):
+        self.release.set()
+        response = self.client.post('/slow', data={'text': 'inline'})
+        self.assertEqual(response.get_data(as_text=True), 'Done: inline')
+        self.assertEqual(deferred.in_flight(), 0)
+
+    def test_only_signed_commands_are_queued_and_only_for_slack(self):
+        self.release.set()
+        form = {'text': 'report', 'team_id': 'T1', 'response_url': self.server.url + '/hook'}
+        self.assertEqual(self.client.post('/slow', **signed(form, secret='forged')).status_code, 403)
+        self.assertEqual(self.client.post('/slow', data=form).status_code, 403)
+        elsewhere = dict(form, response_url='http://169.254.169.254/latest/meta-data')
+        self.assertEqual(self.client.post('/slow', **signed(elsewhere)).status_code, 400)
+        self.assertEqual(deferred.in_flight(), 0)
+        deferred.wait_for_deferred()
+        self.assertEqual(self.server.requests, [])
+
+    def test_commands_beyond_queue_depth_are_turned_away(self):
+        deferred.DEFERRED_QUEUE_DEPTH = 2
+        replies = [
+            self.client.post('/slow', **signed({'text': str(i), 'response_url': self.server.url + '/'})).get_data(as_text=True)
+            for i in range(3)
+        ]
+        self.assertEqual(replies, [deferred.ACK_TEXT, deferred.ACK_TEXT, deferred.BUSY_TEXT])
+
+        self.release.set()
+        self.assertTrue(self.server.wait_for(2))
+        deferred.wait_for_deferred()
+        self.assertEqual(deferred.in_flight(), 0)
+        self.assertEqual(sorted(r['body']['text'] for r in self.server.requests), ['Done: 0', 'Done: 1'])
+
+class MessageDispatcherTestCase(unittest.TestCase):
+    def setUp(self):
+        self.api = FakeSlackAPI().start()
+        self.dispatcher = MessageDispatcher(
+            WebClient(token='xoxb-test', base_url=self.api.base_url), rate=20, burst=2, max_retries=2
+        )
+
+    def tearDown(self):
+        self.dispatcher.drain(5)
+        self.api.stop()
+
+    def _texts(self, channel):
+        return [m['text'] for m in self.api.messages if m['channel'] == channel]
+
+    def test_channels_keep_fifo_order_within_their_rate(self):
+        for i in range(6):
+            self.dispatcher.chat_postMessage(channel='C1', text=f'one {i}')
+            self.dispatcher.chat_postMessage(channel='C2', text=f'two {i}')
+        self.assertTrue(self.dispatcher.drain(5))
+
+        self.assertEqual(self._texts('C1'), [f'one {i}' for i in range(6)])
+        self.assertEqual(self._texts('C2'), [f'two {i}' for i in range(6)])
+        times = [m['received_at'] for m in self.api.messages if m['channel'] == 'C1']
+        # Two go out as a burst, the other four wait for a token at 20 per second
+        self.assertGreaterEqual(times[-1] - times[0], 3 / 20 * 0.9)
+
+    def test_waits_for_retry_after_then_resends(self):
+        self.api.throttle(1, retry_after=1)
+        start = time.monotonic()
+        first = self.dispatcher.chat_postMessage(channel='C1', text='first')
+        self.dispatcher.chat_postMessage(channel='C1', text='second')
+        self.assertTrue(first.result(5)['ok'])
+        self.assertTrue(self.dispatcher.drain(5))
+
+        self.assertGreaterEqual(time.monotonic() - start, 0.9)
+        self.assertEqual(self._texts('C1'), ['first', 'second'])
+        self.assertEqual(self.api.attempts, 3)
+
+    def test_gives_up_after_max_retries(self):
+        self.api.throttle(3, retry_after=0)
+        dropped = self.dispatcher.chat_postMessage(channel='C1', text='dropped')
+        kept = self.dispatcher.chat_postMessage(channel='C1', text='kept')
+        with self.assertRaises(SlackApiError):
+            dropped.result(5)
+        self.assertTrue(kept.result(5)['ok'])
+        self.assertEqual(self._texts('C1'), ['kept'])
+
+    def test_dropped_messages_are_logged_once_with_their_context(self):
+        self.api.fail_channel('C404')
+        with self.assertLogs('utils.dispatcher', 'ERROR') as logs:
+            sent = self.dispatcher.chat_postMessage(channel='C404', text='Hello')
+            self.assertIsInstance(sent.exception(5), SlackApiError)
+            self.assertIs(log_failure(sent, 'C404', 'bot intro'), sent)
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('Could not post bot intro to C404: ', logs.output[0])
+        # A plain WebClient's response has nothing left to report
+        self.assertIsNone(log_failure(None, 'C1', 'bot intro'))
+
+    def test_idle_channels_are_forgotten(self):
+        self.dispatcher._prune_at = 5
+        for channel in ('C1', 'C2', 'C3', 'C4', 'C5'):
+            self.dispatcher.chat_postMessage(channel=channel, text='hi')
+        self.assertTrue(self.dispatcher.drain(5))
+        self.assertEqual(len(self.dispatcher._buckets), 5)
+        # Long enough for their buckets to refill
+        time.sleep(0.2)
+        self.dispatcher.chat_postMessage(channel='C6', text='hi')
+        self.assertTrue(self.dispatcher.drain(5))
+        self.assertEqual(list(self.dispatcher._buckets), ['C6'])
+        self.assertEqual(self.dispatcher._not_before, {})
+
+    def test_permanent_errors_are_not_retried(self):
+        self.api.fail_channel('C404')
+        failed = self.dispatcher.chat_postMessage(channel='C404', text='lost')
+        self.dispatcher.chat_postMessage(channel='C1', text='delivered')
+        with self.assertRaises(SlackApiError):
+            failed.result(5)
+        self.assertTrue(self.dispatcher.drain(5))
+        self.assertEqual(self.api.attempts, 2)
+        self.assertEqual(self._texts('C1'), ['delivered'])
+
+    def test_channels_are_sent_to_concurrently(self):
+        self.api.latency = 0.2
+        start = time.monotonic()
+        for channel in ('C1', 'C2', 'C3', 'C4'):
+            self.dispatcher.chat_postMessage(channel=channel, text='hello')
+        self.assertTrue(self.dispatcher.drain(5))
+        self.assertEqual(len(self.api.messages), 4)
+        self.assertLess(time.monotonic() - start, 0.6)
+
+    def test_other_calls_wait_out_rate_limits(self):
+        self.api.throttle(1, retry_after=0)
+        response = self.dispatcher.call('conversations_open', users='U1')
+        self.assertEqual(response['channel']['id'], 'DU1')
+        self.assertEqual(self.api.opened, ['U1'])
+
+class StandupFanoutTestCase(unittest.TestCase):
+    def setUp(self):
+        self.api = FakeSlackAPI().start()
+        self.client = MessageDispatcher(
+            WebClient(token='xoxb-test', base_url=self.api.base_url), rate=20, burst=2, max_retries=2
+        )
+        self.fanout = StandupFanout(self.client, workers=4)
+
+    def tearDown(self):
+        self.client.drain(5)
+        self.api.stop()
+
+    def _channels(self):
+        return sorted(m['channel'] for m in self.api.messages)
+
+    def test_sends_to_channels_and_dms_and_caches_dm_channels(self):
+        results = self.fanout.send('Standup', ['C1', 'C2'], ['U1', 'U2', 'U3']).result(5)
+        self.assertEqual(results, {'C1': 'ok', 'C2': 'ok', 'U1': 'ok', 'U2': 'ok', 'U3': 'ok'})
+        self.assertEqual(self._channels(), ['C1', 'C2', 'DU1', 'DU2', 'DU3'])
+        self.assertEqual(sorted(self.api.opened), ['U1', 'U2', 'U3'])
+
+        self.fanout.send('Standup', ['C1'], ['U1', 'U2', 'U3', 'U4']).result(5)
+        self.assertEqual(sorted(self.api.opened), ['U1', 'U2', 'U3', 'U4'])
+        self.assertEqual(len(self.api.messages), 10)
+
+    def test_reports_each_failed_recipient(self):
+        self.api.fail_channel('C404')
+        self.api.fail_channel('U404', 'user_not_found')
+        results = self.fanout.send('Standup', ['C1', 'C404'], ['U1', 'U404']).result(5)
+        self.assertEqual(results, {'C1': 'ok', 'C404': 'channel_not_found', 'U1': 'ok', 'U404': 'user_not_found'})
+        self.assertEqual(self._channels(), ['C1', 'DU1'])
+
+    def test_rate_limited_calls_are_retried(self):
+        self.api.throttle(2, retry_after=0)
+        results = self.fanout.send('Standup', ['C1'], ['U1', 'U2']).result(5)
+        self.assertEqual(set(results.values()), {'ok'})
+        self.assertEqual(self._channels(), ['C1', 'DU1', 'DU2'])
+
+    def test_send_returns_before_the_messages_are_sent(self):
+        self.api.latency = 0.3
+        start = time.monotonic()
+        sent = self.fanout.send('Standup', ['C1'], ['U1'])
+        self.assertLess(time.monotonic() - start, 0.2)
+        self.assertFalse(sent.done())
+        self.assertEqual(sent.result(5), {'C1': 'ok', 'U1': 'ok'})
+
+    def test_send_standup_dms_team_members_of_every_tenant(self):
+        settings = (data_manager.TENANCY, data_manager.TENANT_DIR, standup.standup_fanout,
+                    standup.STANDUP_DMS, standup.STANDUP_CHANNELS)
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+
+        def restore():
+            data_manager.evict_idle_tenants(0)
+            (data_manager.TENANCY, data_manager.TENANT_DIR, standup.standup_fanout,
+             standup.STANDUP_DMS, standup.STANDUP_CHANNELS) = settings
+        self.addCleanup(restore)
+        data_manager.TENANCY, data_manager.TENANT_DIR = 'team', os.path.join(tmp, 'tenants')
+        standup.standup_fanout, standup.STANDUP_DMS, standup.STANDUP_CHANNELS = self.fanout, True, ['C2']
+        for user_id in ('U1', 'U2'):
+            data_manager.team_members[user_id] = {'role': 'dev'}
+            self.addCleanup(data_manager.team_members.pop, user_id, None)
+        with data_manager.use_tenant('T2'):
+            data_manager.team_members['U3'] = {'role': 'dev'}
+            data_manager.save_data('team_members', 'U3')
+        data_manager.evict_idle_tenants(0)
+
+        results = standup.send_standup(standup.DAILY_PROMPT, 'C1').result(5)
+        self.assertEqual(results, {'C1': 'ok', 'C2': 'ok', 'U1': 'ok', 'U2': 'ok', 'U3': 'ok'})
+        self.assertEqual({m['text'] for m in self.api.messages}, {standup.DAILY_PROMPT})
+        self.assertEqual(data_manager.loaded_tenants(), [])
+
+    def test_works_with_a_plain_web_client(self):
+        self.api.fail_channel('C404')
+        fanout = StandupFanout(WebClient(token='xoxb-test', base_url=self.api.base_url), workers=2)
+        results = fanout.send('Standup', ['C1', 'C404'], ['U1', 'U2']).result(5)
+        self.assertEqual(results, {'C1': 'ok', 'C404': 'channel_not_found', 'U1': 'ok', 'U2': 'ok'})
+        self.assertEqual(self._channels(), ['C1', 'DU1', 'DU2'])
+
+class UserDirectoryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.api = FakeSlackAPI().start()
+        self.api.add_user('U1', 'Ada Lovelace', 'ada@example.com', display_name='ada')
+        self.api.add_user('U2', 'Grace Hopper', 'grace@example.com')
+        self.now = 1000.0
+        self.directory = UserDirectory(
+            WebClient(token='xoxb-test', base_url=self.api.base_url),
+            ttl=60, negative_ttl=10, max_size=3, clock=lambda: self.now
+        )
+
+    def tearDown(self):
+        self.api.stop()
+
+    def _calls(self, method):
+        return len([r for r in self.api.requests if r['path'] == f'/api/{method}'])
+
+    def test_lookups_are_cached_until_ttl(self):
+        self.assertEqual(self.directory.lookup('U1')['email'], 'ada@example.com')
+        self.assertEqual(self.directory.lookup('U1')['real_name'], 'Ada Lovelace')
+        self.assertEqual(self._calls('users.info'), 1)
+
+        self.now += 61
+        self.directory.lookup('U1')
+        self.assertEqual(self._calls('users.info'), 2)
+
+    def test_unknown_users_are_negatively_cached(self):
+        self.assertIsNone(self.directory.lookup('U404'))
+        self.assertIsNone(self.directory.lookup('U404'))
+        self.assertEqual(self._calls('users.info'), 1)
+        self.now += 11
+        self.assertIsNone(self.directory.lookup('U404'))
+        self.assertEqual(self._calls('users.info'), 2)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        for user_id in ('U1', 'U2', 'U3', 'U4'):
+            self.directory.update({'id': user_id, 'real_name': user_id})
+            if user_id == 'U3':
+                self.directory.display_name('U1')
+        self.assertEqual(len(self.directory), 3)
+        self.assertEqual(self.directory.display_name('U1'), 'U1')
+        self.assertEqual(self.directory.display_name('U2'), 'U2')
+        self.assertIsNotNone(self.directory.lookup('U1'))
+        self.assertEqual(self._calls('users.info'), 0)
+
+    def test_warm_pages_through_users_list(self):
+        for i in range(450):
+            self.api.add_user(f'W{i:03}', f'Member {i}')
+        self.directory.max_size = 1000
+        self.assertEqual(self.directory.warm(), 452)
+        self.assertEqual(self._calls('users.list'), 3)
+        self.assertEqual(self.directory.display_name('U1'), 'ada')
+        self.assertEqual(self.directory.display_name('U2'), 'Grace Hopper')
+        self.assertEqual(self.directory.display_name('W449'), 'Member 449')
+        self.assertEqual(self._calls('users.info'), 0)
+
+    def test_warm_keeps_every_member_of_a_workspace_larger_than_the_cache(self):
+        for i in range(450):
+            self.api.add_user(f'W{i:03}', f'Member {i}')
+        self.directory.max_size = 100
+        self.assertEqual(self.directory.warm(), 452)
+        self.assertEqual(len(self.directory), 452)
+        self.assertEqual(self.directory.display_name('U1'), 'ada')
+        self.assertEqual(self.directory.display_name('W449'), 'Member 449')
+
+    def test_display_name_never_calls_slack_and_user_change_refreshes(self):
+        self.assertEqual(self.directory.display_name('U1'), 'U1')
+        self.assertIsNone(self.directory.display_name(None))
+        self.directory.update({'id': 'U1', 'real_name': 'Ada King', 'profile': {'display_name': 'countess'}})
+        self.assertEqual(self.directory.display_name('U1'), 'countess')
+        self.assertEqual(self.api.requests, [])
+
+class ListPagingTestCase(StorageTestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = FakeServer().start()
+        self.app = Flask(__name__)
+        self.app.add_url_rule('/list-tasks', view_func=list_tasks, methods=['POST'])
+        self.app.add_url_rule('/list-files', view_func=list_files, methods=['POST'])
+        self.app.add_url_rule('/slack/interactions', view_func=handle_interaction, methods=['POST'])
+        self.app.config['SLACK_SIGNING_SECRET'] = 'secret'
+        self.client = self.app.test_client()
+        self.prefixes = slack_requests.RESPONSE_URL_PREFIXES
+        slack_requests.RESPONSE_URL_PREFIXES = (self.server.url + '/',)
+
+    def tearDown(self):
+        slack_requests.RESPONSE_URL_PREFIXES = self.prefixes
+        self.server.stop()
+        super().tearDown()
+
+    def _add_tasks(self, count, **fields):
+        for _ in range(count):
+            self._add_task(**fields)
+
+    def _payload(self, message, response_url=None):
+        button = message['blocks'][-1]['elements'][0]
+        return {'payload': json.dumps({
+            'type': 'block_actions', 'response_url': response_url or self.server.url + '/',
+            'actions': [{'action_id': button['action_id'], 'value': button['value']}]
+        })}
+
+    def _press(self, message):
+        count = len(self.server.requests)
+        self.client.post('/slack/interactions', **signed(self._payload(message)))
+        self.assertTrue(self.server.wait_for(count + 1))
+        return self.server.requests[-1]['body']
+
+    def test_pages_through_tasks_with_next_buttons(self):
+        self._add_tasks(45)
+        first = self.client.post('/list-tasks').get_json()
+        self.assertEqual(first['text'], '📋 Tasks: 1-20 of 45')
+        self.assertEqual(len(first['blocks']), 23)
+        self.assertIn('*20*: Task 20', first['blocks'][-2]['text']['text'])
+        self.assertEqual(decode_cursor(first['blocks'][-1]['elements'][0]['value'])['after'], 20)
+
+        second = self._press(first)
+        self.assertTrue(second['replace_original'])
+        self.assertEqual(second['text'], '📋 Tasks: 21-40 of 45')
+        self.assertIn('*21*: Task 21', second['blocks'][2]['text']['text'])
+
+        third = self._press(second)
+        self.assertEqual(third['text'], '📋 Tasks: 41-45 of 45')
+        self.assertEqual(third['blocks'][-1]['type'], 'section')
+
+    def test_filters_carry_over_to_later_pages(self):
+        self._add_tasks(30, priority='High')
+        self._add_tasks(30, priority='Low')
+        first = self.client.post('/list-tasks', data={'text': 'priority:low'}).get_json()
+        self.assertEqual(first['text'], '📋 Tasks: 1-20 of 30')
+        second = self._press(first)
+        self.assertEqual(second['text'], '📋 Tasks: 21-30 of 30')
+        self.assertIn('*51*: Task 51', second['blocks'][2]['text']['text'])
+
+    def test_long_descriptions_stay_within_section_limit(self):
+        data_manager.tasks[1] = Task('x' * 5000)
+        data_manager.save_data('tasks', 1)
+        message = self.client.post('/list-tasks').get_json()
+        self.assertEqual(len(message['blocks'][2]['text']['text']), MAX_SECTION_TEXT)
+
+    def test_pages_through_files(self):
+        for i in range(25):
+            data_manager.file_links[f'file_{i + 1}'] = {
+                'name': f'Doc {i}', 'url': 'https://example.com', 'category': 'Docs',
+                'added_at': datetime.now().isoformat(), 'added_by': 'U1'
+            }
+        first = self.client.post('/list-files', data={'text': 'docs'}).get_json()
+        self.assertEqual(first['text'], '📎 Files: 1-20')
+        self.assertEqual(decode_cursor(first['blocks'][-1]['elements'][0]['value'])['after'], 20)
+        # A link added before the button is pressed goes at the end, it doesn't shift the next page
+        data_manager.file_links['file_26'] = dict(data_manager.file_links['file_1'], name='Doc 25')
+        second = self._press(first)
+        self.assertEqual(second['text'], '📎 Files: 21-26')
+        self.assertIn('Doc 20', second['blocks'][2]['text']['text'])
+        self.assertIn('Doc 25', second['blocks'][-1]['text']['text'])
+        self.assertEqual(self.client.post('/list-files', data={'text': 'none'}).get_data(as_text=True),
+                         '📎 No files match the specified category.')
+
+    def test_button_presses_must_be_signed_by_slack(self):
+        self._add_tasks(25)
+        first = self.client.post('/list-tasks').get_json()
+        forged = self.client.post('/slack/interactions', **signed(self._payload(first), secret='forged'))
+        self.assertEqual(forged.status_code, 403)
+        stale = self.client.post('/slack/interactions', **signed(self._payload(first), timestamp=time.time() - 3600))
+        self.assertEqual(stale.status_code, 403)
+        self.assertEqual(self.client.post('/slack/interactions', data=self._payload(first)).status_code, 403)
+        elsewhere = self.client.post('/slack/interactions', **signed(self._payload(first, 'http://169.254.169.254/')))
+        self.assertEqual(elsewhere.status_code, 400)
+        self.assertEqual(self.server.requests, [])
+        self.assertEqual(self._press(first)['text'], '📋 Tasks: 21-25 of 25')
+
+    def test_file_pages_look_at_a_bounded_number_of_links(self):
+        for i in range(12):
+            data_manager.file_links[f'file_{i + 1}'] = {
+                'name': f'Doc {i}', 'url': 'https://example.com', 'category': 'Specs' if i in (1, 10) else 'Docs',
+                'added_at': datetime.now().isoformat(), 'added_by': 'U1'
+            }
+        limit = file_managment.FILE_SCAN_LIMIT
+        file_managment.FILE_SCAN_LIMIT = 5
+        self.addCleanup(setattr, file_managment, 'FILE_SCAN_LIMIT', limit)
+
+        first = self.client.post('/list-files', data={'text': 'specs'}).get_json()
+        self.assertEqual(first['text'], '📎 Files: 1-1')
+        second = self._press(first)
+        self.assertEqual(second['text'], '📎 Files: no matches in files 6-10')
+        self.assertEqual(decode_cursor(second['blocks'][-1]['elements'][0]['value'])['after'], 10)
+        third = self._press(second)
+        self.assertEqual(third['text'], '📎 Files: 2-2')
+        self.assertIn('Doc 10', third['blocks'][2]['text']['text'])
+        self.assertNotEqual(third['blocks'][-1]['type'], 'actions')
+
+class EventDedupTestCase(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'seen_events')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _dedup(self, **kwargs):
+        kwargs.setdefault('path', '')
+        return EventDeduplicator(window=600, max_size=100, clock=lambda: self.now, **kwargs)
+
+    def test_retries_are_dropped_and_counted(self):
+        dedup = self._dedup()
+        self.assertFalse(dedup.is_duplicate('Ev1'))
+        self.assertTrue(dedup.is_duplicate('Ev1', retry_num='1'))
+        self.assertTrue(dedup.is_duplicate('Ev1', retry_num='2'))
+        self.assertFalse(dedup.is_duplicate('Ev2', retry_num='1'))
+        self.assertFalse(dedup.is_duplicate(None))
+        self.assertEqual(dedup.counters(), {'events': 5, 'retries': 3, 'duplicates': 2, 'remembered': 2})
+
+    def test_ids_are_forgotten_after_the_window(self):
+        dedup = self._dedup()
+        dedup.is_duplicate('Ev1')
+        self.now += 599
+        self.assertTrue(dedup.is_duplicate('Ev1'))
+        self.now += 2
+        self.assertFalse(dedup.is_duplicate('Ev1'))
+
+    def test_oldest_ids_are_evicted_past_max_size(self):
+        dedup = self._dedup()
+        for i in range(150):
+            dedup.is_duplicate(f'Ev{i}')
+        self.assertEqual(dedup.counters()['remembered'], 100)
+        self.assertFalse(dedup.is_duplicate('Ev0'))
+        self.assertTrue(dedup.is_duplicate('Ev149'))
+
+    def test_seen_ids_survive_a_restart(self):
+        dedup = self._dedup(path=self.path)
+        for i in range(250):
+            dedup.is_duplicate(f'Ev{i}')
+        dedup.close()
+        with open(self.path) as f:
+            self.assertLessEqual(len(f.readlines()), 200)
+
+        restarted = self._dedup(path=self.path)
+        self.assertTrue(restarted.is_duplicate('Ev249'))
+        self.assertFalse(restarted.is_duplicate('Ev0'))
+        restarted.close()
+
+        self.now += 601
+        expired = self._dedup(path=self.path)
+        self.assertFalse(expired.is_duplicate('Ev249'))
+        expired.close()
+
+class SlackEventsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = RecordingClient()
+        self.app = create_app(client=self.client, scheduler=Scheduler(), background_jobs=False, signing_secret='secret')
+        self.http = self.app.test_client()
+        self.event_id = f'Ev{random.getrandbits(48):012x}'
+
+    def _post(self, secret='secret', retry_num=None):
+        body = json.dumps({
+            'event_id': self.event_id,
+            'event': {'type': 'message', 'user': 'U1', 'text': 'great work', 'channel': main.SLACK_CHANNEL, 'ts': '1.0'}
+        })
+        timestamp = str(int(time.time()))
+        signature = 'v0=' + hmac.new(secret.encode(), f'v0:{timestamp}:{body}'.encode(), hashlib.sha256).hexdigest()
+        headers = {'X-Slack-Request-Timestamp': timestamp, 'X-Slack-Signature': signature}
+        if retry_num:
+            headers['X-Slack-Retry-Num'] = retry_num
+        return self.http.post('/slack/events', data=body, headers=headers, content_type='application/json')
+
+    def _reactions(self):
+        return len([name for name, kwargs in self.client.calls if name == 'reactions_add'])
+
+    def test_signature_is_checked_after_the_tenant_is_picked_from_the_form(self):
+        form = {'team_id': 'T1', 'payload': json.dumps({'response_url': 'https://hooks.slack.com/actions/1', 'actions': []})}
+        self.assertEqual(self.http.post('/slack/interactions', **signed(form)).status_code, 200)
+        self.assertEqual(self.http.post('/slack/interactions', **signed(form, secret='forged')).status_code, 403)
+
+    def test_forged_request_does_not_swallow_the_real_event(self):
+        self.assertEqual(self._post(secret='forged').status_code, 403)
+        self.assertEqual(self._reactions(), 0)
+
+        response = self._post()
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Slack-No-Retry', response.headers)
+        self.assertEqual(self._reactions(), 1)
+
+        retry = self._post(retry_num='1')
+        self.assertEqual(retry.headers.get('X-Slack-No-Retry'), '1')
+        self.assertEqual(self._reactions(), 1)
+
+    def test_event_whose_handler_failed_is_handled_on_retry(self):
+        failures = [RuntimeError('auth.test failed')]
+        auth_test = self.client.auth_test
+
+        def flaky_auth_test():
+            if failures:
+                raise failures.pop()
+            return auth_test()
+        self.client.auth_test = flaky_auth_test
+
+        self.assertEqual(self._post().status_code, 500)
+        self.assertEqual(self._reactions(), 0)
+        response = self._post(retry_num='1')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Slack-No-Retry', response.headers)
+        self.assertEqual(self._reactions(), 1)
+
+class ConcurrentWriteTestCase(StorageTestCase):
+    def setUp(self):
+        super().setUp()
+        self.app = Flask(__name__)
+        self.app.add_url_rule('/create-task', view_func=create_task, methods=['POST'])
+        self.app.add_url_rule('/task-status', view_func=set_task_status, methods=['POST'])
+        self.app.add_url_rule('/assign-task', view_func=assign_task, methods=['POST'])
+        self.app.add_url_rule('/add-file-link', view_func=add_file_link, methods=['POST'])
+
+    def _hammer(self, creators=4, creates=25, rounds=40):
+        errors = []
+        done = threading.Event()
+
+        def run(work):
+            try:
+                work()
+            except Exception as e:
+                errors.append(e)
+
+        def create():
+            client = self.app.test_client()
+            for i in range(creates):
+                response = client.post('/create-task', data={'text': f'Task {i} | 2000-01-01 | High', 'user_id': 'U1'})
+                self.assertEqual(response.status_code, 200)
+                response = client.post('/add-file-link', data={'text': f'Doc {i} | https://example.com/{i}', 'user_id': 'U1'})
+                self.assertEqual(response.status_code, 200)
+
+        def change():
+            client = self.app.test_client()
+            for i in range(rounds):
+                task_id = random.randint(1, max(1, data_manager.get_task_counter() - 1))
+                client.post('/task-status', data={'text': f'{task_id} {"Completed" if i % 2 else "Open"}'})
+                client.post('/assign-task', data={'text': f'{task_id} U{i % 3}'})
+
+        def save_all():
+            while not done.is_set():
+                data_manager.save_data()
+
+        def read():
+            while not done.is_set():
+                for task_id, task in data_manager.tasks.items():
+                    task['status']
+                data_manager.count_tasks(status='Open')
+                data_manager.find_tasks(assigned_to='U1', limit=5)
+
+        class SlowClock(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                # Lets other threads run between picking a file link's id and storing it
+                time.sleep(0.002)
+                return super().now(tz)
+        self.addCleanup(setattr, file_managment, 'datetime', file_managment.datetime)
+        file_managment.datetime = SlowClock
+
+        writers = [threading.Thread(target=run, args=(create,)) for _ in range(creators)]
+        writers += [threading.Thread(target=run, args=(change,)) for _ in range(2)]
+        background = [threading.Thread(target=run, args=(work,)) for work in (save_all, read)]
+        for thread in writers + background:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        done.set()
+        for thread in background:
+            thread.join()
+        return errors
+
+    def test_concurrent_creates_assigns_and_saves_stay_consistent(self):
+        for mode in data_manager.STORAGE_MODES:
+            with self.subTest(mode=mode):
+                self._start(mode)
+
+                errors = self._hammer()
+                self.assertEqual(errors, [])
+                self.assertEqual(sorted(data_manager.tasks), list(range(1, 101)))
+                self.assertEqual(data_manager.get_task_counter(), 101)
+                self.assertEqual(sorted(data_manager.file_links), sorted(f'file_{n}' for n in range(1, 101)))
+                self.assertEqual(data_manager.verify_aggregates(), [])
+
+                data_manager.save_data('tasks', 1)
+                expected = {task_id: task.to_dict() for task_id, task in data_manager.tasks.items()}
+                data_manager.close_storage()
+                data_manager.load_data()
+                self.assertEqual({task_id: task.to_dict() for task_id, task in data_manager.tasks.items()}, expected)
+                self.assertEqual(data_manager.get_task_counter(), 101)
+
+    def test_iterating_while_writing_sees_a_stable_snapshot(self):
+        self._start('json')
+        for task_id in range(1, 4):
+            data_manager.tasks[task_id] = Task(f'Task {task_id}')
+        seen = []
+        for task_id in data_manager.tasks:
+            data_manager.tasks[task_id + 100] = Task('Added while iterating')
+            seen.append(task_id)
+        self.assertEqual(seen, [1, 2, 3])
+        self.assertEqual(len(data_manager.tasks), 6)
+
+    def test_saved_records_are_copies(self):
+        self._start('json')
+        data_manager.tasks[1] = Task('Original')
+        data_manager.tasks[1].comments.append('first')
+        saved = data_manager.tasks.records()
+        data_manager.tasks[1]['description'] = 'Changed'
+        data_manager.tasks[1].comments.append('second')
+        self.assertEqual(saved[1]['description'], 'Original')
+        self.assertEqual(saved[1]['comments'], ['first'])
+
+class AppFactoryTestCase(unittest.TestCase):
+    def test_importing_main_starts_nothing(self):
+        root = os.path.dirname(os.path.abspath(__file__))
+        script = "import threading, main; print(threading.active_count(), main.app.extensions['slack_bot']._scheduler is not None)"
+        with tempfile.TemporaryDirectory() as tmp:
+            output = subprocess.run(
+                [sys.executable, '-c', script], cwd=tmp, capture_output=True, text=True, check=True,
+                env=dict(os.environ, PYTHONPATH=root, SLACK_BOT_TOKEN='xoxb-invalid', SIGNING_SECRET='secret')
+            ).stdout
+            self.assertEqual(output.split()[-2:], ['1', 'False'])
+            self.assertEqual(os.listdir(tmp), [])
+
+    def test_injected_client_is_used_and_jobs_stay_off(self):
+        client = RecordingClient()
+        factory_app = create_app(client=client, background_jobs=False)
+        threads = threading.active_count()
+        response = factory_app.test_client().post('/bot-intro', data={'channel_id': 'C1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(client.calls[0][0], 'chat_postMessage')
+        self.assertEqual(client.calls[0][1]['channel'], 'C1')
+        self.assertEqual(threading.active_count(), threads)
+
+    def test_start_schedules_jobs_without_a_request(self):
+        scheduler = Scheduler()
+        self.addCleanup(scheduler.shutdown)
+        factory_app = create_app(client=RecordingClient(), scheduler=scheduler)
+        self.addCleanup(setattr, main.reminder_engine, 'scheduler', None)
+        self.addCleanup(setattr, main.rule_engine, 'scheduler', None)
+        self.assertIs(main.start(factory_app), factory_app)
+        self.assertIs(main.reminder_engine.scheduler, scheduler)
+        self.assertIs(main.rule_engine.scheduler, scheduler)
+        self.assertTrue({'daily_standup', 'weekly_standup', 'monthly_standup', 'user_directory_refresh'}
+                        <= {job.id for job in scheduler.get_jobs()})
+        refresh = scheduler.get_job('user_directory_refresh').trigger.interval.total_seconds()
+        self.assertEqual(refresh, main.user_directory.ttl / 2)
+
+class IntegrationClientTestCase(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.replies = {}
+        self.delay = 0
+        self.server = FakeServer(self._respond).start()
+        self.client = IntegrationClient(ttl=60, negative_ttl=10, clock=lambda: self.now,
+                                        breaker=CircuitBreaker(3, 30, clock=lambda: self.now))
+
+    def tearDown(self):
+        self.server.stop()
+
+    def _respond(self, path, body):
+        time.sleep(self.delay)
+        return self.replies.get(body.get('q'), (200, {}, {'city': body.get('q')}))
+
+    def _get(self, city):
+        return self.client.get_json(self.server.url + '/weather', params={'q': city}, key=city.lower())
+
+    def test_answers_are_cached_until_the_ttl_runs_out(self):
+        self.assertEqual(self._get('Paris'), {'city': 'Paris'})
+        self.assertEqual(self._get('paris'), {'city': 'Paris'})
+        self.assertEqual(len(self.server.requests), 1)
+        self.now += 61
+        self._get('paris')
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.client.counters()['hits'], 1)
+
+    def test_concurrent_calls_for_a_key_share_one_request(self):
+        self.delay = 0.3
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self._get('Oslo'))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [{'city': 'Oslo'}] * 8)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(self.client.counters()['coalesced'], 7)
+
+    def test_failures_are_cached_for_the_negative_ttl(self):
+        self.replies['Nowhere'] = (404, {}, {'message': 'city not found'})
+        for _ in range(2):
+            with self.assertRaises(IntegrationError) as raised:
+                self._get('Nowhere')
+            self.assertEqual(raised.exception.status, 404)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(self.client.breaker.state, 'closed')
+        self.now += 11
+        self.replies.clear()
+        self.assertEqual(self._get('Nowhere'), {'city': 'Nowhere'})
+
+    def test_circuit_opens_after_repeated_failures_and_recovers(self):
+        for city in ('A', 'B', 'C'):
+            self.replies[city] = (503, {}, {})
+            with self.assertRaises(IntegrationError):
+                self._get(city)
+        self.assertEqual(self.client.breaker.state, 'open')
+        with self.assertRaises(CircuitOpenError):
+            self._get('D')
+        self.assertEqual(len(self.server.requests), 3)
+
+        self.now += 31
+        self.assertEqual(self._get('D'), {'city': 'D'})
+        self.assertEqual(self.client.breaker.state, 'closed')
+        self.assertEqual(self.client.counters()['rejected'], 1)
+
+    def test_failed_trial_reopens_the_circuit(self):
+        for city in ('A', 'B', 'C', 'D'):
+            self.replies[city] = (500, {}, {})
+        for city in ('A', 'B', 'C'):
+            with self.assertRaises(IntegrationError):
+                self._get(city)
+        self.now += 31
+        with self.assertRaises(IntegrationError):
+            self._get('D')
+        self.assertEqual(self.client.breaker.state, 'open')
+        with self.assertRaises(CircuitOpenError):
+            self._get('E')
+
+    def test_weather_command_reads_the_cached_upstream(self):
+        self.replies['Rome'] = (200, {}, {'main': {'temp': 21, 'humidity': 40}, 'weather': [{'description': 'clear sky'}]})
+        self.replies['Atlantis'] = (404, {}, {'message': 'city not found'})
+        app = Flask(__name__)
+        app.add_url_rule('/weather', view_func=integrations.get_weather, methods=['POST'])
+        url, client = integrations.WEATHER_API_URL, integrations.weather_client
+        integrations.WEATHER_API_URL = self.server.url + '/weather'
+        integrations.weather_client = self.client
+        try:
+            test_client = app.test_client()
+            for city in ('Rome', 'rome'):
+                reply = test_client.post('/weather', data={'text': city}).get_data(as_text=True)
+                self.assertIn('Temperature: 21°C', reply)
+                self.assertIn('clear sky', reply)
+            reply = test_client.post('/weather', data={'text': 'Atlantis'}).get_data(as_text=True)
+            self.assertEqual(reply, '❌ Could not fetch weather for Atlantis')
+        finally:
+            integrations.WEATHER_API_URL, integrations.weather_client = url, client
+        self.assertEqual(len(self.server.requests), 2)
+
+class BulkTaskTestCase(StorageTestCase):
+    def setUp(self):
+        super().setUp()
+        self.app = Flask(__name__)
+        self.app.add_url_rule('/create-task', view_func=create_task, methods=['POST'])
+        self.app.add_url_rule('/bulk-update', view_func=bulk_update, methods=['POST'])
+        self.client = self.app.test_client()
+
+    def _count_snapshot_writes(self):
+        store = data_manager.current_store()
+        writes = []
+        write_snapshot = store._write_snapshot
+        store._write_snapshot = lambda state: (writes.append(state), write_snapshot(state))
+        self.addCleanup(vars(store).pop, '_write_snapshot')
+        return writes
+
+    def _post(self, path, text):
+        return self.client.post(path, data={'text': text, 'user_id': 'U1'}).get_data(as_text=True)
+
+    def test_multi_line_create_saves_once_and_reports_bad_lines(self):
+        self._start('json')
+        writes = self._count_snapshot_writes()
+        reply = self._post('/create-task', 'Plan sprint | 2030-01-02 | High\n\nWrite spec | someday\n | 2030-01-01\nReview | | Low | Docs | 2')
+        self.assertEqual(len(writes), 1)
+        self.assertEqual(sorted(data_manager.tasks), [1, 2])
+        self.assertTrue(reply.startswith('✅ Created 2 of 4 tasks'))
+        self.assertIn('📋 2: Review | Priority: Low | Category: Docs', reply)
+        self.assertIn("❌ Line 2: invalid due date 'someday', use YYYY-MM-DD", reply)
+        self.assertIn('❌ Line 3: missing description', reply)
+        self.assertEqual(data_manager.tasks[2]['estimated_hours'], 2.0)
+
+    def test_bulk_update_changes_every_match_with_one_save(self):
+        self._start('json')
+        self._post('/create-task', 'A | | High\nB | | High\nC | | Low')
+        writes = self._count_snapshot_writes()
+        reply = self._post('/bulk-update', 'priority:High status Completed')
+        self.assertEqual(reply, '✅ Updated status = Completed on 2 tasks: 1, 2')
+        self.assertEqual(len(writes), 1)
+        self.assertEqual([task['status'] for task in data_manager.tasks.values()], ['Completed', 'Completed', 'Open'])
+        self.assertIsNotNone(data_manager.tasks[1]['completed_at'])
+        self.assertEqual(data_manager.count_tasks(status='Completed'), 2)
+
+        self.assertEqual(self._post('/bulk-update', 'priority:High due_date soon'), '❌ Invalid date format. Use YYYY-MM-DD')
+        self.assertTrue(self._post('/bulk-update', 'status Completed').startswith('Format: /bulk-update'))
+        self.assertEqual(self._post('/bulk-update', 'assigned:U9 priority Low'), '📝 No tasks match the specified filters.')
+        self.assertEqual(len(writes), 1)
+
+    def test_bulk_commands_persist_in_every_storage_mode(self):
+        for mode in data_manager.STORAGE_MODES:
+            with self.subTest(mode=mode):
+                self._start(mode)
+                self._post('/create-task', 'A | | High\nB | | High\nC | | Low')
+                self._post('/bulk-update', 'priority:High category Backend')
+                expected = {task_id: task.to_dict() for task_id, task in data_manager.tasks.items()}
+                data_manager.close_storage()
+                data_manager.load_data()
+                self.assertEqual({task_id: task.to_dict() for task_id, task in data_manager.tasks.items()}, expected)
+                self.assertEqual(data_manager.count_tasks(category='Backend'), 2)
+                self.assertEqual(data_manager.get_task_counter(), 4)
+
+    def test_queries_inside_a_batch_see_its_changes_in_every_storage_mode(self):
+        for mode in data_manager.STORAGE_MODES:
+            with self.subTest(mode=mode):
+                self._start(mode)
+                self._post('/create-task', 'A | 2000-01-01 | High | Docs')
+                with data_manager.batch():
+                    data_manager.tasks[1]['status'] = 'Completed'
+                    data_manager.save_data('tasks', 1)
+                    task_id = self._add_task('B', due_date='2000-01-02', category='Docs')
+                    self.assertEqual(list(data_manager.find_tasks(status='Open')), [task_id])
+                    self.assertEqual(list(data_manager.find_overdue_tasks()), [task_id])
+                    self.assertEqual(data_manager.count_tasks(status='Open', category='Docs'), 1)
+                    self.assertEqual(data_manager.count_tasks_by('category'), {'Docs': 2})
+                self.assertEqual(list(data_manager.find_tasks(status='Open')), [task_id])
+                self.assertEqual(data_manager.count_tasks(status='Completed', category='Docs'), 1)
+
+    def test_batch_still_saves_when_the_block_fails(self):
+        self._start('journal')
+        with self.assertRaises(RuntimeError):
+            with data_manager.batch():
+                data_manager.tasks[1] = Task('Kept')
+                data_manager.save_data('tasks', 1)
+                raise RuntimeError
+        data_manager.close_storage()
+        data_manager.load_data()
+        self.assertEqual(data_manager.tasks[1]['description'], 'Kept')
+
+class RecordingClient:
+    def __init__(self):
+        self.calls = []
+
+    def chat_postMessage(self, **kwargs):
+        self.calls.append(('chat_postMessage', kwargs))
+
+    def reactions_add(self, **kwargs):
+        self.calls.append(('reactions_add', kwargs))
+
+    def auth_test(self):
+        return {'user_id': 'UBOT'}
+
+    def users_list(self, **kwargs):
+        return {'members': [], 'response_metadata': {'next_cursor': ''}}
+
+class TriggerMatcherTestCase(StorageTestCase):
+    def setUp(self):
+        super().setUp()
+        self.triggers_file = triggers.TRIGGERS_FILE
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        triggers.TRIGGERS_FILE = self.triggers_file
+        triggers.reload_triggers()
+        shutil.rmtree(self.tmp)
+        super().tearDown()
+
+    def _names(self, matcher, text):
+        return [trigger['name'] for trigger, _ in matcher.match(text)]
+
+    def test_phrases_match_anywhere_in_the_message(self):
+        matcher = triggers.TriggerMatcher(triggers.DEFAULT_TRIGGERS)
+        self.assertEqual(self._names(matcher, 'AWESOME, but task #4 is late. Great work!'),
+                         ['praise', 'overdue', 'task_lookup'])
+        # Substrings count, as they always have, but a phrase's spacing has to match
+        self.assertEqual(self._names(matcher, 'please translate this'), ['overdue'])
+        self.assertEqual(self._names(matcher, 'a great workload'), ['praise'])
+        self.assertEqual(self._names(matcher, 'we missed the deadline'), [])
+        self.assertEqual(self._names(matcher, 'Missed  deadline again'), [])
+        self.assertEqual(matcher.match('Missed deadline again')[0][1], 'missed deadline')
+        # The first phrase in the message is reported, also when phrases overlap
+        self.assertEqual(matcher.match('the latest is overdue')[0][1], 'late')
+        self.assertEqual(matcher.match('see task #42')[0][1].group(1), '42')
+
+    def test_matches_the_phrase_loops_it_replaces(self):
+        rng = random.Random(5)
+        sets = [(f'set{i}', [f'word{i}', f'two words{i}']) for i in range(40)]
+        matcher = triggers.TriggerMatcher([{'name': name, 'phrases': phrases} for name, phrases in sets])
+        vocabulary = [phrase for _, phrases in sets for phrase in phrases] + ['filler', 'text', 'two', 'WORD']
+        for _ in range(300):
+            text = rng.choice([' ', '']).join(rng.choice(vocabulary) for _ in range(rng.randint(0, 12)))
+            expected = [name for name, phrases in sets if any(p in text.lower() for p in phrases)]
+            self.assertEqual(self._names(matcher, text), expected)
+
+    def test_channels_use_their_own_trigger_sets(self):
+        path = os.path.join(self.tmp, 'triggers.json')
+        with open(path, 'w') as f:
+            json.dump({'C1': [{'name': 'ship', 'phrases': ['shipped'], 'action': 'react', 'reaction': 'rocket'}]}, f)
+        triggers.TRIGGERS_FILE = path
+        triggers.reload_triggers()
+
+        client = RecordingClient()
+        event = {'channel': 'C1', 'ts': '1.0', 'text': 'Shipped it, awesome'}
+        self.assertEqual(triggers.run_triggers(client, event), ['ship'])
+        self.assertEqual(client.calls, [('reactions_add', {'channel': 'C1', 'timestamp': '1.0', 'name': 'rocket'})])
+        self.assertEqual(triggers.run_triggers(client, dict(event, channel='C2')), ['praise'])
+
+    def test_actions_post_overdue_digest_and_task_lookup(self):
+        data_manager.tasks[1] = Task('Write report', due_date='2000-01-01')
+        data_manager.save_data('tasks', 1)
+        client = RecordingClient()
+        fired = triggers.run_triggers(client, {'channel': 'C1', 'ts': '1.0', 'text': 'task #1 is overdue'})
+        self.assertEqual(fired, ['overdue', 'task_lookup'])
+        texts = [kwargs['text'] for _, kwargs in client.calls]
+        self.assertIn('Write report (Due: 2000-01-01)', texts[0])
+        self.assertTrue(texts[1].startswith('📋 Task 1: Write report'))
+
+    def test_patterns_keep_their_own_groups_and_classes(self):
+        matcher = triggers.TriggerMatcher([
+            {'name': 'urgent', 'pattern': r'[(]urgent[)]', 'action': 'react'},
+            {'name': 'repeat', 'pattern': r'\b(\w+) \1\b', 'action': 'react'},
+            {'name': 'ticket', 'pattern': r'(?P<project>[a-z]+)-(?P<number>\d+)', 'action': 'react'},
+            {'name': 'lookup', 'pattern': r'task\s*#(\d+)', 'action': 'task_lookup'},
+        ])
+        found = dict((trigger['name'], hit) for trigger, hit in matcher.match('(urgent) web-42 the the task #7'))
+        self.assertEqual(sorted(found), ['lookup', 'repeat', 'ticket', 'urgent'])
+        self.assertEqual(found['urgent'].group(), '(urgent)')
+        self.assertEqual(found['repeat'].group(1), 'the')
+        self.assertEqual(found['ticket'].group('number'), '42')
+        self.assertEqual(found['lookup'].group(1), '7')
+        self.assertEqual(matcher.match('urgent but no brackets'), [])
+
+    def test_phrases_inside_other_phrases_all_match(self):
+        matcher = triggers.TriggerMatcher([
+            {'name': 'deadline', 'phrases': ['deadline'], 'action': 'react'},
+            {'name': 'missed', 'phrases': ['missed deadline'], 'action': 'react'},
+            {'name': 'miss', 'phrases': ['miss'], 'action': 'react'},
+            {'name': 'regex looking', 'phrases': ['(a+)*'], 'action': 'react'},
+        ])
+        self.assertEqual(self._names(matcher, 'MISSED DEADLINE'), ['deadline', 'missed', 'miss'])
+        self.assertEqual(self._names(matcher, 'dismissed'), ['miss'])
+        self.assertEqual(self._names(matcher, 'aaaa'), [])
+        self.assertEqual(self._names(matcher, 'x(a+)*'), ['regex looking'])
+
+class SchedulerTestCase(unittest.TestCase):
+    def setUp(self):
+        # A Wednesday
+        self.now = datetime(2024, 5, 1, 8, 0)
+        self.scheduler = Scheduler(clock=lambda: self.now)
+        self.ran = []
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'scheduled_jobs.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _job(self, name):
+        return lambda: self.ran.append(name)
+
+    def _stored_scheduler(self, **kwargs):
+        kwargs.setdefault('load_window', 3600)
+        return Scheduler(clock=lambda: self.now, store=JobStore(self.path),
+                         actions={'post': lambda text: self.ran.append(text)}, **kwargs)
+
+    def test_jobs_run_in_due_order_once_due(self):
+        self.scheduler.add_job(self._job('later'), trigger='date', run_date=datetime(2024, 5, 1, 8, 30))
+        self.scheduler.add_job(self._job('sooner'), trigger='date', run_date=datetime(2024, 5, 1, 8, 10))
+        self.assertEqual(self.scheduler.run_due(), 0)
+        self.now = datetime(2024, 5, 1, 9, 0)
+        self.assertEqual(self.scheduler.run_due(), 2)
+        self.assertEqual(self.ran, ['sooner', 'later'])
+        self.assertEqual(len(self.scheduler), 0)
+
+    def test_cron_jobs_skip_non_matching_days(self):
+        self.scheduler.misfire_grace = timedelta(days=7)
+        job = self.scheduler.add_job(self._job('standup'), trigger='cron', day_of_week='mon-fri', hour=9, minute=0)
+        self.assertEqual(job.next_run, datetime(2024, 5, 1, 9, 0))
+        self.now = datetime(2024, 5, 3, 9, 0)
+        self.scheduler.run_due()
+        # Missed runs collapse into one, and the weekend is skipped
+        self.assertEqual(self.ran, ['standup'])
+        self.assertEqual(job.next_run, datetime(2024, 5, 6, 9, 0))
+        monthly = self.scheduler.add_job(self._job('monthly'), trigger='cron', day=1, hour=9, minute=0)
+        self.assertEqual(monthly.next_run, datetime(2024, 6, 1, 9, 0))
+
+    def test_interval_jobs_repeat(self):
+        self.scheduler.add_job(self._job('refresh'), trigger='interval', seconds=60)
+        for _ in range(3):
+            self.now += timedelta(seconds=60)
+            self.scheduler.run_due()
+        self.assertEqual(self.ran, ['refresh'] * 3)
+
+    def test_same_id_replaces_and_removed_jobs_never_run(self):
+        run_date = datetime(2024, 5, 1, 8, 30)
+        self.scheduler.add_job(self._job('first'), trigger='date', run_date=run_date, id='reminder')
+        self.scheduler.add_job(self._job('second'), trigger='date', run_date=run_date, id='reminder')
+        self.scheduler.add_job(self._job('removed'), trigger='date', run_date=run_date, id='gone')
+        self.assertTrue(self.scheduler.remove_job('gone'))
+        self.assertFalse(self.scheduler.remove_job('gone'))
+        self.now = run_date
+        self.scheduler.run_due()
+        self.assertEqual(self.ran, ['second'])
+
+    def test_a_failing_job_is_counted_and_others_still_run(self):
+        def fail():
+            raise RuntimeError('boom')
+        self.scheduler.add_job(fail, trigger='date', run_date=self.now)
+        self.scheduler.add_job(self._job('ok'), trigger='date', run_date=self.now)
+        self.scheduler.run_due()
+        self.assertEqual(self.ran, ['ok'])
+        self.assertEqual(self.scheduler.stats['failures'], 1)
+
+    def test_stored_jobs_are_scheduled_again_after_a_restart(self):
+        scheduler = self._stored_scheduler()
+        scheduler.add_job(action='post', args={'text': 'meeting'}, trigger='date',
+                          run_date=datetime(2024, 5, 1, 8, 30), id='meeting')
+        scheduler.add_job(action='post', args={'text': 'daily'}, trigger='cron', hour=8, minute=45, id='daily')
+        scheduler.add_job(self._job('in memory only'), trigger='date', run_date=datetime(2024, 5, 1, 8, 15))
+        scheduler.store.close()
+
+        self.now = datetime(2024, 5, 1, 9, 0)
+        restarted = self._stored_scheduler()
+        self.assertEqual(restarted.run_due(), 2)
+        self.assertEqual(sorted(self.ran), ['daily', 'meeting'])
+        self.assertEqual(len(restarted.store), 1)
+        self.assertEqual(restarted.get_job('daily').next_run, datetime(2024, 5, 2, 8, 45))
+
+    def test_only_jobs_due_within_the_window_are_loaded(self):
+        scheduler = self._stored_scheduler()
+        for hours in (0.5, 2, 5):
+            scheduler.add_job(action='post', args={'text': f'{hours}h'}, trigger='date',
+                              run_date=self.now + timedelta(hours=hours), id=f'{hours}h')
+        scheduler.store.close()
+
+        restarted = self._stored_scheduler()
+        restarted.run_due()
+        self.assertEqual([job.id for job in restarted.get_jobs()], ['0.5h'])
+        self.now += timedelta(hours=1)
+        restarted.run_due()
+        self.assertEqual(self.ran, ['0.5h'])
+        self.assertEqual([job.id for job in restarted.get_jobs()], ['2h'])
+        self.now += timedelta(hours=1)
+        restarted.run_due()
+        self.assertEqual(self.ran, ['0.5h', '2h'])
+        self.assertEqual((len(restarted), len(restarted.store)), (0, 1))
+        self.assertTrue(restarted.remove_job('5h'))
+        self.assertEqual(len(restarted.store), 0)
+
+    def test_runs_missed_beyond_the_grace_period_are_skipped(self):
+        scheduler = self._stored_scheduler()
+        scheduler.add_job(action='post', args={'text': 'recent'}, trigger='date',
+                          run_date=datetime(2024, 5, 1, 9, 30), id='recent')
+        scheduler.add_job(action='post', args={'text': 'stale'}, trigger='date',
+                          run_date=datetime(2024, 5, 1, 9, 0), id='stale')
+        scheduler.add_job(action='post', args={'text': 'daily'}, trigger='cron', hour=9, minute=0, id='daily')
+        scheduler.store.close()
+
+        self.now = datetime(2024, 5, 1, 10, 15)
+        restarted = self._stored_scheduler(misfire_grace=3600)
+        restarted.run_due()
+        self.assertEqual(self.ran, ['recent'])
+        self.assertEqual(restarted.stats['misfires'], 2)
+        # The daily job skips today's run but stays scheduled
+        self.assertEqual([job.id for job in restarted.get_jobs()], ['daily'])
+        self.assertEqual(len(restarted.store), 1)
+
+    def test_jobs_can_have_their_own_grace_period(self):
+        self.scheduler.add_job(self._job('lenient'), trigger='date', run_date=datetime(2024, 5, 1, 8, 30),
+                               misfire_grace_time=86400)
+        self.scheduler.add_job(self._job('strict'), trigger='date', run_date=datetime(2024, 5, 1, 8, 30),
+                               misfire_grace_time=60, on_misfire=self._job('strict missed'))
+        self.now = datetime(2024, 5, 1, 10, 0)
+        self.scheduler.run_due()
+        self.assertEqual(sorted(self.ran), ['lenient', 'strict missed'])
+        self.assertEqual(self.scheduler.stats['misfires'], 1)
+
+    def test_thread_sleeps_until_a_sooner_job_wakes_it(self):
+        scheduler = Scheduler()
+        done = threading.Event()
+        scheduler.add_job(done.set, trigger='date', run_date=datetime.now() + timedelta(hours=1))
+        scheduler.start()
+        try:
+            time.sleep(0.3)
+            self.assertLessEqual(scheduler.stats['wakeups'], 1)
+            scheduler.add_job(done.set, trigger='date', run_date=datetime.now() + timedelta(milliseconds=50))
+            self.assertTrue(done.wait(2))
+        finally:
+            scheduler.shutdown()
+
+class ReminderEngineTestCase(StorageTestCase):
+    def setUp(self):
+        super().setUp()
+        self.now = datetime(2024, 5, 1, 8, 0)
+        self.client = RecordingClient()
+        self.engine = self._engine()
+
+    def _engine(self, **kwargs):
+        return ReminderEngine(client=self.client, clock=lambda: self.now, **kwargs)
+
+    def _sent(self):
+        return [kwargs['text'] for name, kwargs in self.client.calls]
+
+    def test_a_user_can_have_several_reminders(self):
+        first = self.engine.add('U1', 'C1', 'Stand up', self.now + timedelta(hours=1))
+        second = self.engine.add('U1', 'C1', 'Review', self.now + timedelta(hours=2))
+        self.assertNotEqual(first, second)
+        self.assertEqual([reminder_id for reminder_id, _ in self.engine.pending('U1')], [first, second])
+        self.now += timedelta(hours=1)
+        self.assertEqual(self.engine.run_due(), 1)
+        self.now += timedelta(hours=1)
+        self.engine.run_due()
+        self.assertEqual(self._sent(), ['🔔 Reminder: Stand up', '🔔 Reminder: Review'])
+        self.assertEqual(len(data_manager.reminders), 0)
+        self.assertEqual(len(self.engine), 0)
+
+    def test_a_reminder_the_dispatcher_drops_is_logged(self):
+        dropped = Future()
+        dropped.set_exception(RuntimeError('channel_not_found'))
+        self.client.chat_postMessage = lambda **kwargs: dropped
+        reminder_id = self.engine.add('U1', 'C1', 'Stand up', self.now + timedelta(hours=1))
+        self.now += timedelta(hours=1)
+        with self.assertLogs('utils.dispatcher', 'ERROR') as logs:
+            self.engine.run_due()
+        self.assertEqual(logs.output, [f'ERROR:utils.dispatcher:Could not post reminder {reminder_id} to C1: channel_not_found'])
+
+    def test_cancelled_reminders_never_fire(self):
+        reminder_id = self.engine.add('U1', 'C1', 'Stand up', self.now + timedelta(hours=1))
+        self.assertFalse(self.engine.cancel(reminder_id, user_id='U2'))
+        self.assertTrue(self.engine.cancel(reminder_id, user_id='U1'))
+        self.assertFalse(self.engine.cancel(reminder_id))
+        self.now += timedelta(hours=2)
+        self.engine.run_due()
+        self.assertEqual(self._sent(), [])
+
+    def test_reminders_are_restored_after_a_restart(self):
+        self.engine.add('U1', 'C1', 'Soon', self.now + timedelta(hours=1))
+        self.engine.add('U1', 'C1', 'Missed', self.now - timedelta(days=2))
+        data_manager.close_storage()
+        data_manager.load_data()
+
+        restarted = self._engine(misfire_grace=86400)
+        restarted.restore(data_manager.current_store())
+        self.assertEqual(len(restarted), 2)
+        self.now += timedelta(hours=1)
+        restarted.run_due()
+        # The reminder that was due two days ago is dropped rather than sent late
+        self.assertEqual(self._sent(), ['🔔 Reminder: Soon'])
+        self.assertEqual(len(data_manager.reminders), 0)
+
+    def test_tenant_reminders_fire_after_a_restart_without_using_the_tenant(self):
+        self._team_tenancy()
+        with data_manager.use_tenant('T1', 'C1'):
+            self.engine.add('U1', 'C1', 'Quiet team', self.now + timedelta(hours=1), team_id='T1')
+        data_manager.close_storage()
+
+        restarted = self._engine()
+        restarted.restore_tenants()
+        self.assertEqual(len(restarted), 1)
+        self.assertEqual(data_manager.loaded_tenants(), [])
+        self.now += timedelta(hours=1)
+        restarted.run_due()
+        self.assertEqual(self._sent(), ['🔔 Reminder: Quiet team'])
+        with data_manager.use_tenant('T1'):
+            self.assertEqual(len(data_manager.reminders), 0)
+
+    def test_pending_reminders_are_capped(self):
+        engine = self._engine(max_pending=2)
+        engine.add('U1', 'C1', 'One', self.now + timedelta(hours=1))
+        engine.add('U2', 'C1', 'Two', self.now + timedelta(hours=1))
+        with self.assertRaises(ReminderLimitError):
+            engine.add('U3', 'C1', 'Three', self.now + timedelta(hours=1))
+
+    def test_reminders_share_a_scheduler_with_other_jobs(self):
+        scheduler = Scheduler(clock=lambda: self.now)
+        scheduler.add_job(lambda: None, trigger='interval', hours=1, id='other')
+        engine = self._engine(scheduler=scheduler)
+        engine.add('U1', 'C1', 'Stand up', self.now + timedelta(minutes=30))
+        self.assertEqual((len(engine), len(scheduler)), (1, 2))
+        self.now += timedelta(minutes=30)
+        scheduler.run_due()
+        self.assertEqual(self._sent(), ['🔔 Reminder: Stand up'])
+        self.assertEqual((len(engine), len(scheduler)), (0, 1))
+
+    def test_cancelling_keeps_the_heap_bounded(self):
+        for i in range(3000):
+            self.engine.scheduler.add_job(lambda: None, trigger='date', run_date=self.now + timedelta(hours=1), id=i)
+            self.engine.scheduler.remove_job(i)
+        self.assertLess(len(self.engine.scheduler._heap), 2000)
+
+class SmartRuleTestCase(StorageTestCase):
+    def setUp(self):
+        super().setUp()
+        self.now = datetime(2024, 5, 1, 8, 0)
+        self.client = RecordingClient()
+        self.engine = self._listening(RuleEngine(client=self.client, clock=lambda: self.now))
+
+    def _listening(self, engine):
+        data_manager.add_change_listener(engine.on_change)
+        self.addCleanup(self._stop_listening, engine)
+        return engine
+
+    def _stop_listening(self, engine):
+        if engine.on_change in data_manager._change_listeners:
+            data_manager._change_listeners.remove(engine.on_change)
+
+    def _task(self, task_id, priority='High', status='Open'):
+        data_manager.tasks[task_id] = Task(f'Task {task_id}', priority=priority, status=status)
+        data_manager.save_data('tasks', task_id)
+
+    def _project(self, project_id, deadline):
+        data_manager.project_summaries[project_id] = {'name': f'Project {project_id}', 'deadline': deadline}
+        data_manager.save_data('project_summaries', project_id)
+
+    def _sent(self):
+        return [kwargs['text'] for name, kwargs in self.client.calls]
+
+    def test_task_completion_fires_once_per_transition(self):
+        self._task(1)
+        self._task(2)
+        self.engine.add_rule('task_completion', 'All clear', 'C1')
+        self._task(1, status='Completed')
+        self.assertEqual(self._sent(), [])
+        self._task(2, status='Completed')
+        self._task(3, priority='Low')
+        self._task(2, status='Completed')
+        self.assertEqual(self._sent(), ['🎉 Smart notification: All clear'])
+
+        self._task(4)
+        del data_manager.tasks[4]
+        data_manager.save_data('tasks', 4)
+        self.assertEqual(len(self._sent()), 2)
+
+    def test_a_rule_whose_condition_holds_notifies_at_once(self):
+        self._project('p1', '2024-05-03')
+        self.engine.add_rule('task_completion', 'Nothing urgent', 'C1')
+        self.engine.add_rule('project_deadline', 'Ship it', 'C1')
+        self.assertEqual(self._sent(), [
+            '🎉 Smart notification: Nothing urgent',
+            '⚠️ Project deadline alert: Ship it (Project p1 is due 2024-05-03)'
+        ])
+
+    def test_project_deadline_fires_when_the_deadline_comes_close(self):
+        self.engine.add_rule('project_deadline', 'Deadline soon', 'C1')
+        self._project('p1', '2024-05-31')
+        self.assertEqual(self._sent(), [])
+
+        # Moving the deadline closer puts it in the window straight away
+        self._project('p2', '2024-06-30')
+        self._project('p2', '2024-05-05')
+        self._project('p2', '2024-05-06')
+        self.assertEqual(self._sent(), ['⚠️ Project deadline alert: Deadline soon (Project p2 is due 2024-05-05)'])
+
+        # p1 enters the window through the timer set for its day, without another change
+        self.now = datetime(2024, 5, 24, 0, 0)
+        self.engine.run_due()
+        self.assertEqual(self._sent()[-1], '⚠️ Project deadline alert: Deadline soon (Project p1 is due 2024-05-31)')
+        self.assertEqual(len(self._sent()), 2)
+
+    def test_notifications_with_a_time_wait_for_it(self):
+        self._task(1)
+        self.engine.add_rule('task_completion', 'Done', 'C1', at='14:00')
+        self._task(1, status='Completed')
+        self.assertEqual(self._sent(), [])
+        self.now = datetime(2024, 5, 1, 14, 0)
+        self.engine.run_due()
+        self.assertEqual(self._sent(), ['🎉 Smart notification: Done'])
+
+    def test_rules_survive_a_restart_and_can_be_removed(self):
+        self._task(1)
+        rule_id = self.engine.add_rule('task_completion', 'Done', 'C1', user_id='U1')
+        self._stop_listening(self.engine)
+        data_manager.close_storage()
+        data_manager.load_data()
+        restarted = self._listening(RuleEngine(client=self.client, clock=lambda: self.now))
+        restarted.restore(data_manager.current_store())
+
+        self.assertFalse(restarted.remove_rule(rule_id, user_id='U2'))
+        self._task(1, status='Completed')
+        self.assertEqual(self._sent().count('🎉 Smart notification: Done'), 1)
+        self.assertTrue(restarted.remove_rule(rule_id, user_id='U1'))
+        self.assertEqual(restarted.rules(), {})
+
+    def _restoring(self, engine):
+        data_manager.add_load_listener(engine.restore)
+        self.addCleanup(data_manager._load_listeners.remove, engine.restore)
+        return engine
+
+    def test_deadline_timers_are_kept_per_tenant_across_eviction(self):
+        self._team_tenancy()
+        self._restoring(self.engine)
+
+        for team, deadline in (('T1', '2024-05-31'), ('T2', '2024-06-30')):
+            with data_manager.use_tenant(team):
+                self.engine.add_rule('project_deadline', f'{team} deadline', 'C1', team_id=team)
+                self._project('p1', deadline)
+        self.assertIsNotNone(self.engine.scheduler.get_job(('deadline', 'T1', 'p1')))
+        self.assertIsNotNone(self.engine.scheduler.get_job(('deadline', 'T2', 'p1')))
+
+        self.assertEqual(data_manager.evict_idle_tenants(0), 2)
+        self.now = datetime(2024, 5, 24, 0, 0)
+        self.engine.run_due()
+        self.assertEqual(self._sent(), ['⚠️ Project deadline alert: T1 deadline (Project p1 is due 2024-05-31)'])
+        self.assertEqual(data_manager.loaded_tenants(), ['T1'])
+
+    def test_deadline_timers_of_every_tenant_are_set_after_a_restart(self):
+        self._team_tenancy()
+        with data_manager.use_tenant('T1'):
+            self.engine.add_rule('project_deadline', 'Deadline soon', 'C1', team_id='T1')
+            self._project('p1', '2024-05-31')
+            self._project('p2', '2024-05-03')
+        self._stop_listening(self.engine)
+        data_manager.close_storage()
+
+        restarted = self._restoring(self._listening(RuleEngine(client=self.client, clock=lambda: self.now)))
+        restarted.restore_tenants()
+        self.assertEqual(data_manager.loaded_tenants(), [])
+        self.assertEqual([job.id for job in restarted.scheduler.get_jobs()], [('deadline', 'T1', 'p1')])
+        self.now = datetime(2024, 5, 24, 0, 0)
+        restarted.run_due()
+        self.assertEqual(self._sent()[-1], '⚠️ Project deadline alert: Deadline soon (Project p1 is due 2024-05-31)')
+
+    def test_changes_cost_nothing_without_rules(self):
+        for task_id in range(20):
+            self._task(task_id)
+        self.assertEqual(self.engine.stats['changes'], 0)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,46 @@
+import json
+import os
+from itertools import islice
+
+# Slack accepts at most 50 blocks per message and 3000 characters per section
+MAX_BLOCKS = 50
+MAX_SECTION_TEXT = 3000
+# Leaves room for the header, divider and next page button
+MAX_PAGE_SIZE = MAX_BLOCKS - 3
+LIST_PAGE_SIZE = min(int(os.environ.get('LIST_PAGE_SIZE', '20')), MAX_PAGE_SIZE)
+
+def section(text):
+    if len(text) > MAX_SECTION_TEXT:
+        text = text[:MAX_SECTION_TEXT - 1] + '…'
+    return {'type': 'section', 'text': {'type': 'mrkdwn', 'text': text}}
+
+def next_page_button(action_id, cursor):
+    """An actions block whose button sends cursor back to the interactivity endpoint"""
+    return {
+        'type': 'actions',
+        'elements': [{
+            'type': 'button',
+            'text': {'type': 'plain_text', 'text': 'Next page ▶'},
+            'action_id': action_id,
+            'value': encode_cursor(cursor)
+        }]
+    }
+
+def encode_cursor(cursor):
+    return json.dumps(cursor, separators=(',', ':'))
+
+def decode_cursor(value):
+    return json.loads(value)
+
+def page_blocks(header, item_blocks, next_action=None, next_cursor=None):
+    """Yield one page of blocks: the header, each item block as it is rendered, and a
+    next page button when next_cursor is given"""
+    yield section(header)
+    yield {'type': 'divider'}
+    yield from item_blocks
+    if next_cursor is not None:
+        yield next_page_button(next_action, next_cursor)
+
+def page_message(header, blocks):
+    """A command reply holding at most MAX_BLOCKS blocks, with the header as notification text"""
+    return {'response_type': 'ephemeral', 'text': header, 'blocks': list(islice(blocks, MAX_BLOCKS))}
@@ -1,64 +1,1088 @@
-import json
+import atexit
+import contextvars
+import logging
 import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
 from typing import Dict, Any
-from datetime import datetime
+from datetime import datetime, date
+
+from utils import serialization, sqlite_storage
+from utils.task import Task
+from utils.task_index import TaskIndex
+from utils.task_stats import TaskStats, ProjectStats
 
 DATA_FILE = 'bot_data.json'
+JOURNAL_FILE = 'bot_data.journal'
+COMPACTING_FILE = 'bot_data.journal.compacting'
+SQLITE_FILE = 'bot_data.sqlite3'
+SHARD_DIR = 'bot_data'
 
-tasks = {}
-task_counter = 1
-reminders = {}
-notifications = {}
-project_summaries = {}
-team_members = {}
-project_analytics = {}
-file_links = {}
-team_stats = {}
-user_roles = {}
+STORAGE_MODES = ('json', 'journal', 'sqlite', 'sharded')
+# 'json' rewrites DATA_FILE on every save, 'journal' appends one record per change,
+# 'sqlite' writes each change to SQLITE_FILE and answers task queries from its indexes,
+# 'sharded' keeps one file per collection in SHARD_DIR, loaded on first access
+STORAGE_MODE = os.environ.get('STORAGE_MODE', 'json')
+# Encoding of DATA_FILE and shard files: 'json', 'orjson' or 'msgpack', detected again on load
+SNAPSHOT_FORMAT = os.environ.get('SNAPSHOT_FORMAT', 'json')
+JOURNAL_COMPACT_THRESHOLD = int(os.environ.get('JOURNAL_COMPACT_THRESHOLD', '1000'))
+# Cross-check the running report counters against a full recount on every read
+VERIFY_AGGREGATES = os.environ.get('VERIFY_AGGREGATES', 'false').lower() == 'true'
 
-def load_data():
-    """Load data from JSON file"""
-    global tasks, task_counter, reminders, notifications, project_summaries, team_members, project_analytics, file_links, team_stats, user_roles
+# In json and sharded mode, defer snapshot writes to a background flusher that coalesces
+# every change made within FLUSH_INTERVAL seconds (or FLUSH_MAX_PENDING changes)
+WRITE_BEHIND = os.environ.get('WRITE_BEHIND', 'false').lower() == 'true'
+FLUSH_INTERVAL = float(os.environ.get('FLUSH_INTERVAL', '1.0'))
+FLUSH_MAX_PENDING = int(os.environ.get('FLUSH_MAX_PENDING', '100'))
+
+# Give each Slack workspace ('team'), channel ('channel') or both ('team_channel') its own
+# store in TENANT_DIR, loaded on first use and dropped after TENANT_IDLE_SECONDS unused
+TENANCY = os.environ.get('TENANCY', 'none')
+TENANT_DIR = 'tenants'
+TENANT_IDLE_SECONDS = float(os.environ.get('TENANT_IDLE_SECONDS', '600'))
+
+COLLECTIONS = (
+    'tasks', 'reminders', 'notifications', 'project_summaries', 'team_members',
+    'project_analytics', 'file_links', 'team_stats', 'user_roles'
+)
+
+class LazyCollection(dict):
+    """A dict that fills itself from a loader the first time it is accessed.
+
+    Writes hold the collection's lock. Iteration goes over a shallow copy taken
+    under the lock and shared by every reader until the next write, so readers
+    never block each other and never see the dict change size under them.
+    Hold lock while changing several fields of one record to keep saves from
+    seeing half of the change.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._loader = None
+        self._load_lock = threading.Lock()
+        self.lock = threading.RLock()
+        self._snapshot = None
+
+    @property
+    def loaded(self):
+        return self._loader is None
+
+    def reset(self, items=None, loader=None):
+        """Replace the contents with items, or defer them to loader() until first access"""
+        with self._load_lock, self.lock:
+            dict.clear(self)
+            if items:
+                dict.update(self, items)
+            self._loader = loader
+            self._snapshot = None
+
+    def _ensure_loaded(self):
+        if self._loader is not None:
+            with self._load_lock:
+                if self._loader is not None:
+                    items = self._loader()
+                    with self.lock:
+                        dict.update(self, items)
+                        self._snapshot = None
+                    self._loader = None
+
+    def snapshot(self):
+        """The contents as of the last write, a shallow copy that must not be modified"""
+        self._ensure_loaded()
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self.lock:
+                snapshot = self._snapshot
+                if snapshot is None:
+                    snapshot = self._snapshot = dict(dict.items(self))
+        return snapshot
+
+    def records(self):
+        """A copy of the contents and of each record in it, taken under the lock, for saving"""
+        self._ensure_loaded()
+        with self.lock:
+            return {key: _copy_record(value) for key, value in dict.items(self)}
+
+    def record(self, key, default=None):
+        """A copy of one record taken under the lock, default if there is none"""
+        self._ensure_loaded()
+        with self.lock:
+            if not dict.__contains__(self, key):
+                return default
+            return _copy_record(dict.__getitem__(self, key))
+
+    def __getitem__(self, key):
+        self._ensure_loaded()
+        return dict.__getitem__(self, key)
+
+    def __setitem__(self, key, value):
+        self._ensure_loaded()
+        with self.lock:
+            dict.__setitem__(self, key, value)
+            self._snapshot = None
+
+    def __delitem__(self, key):
+        self._ensure_loaded()
+        with self.lock:
+            dict.__delitem__(self, key)
+            self._snapshot = None
+
+    def __contains__(self, key):
+        self._ensure_loaded()
+        return dict.__contains__(self, key)
+
+    def __iter__(self):
+        return iter(self.snapshot())
+
+    def __len__(self):
+        self._ensure_loaded()
+        return dict.__len__(self)
+
+    def __eq__(self, other):
+        return self.snapshot() == other
+
+    def __ne__(self, other):
+        return self.snapshot() != other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self.snapshot())
+
+    def keys(self):
+        return self.snapshot().keys()
+
+    def values(self):
+        return self.snapshot().values()
+
+    def items(self):
+        return self.snapshot().items()
+
+    def get(self, key, default=None):
+        self._ensure_loaded()
+        return dict.get(self, key, default)
+
+    def pop(self, *args):
+        self._ensure_loaded()
+        with self.lock:
+            self._snapshot = None
+            return dict.pop(self, *args)
+
+    def popitem(self):
+        self._ensure_loaded()
+        with self.lock:
+            self._snapshot = None
+            return dict.popitem(self)
+
+    def setdefault(self, key, default=None):
+        self._ensure_loaded()
+        with self.lock:
+            self._snapshot = None
+            return dict.setdefault(self, key, default)
+
+    def update(self, *args, **kwargs):
+        self._ensure_loaded()
+        with self.lock:
+            dict.update(self, *args, **kwargs)
+            self._snapshot = None
+
+    def copy(self):
+        return dict(self.snapshot())
+
+    def clear(self):
+        self.reset()
+
+def _copy_record(value):
+    if type(value) is dict:
+        return dict(value)
+    if isinstance(value, Task):
+        return value.copy()
+    return value
+
+_MISSING = object()
+
+def _empty_state():
+    state = {name: {} for name in COLLECTIONS}
+    state['task_counter'] = 1
+    return state
+
+
+def _atomic_write(path, data):
+    tmp_file = path + '.tmp'
+    with open(tmp_file, 'wb') as f:
+        f.write(serialization.encode(data, SNAPSHOT_FORMAT))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, path)
+    if hasattr(os, 'O_DIRECTORY'):
+        dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def _replay(state, path):
+    """Apply journal records from path onto state, returns (records applied, valid bytes)"""
+    applied = 0
+    valid_bytes = 0
     try:
-        with open(DATA_FILE, 'r') as f:
-            data = json.load(f)
-            tasks = data.get('tasks', {})
-            task_counter = data.get('task_counter', 1)
-            reminders = data.get('reminders', {})
-            notifications = data.get('notifications', {})
-            project_summaries = data.get('project_summaries', {})
-            team_members = data.get('team_members', {})
-            project_analytics = data.get('project_analytics', {})
-            file_links = data.get('file_links', {})
-            team_stats = data.get('team_stats', {})
-            user_roles = data.get('user_roles', {})
+        f = open(path, 'rb')
     except FileNotFoundError:
-        pass
-
-def save_data():
-    """Save data to JSON file"""
-    data = {
-        'tasks': tasks,
-        'task_counter': task_counter,
-        'reminders': reminders,
-        'notifications': notifications,
-        'project_summaries': project_summaries,
-        'team_members': team_members,
-        'project_analytics': project_analytics,
-        'file_links': file_links,
-        'team_stats': team_stats,
-        'user_roles': user_roles
+        return applied, valid_bytes
+    with f:
+        for line in f:
+            try:
+                if not line.endswith(b'\n'):
+                    raise ValueError('unterminated record')
+                record = serialization.loads_json(line)
+            except ValueError:
+                # A torn final record from a crash mid-append
+                break
+            collection = state[record['c']]
+            if 'k' not in record:
+                collection.clear()
+                collection.update(record['v'])
+            elif record.get('d'):
+                collection.pop(record['k'], None)
+                collection.pop(str(record['k']), None)
+            else:
+                collection.pop(str(record['k']), None)
+                collection[record['k']] = record['v']
+            state['task_counter'] = record['n']
+            applied += 1
+            valid_bytes += len(line)
+    return applied, valid_bytes
+
+
+def _task_records(items):
+    # JSON object keys are always strings, task ids are ints everywhere else
+    return {int(task_id): Task.from_dict(task) for task_id, task in items.items()}
+
+
+def _upgrade_reminders(items):
+    """Older files stored reminder times with str(), turn those back into datetimes"""
+    for reminder in items.values():
+        if isinstance(reminder, dict) and isinstance(reminder.get('time'), str):
+            try:
+                reminder['time'] = datetime.fromisoformat(reminder['time'])
+            except ValueError:
+                pass
+    return items
+
+
+def _decoded(name, items):
+    """A collection as read from a file, with its records as the rest of the bot expects them"""
+    if name == 'tasks':
+        return _task_records(items)
+    if name == 'reminders':
+        return _upgrade_reminders(items)
+    return items
+
+
+class Store:
+    """One set of collections, counters and data files. The default store uses the
+    configured file names, each tenant store keeps the same files in its own directory"""
+
+    def __init__(self, root=None, key=None):
+        self.root = root
+        # The tenant_key() of a tenant store, None for the default store
+        self.key = key
+        self.collections = {name: LazyCollection() for name in COLLECTIONS}
+        self.task_counter = 1
+        self.users = 0
+        self.last_used = time.monotonic()
+        self._loaded = False
+        self._load_lock = threading.Lock()
+        self._journal_lock = threading.Lock()
+        self._journal_handle = None
+        self._journal_records = 0
+        self._compaction_thread = None
+        self._sqlite_lock = threading.Lock()
+        self._sqlite_conn = None
+        self._sqlite_path = None
+        self._flush_condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._flusher_thread = None
+        self._dirty = set()
+        self._pending_changes = 0
+        self._closed = False
+        self._shard_lock = threading.Lock()
+        self._saved_task_counter = None
+        self._counter_lock = threading.Lock()
+        # Guards the task index and the running task and project counters
+        self._index_lock = threading.RLock()
+        self._task_index = TaskIndex()
+        self._task_stats = TaskStats()
+        self._task_index_valid = False
+        self._project_stats = ProjectStats()
+        self._project_stats_valid = False
+
+    def _path(self, configured):
+        if self.root is None:
+            return configured
+        return os.path.join(self.root, os.path.basename(configured))
+
+    @property
+    def data_file(self):
+        return self._path(DATA_FILE)
+
+    @property
+    def journal_file(self):
+        return self._path(JOURNAL_FILE)
+
+    @property
+    def compacting_file(self):
+        return self._path(COMPACTING_FILE)
+
+    @property
+    def sqlite_file(self):
+        return self._path(SQLITE_FILE)
+
+    @property
+    def shard_dir(self):
+        return self._path(SHARD_DIR)
+
+    def _read_snapshot(self):
+        state = _empty_state()
+        try:
+            with open(self.data_file, 'rb') as f:
+                data = serialization.decode(f.read())
+        except FileNotFoundError:
+            return state
+        for name in COLLECTIONS:
+            state[name] = data.get(name, {})
+        state['task_counter'] = data.get('task_counter', 1)
+        return state
+
+    def _write_snapshot(self, state):
+        """Write state to the data file atomically so a crash never leaves it truncated"""
+        _atomic_write(self.data_file, state)
+
+    def _compact(self):
+        state = self._read_snapshot()
+        _replay(state, self.compacting_file)
+        self._write_snapshot(state)
+        os.remove(self.compacting_file)
+
+    def _start_compaction(self):
+        """Rotate the journal aside and fold it into the snapshot in the background"""
+        if self._compaction_thread and self._compaction_thread.is_alive():
+            return
+        if os.path.exists(self.compacting_file):
+            # Left by a compaction that crashed or failed. Its records are older than the
+            # journal's and not in the snapshot yet, fold them in before it is replaced
+            try:
+                self._compact()
+            except OSError:
+                logging.getLogger(__name__).exception("Could not fold the leftover compacting journal into the snapshot")
+                return
+        if self._journal_handle:
+            self._journal_handle.close()
+            self._journal_handle = None
+        os.replace(self.journal_file, self.compacting_file)
+        self._journal_records = 0
+        self._compaction_thread = threading.Thread(target=self._compact, daemon=True)
+        self._compaction_thread.start()
+
+    def wait_for_compaction(self):
+        """Block until a running background compaction has finished"""
+        if self._compaction_thread:
+            self._compaction_thread.join()
+
+    def _journal_line(self, collection, key):
+        data = self.collections[collection]
+        record = {'c': collection, 'n': self.task_counter}
+        if key is None:
+            record['v'] = data.records()
+        else:
+            value = data.record(key, _MISSING)
+            record['k'] = key
+            if value is _MISSING:
+                record['d'] = True
+            else:
+                record['v'] = value
+        return serialization.dumps_json(record) + '\n'
+
+    def _append_journal(self, changes):
+        # Read under the journal lock so records of the same key are appended in the
+        # order their values were read, and the last one holds the latest value
+        with self._journal_lock:
+            lines = [self._journal_line(collection, key) for collection, key in changes]
+            if self._journal_handle is None:
+                self._journal_handle = open(self.journal_file, 'a')
+            self._journal_handle.write(''.join(lines))
+            self._journal_handle.flush()
+            self._journal_records += len(lines)
+            if self._journal_records >= JOURNAL_COMPACT_THRESHOLD:
+                self._start_compaction()
+
+    def _sqlite(self):
+        path = self.sqlite_file
+        if self._sqlite_conn is None or self._sqlite_path != path:
+            if self._sqlite_conn is not None:
+                self._sqlite_conn.close()
+            self._sqlite_conn = sqlite_storage.connect(path)
+            self._sqlite_path = path
+        return self._sqlite_conn
+
+    def close(self):
+        """Flush pending changes and close open journal and database handles"""
+        self.flush()
+        with self._flush_condition:
+            self._closed = True
+            self._flush_condition.notify()
+        self.wait_for_compaction()
+        with self._journal_lock:
+            if self._journal_handle:
+                self._journal_handle.close()
+                self._journal_handle = None
+        with self._sqlite_lock:
+            if self._sqlite_conn is not None:
+                self._sqlite_conn.close()
+                self._sqlite_conn = None
+                self._sqlite_path = None
+
+    def _shard_path(self, name):
+        return os.path.join(self.shard_dir, f'{name}.json')
+
+    def _read_shard(self, name):
+        try:
+            with open(self._shard_path(name), 'rb') as f:
+                data = serialization.decode(f.read())
+        except FileNotFoundError:
+            return {}
+        return _decoded(name, data)
+
+    def _shard_loader(self, name):
+        return lambda: self._read_shard(name)
+
+    def _load_shards(self):
+        """Point every collection at its shard file without reading it, only the counter is read now"""
+        for name, collection in self.collections.items():
+            collection.reset(loader=self._shard_loader(name))
+        try:
+            with open(self._shard_path('meta'), 'rb') as f:
+                self.task_counter = serialization.decode(f.read()).get('task_counter', 1)
+        except FileNotFoundError:
+            self.task_counter = 1
+        self._saved_task_counter = self.task_counter
+
+    def _save_shards(self, names):
+        """Write the shard file of each named collection, plus the counter if it moved"""
+        with self._shard_lock:
+            os.makedirs(self.shard_dir, exist_ok=True)
+            for name in names:
+                if self.collections[name].loaded:
+                    _atomic_write(self._shard_path(name), self.collections[name].records())
+            if self.task_counter != self._saved_task_counter:
+                _atomic_write(self._shard_path('meta'), {'task_counter': self.task_counter})
+                self._saved_task_counter = self.task_counter
+
+    def read_collection(self, name):
+        """One collection's records straight from the data files, without loading the store"""
+        if STORAGE_MODE == 'sharded':
+            return self._read_shard(name)
+        if STORAGE_MODE == 'sqlite':
+            with self._sqlite_lock:
+                return _decoded(name, sqlite_storage.load_collection(self._sqlite(), name))
+        state = self._read_snapshot()
+        _replay(state, self.compacting_file)
+        _replay(state, self.journal_file)
+        return _decoded(name, state[name])
+
+    def _load_state(self):
+        if STORAGE_MODE == 'sqlite':
+            with self._sqlite_lock:
+                return sqlite_storage.load(self._sqlite(), COLLECTIONS)
+        return self._load_journaled_state()
+
+    def _load_journaled_state(self):
+        self.wait_for_compaction()
+        if self._journal_handle:
+            self._journal_handle.close()
+            self._journal_handle = None
+        state = self._read_snapshot()
+        _replay(state, self.compacting_file)
+        self._journal_records, valid_bytes = _replay(state, self.journal_file)
+        if os.path.exists(self.journal_file) and os.path.getsize(self.journal_file) > valid_bytes:
+            # Drop the torn tail so new appends start on a record boundary
+            os.truncate(self.journal_file, valid_bytes)
+        return state
+
+    def load(self):
+        """Load data from the configured storage, replaying any journal on top of the JSON snapshot"""
+        self._loaded = True
+        self._task_index_valid = False
+        self._project_stats_valid = False
+        if self.root is not None:
+            os.makedirs(self.root, exist_ok=True)
+        if STORAGE_MODE == 'sharded':
+            self._load_shards()
+        else:
+            self._load_collections()
+        for listener in _load_listeners:
+            listener(self)
+
+    def _load_collections(self):
+        state = self._load_state()
+
+        state['tasks'] = _task_records(state['tasks'])
+        _upgrade_reminders(state['reminders'])
+        for name, collection in self.collections.items():
+            collection.reset(state[name])
+        self.task_counter = state['task_counter']
+
+        if STORAGE_MODE != 'sqlite' and os.path.exists(self.compacting_file):
+            with self._journal_lock:
+                self._compaction_thread = threading.Thread(target=self._compact, daemon=True)
+                self._compaction_thread.start()
+
+    def ensure_loaded(self):
+        """Load the store the first time a request uses it"""
+        if not self._loaded:
+            with self._load_lock:
+                if not self._loaded:
+                    self.load()
+
+    def save(self, collection=None, key=None):
+        """Save data, pass the changed collection and key to journal just that record"""
+        self._on_change(collection, key)
+        self.save_batch([(collection, key)])
+
+    def save_batch(self, changes):
+        """Persist (collection, key) changes that are already in the indexes with one write:
+        one journal append, one transaction, or one snapshot or shard file per collection"""
+        changes = list(dict.fromkeys(changes))
+        if not changes:
+            return
+        whole_store = any(collection is None for collection, _ in changes)
+        if STORAGE_MODE == 'journal' and not whole_store:
+            self._append_journal(changes)
+            return
+        if STORAGE_MODE == 'sqlite':
+            self._save_sqlite(None if whole_store else changes)
+            return
+        if WRITE_BEHIND and STORAGE_MODE in ('json', 'sharded') and not whole_store:
+            for collection in dict.fromkeys(collection for collection, _ in changes):
+                self._mark_dirty(collection)
+            return
+        if STORAGE_MODE == 'sharded':
+            self._save_shards(COLLECTIONS if whole_store else list(dict.fromkeys(c for c, _ in changes)))
+            return
+        self._save_snapshot()
+
+    def _save_snapshot(self):
+        with self._journal_lock:
+            self.wait_for_compaction()
+            data = {name: collection.records() for name, collection in self.collections.items()}
+            data['task_counter'] = self.task_counter
+            self._write_snapshot(data)
+            if self._journal_handle:
+                self._journal_handle.close()
+                self._journal_handle = None
+            if os.path.exists(self.journal_file):
+                os.remove(self.journal_file)
+            self._journal_records = 0
+
+    def _mark_dirty(self, collection):
+        with self._flush_condition:
+            self._dirty.add(collection)
+            self._pending_changes += 1
+            self._closed = False
+            if self._flusher_thread is None or not self._flusher_thread.is_alive():
+                self._flusher_thread = threading.Thread(target=self._run_flusher, daemon=True)
+                self._flusher_thread.start()
+            self._flush_condition.notify()
+
+    def _run_flusher(self):
+        while True:
+            with self._flush_condition:
+                while not self._dirty:
+                    if self._closed:
+                        return
+                    self._flush_condition.wait()
+                deadline = time.monotonic() + FLUSH_INTERVAL
+                while self._dirty and self._pending_changes < FLUSH_MAX_PENDING:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._flush_condition.wait(remaining)
+            self.flush()
+
+    def flush(self):
+        """Write any changes still pending in write-behind mode, returns True if a write happened"""
+        with self._flush_lock:
+            with self._flush_condition:
+                if not self._dirty:
+                    return False
+                dirty = set(self._dirty)
+                self._dirty.clear()
+                self._pending_changes = 0
+            try:
+                if STORAGE_MODE == 'sharded':
+                    self._save_shards(dirty)
+                else:
+                    self._save_snapshot()
+            except Exception:
+                with self._flush_condition:
+                    self._dirty.update(dirty)
+                raise
+            return True
+
+    def _save_sqlite(self, changes):
+        """Write the (collection, key) changes in one transaction, or the whole store when changes is None"""
+        with self._sqlite_lock:
+            if changes is None:
+                state = {name: data.records() for name, data in self.collections.items()}
+                state['task_counter'] = self.task_counter
+                sqlite_storage.write_state(self._sqlite(), state, COLLECTIONS)
+                return
+            records = []
+            for collection, key in changes:
+                data = self.collections[collection]
+                if key is None:
+                    records.append((collection, None, data.records(), False))
+                    continue
+                value = data.record(key, _MISSING)
+                if value is _MISSING:
+                    records.append((collection, key, None, True))
+                else:
+                    records.append((collection, key, value, False))
+            sqlite_storage.write_records(self._sqlite(), records, self.task_counter)
+
+    def _on_change(self, collection, key):
+        """Keep in-memory indexes and counters in step with a change that is about to be saved"""
+        with self._index_lock:
+            self._apply_change(collection, key)
+        for listener in _change_listeners:
+            listener(self, collection, key)
+
+    def _apply_change(self, collection, key):
+        if collection == 'tasks' and self._task_index_valid:
+            if key is None:
+                self._task_index_valid = False
+            else:
+                task = self.collections['tasks'].get(key)
+                self._task_index.update(key, task)
+                self._task_stats.update(key, task)
+        elif collection == 'project_summaries' and self._project_stats_valid:
+            if key is None:
+                self._project_stats_valid = False
+            else:
+                self._project_stats.update(key, self.collections['project_summaries'].get(key))
+
+    def _ensure_task_index(self):
+        # Callers hold _index_lock
+        if not self._task_index_valid:
+            self._task_index.rebuild(self.collections['tasks'])
+            self._task_stats.rebuild(self.collections['tasks'])
+            self._task_index_valid = True
+        return self._task_index
+
+    def _ensure_project_stats(self):
+        if not self._project_stats_valid:
+            self._project_stats.rebuild(self.collections['project_summaries'])
+            self._project_stats_valid = True
+        return self._project_stats
+
+    def verify_aggregates(self):
+        """Recount tasks and projects from scratch and return the names of any running counters that drifted"""
+        with self._index_lock:
+            self._ensure_task_index()
+            self._ensure_project_stats()
+            fresh_tasks = TaskStats()
+            fresh_tasks.rebuild(self.collections['tasks'])
+            fresh_projects = ProjectStats()
+            fresh_projects.rebuild(self.collections['project_summaries'])
+            return ([f'tasks.{name}' for name in self._task_stats.differences(fresh_tasks)]
+                    + [f'projects.{name}' for name in self._project_stats.differences(fresh_projects)])
+
+    def _counters(self):
+        # Callers hold _index_lock while they read the returned counters
+        if VERIFY_AGGREGATES:
+            drifted = self.verify_aggregates()
+            if drifted:
+                logging.getLogger(__name__).error(f"Report counters drifted from a full recount: {', '.join(drifted)}")
+                self._task_index_valid = False
+                self._project_stats_valid = False
+        self._ensure_task_index()
+        return self._task_stats, self._ensure_project_stats()
+
+    def _query_sqlite(self):
+        """Whether task queries go to SQLite. Not while the current batch() holds back task
+        changes of this store, the in-memory index already has them and the file doesn't"""
+        if STORAGE_MODE != 'sqlite':
+            return False
+        changes = _batch.get()
+        return not changes or not any(store is self and collection in ('tasks', None) for store, collection, _ in changes)
+
+    def find_tasks(self, status=None, priority=None, category=None, assigned_to=None, overdue=False,
+                   after=None, limit=None):
+        tasks = self.collections['tasks']
+        if self._query_sqlite():
+            with self._sqlite_lock:
+                ids = sqlite_storage.task_ids(
+                    self._sqlite(), limit=limit, after_id=after,
+                    **_sqlite_filters(status, priority, category, assigned_to, overdue)
+                )
+            return {task_id: tasks[task_id] for task_id in ids if task_id in tasks}
+        with self._index_lock:
+            ids = self._ensure_task_index().ids(
+                status=status, priority=priority, category=category, assigned_to=assigned_to,
+                overdue_before=date.today() if overdue else None, after=after, limit=limit
+            )
+        return {task_id: tasks[task_id] for task_id in ids if task_id in tasks}
+
+    def next_task_id(self):
+        """Hand out the next task id, never the same one to two callers"""
+        with self._counter_lock:
+            task_id = self.task_counter
+            self.task_counter += 1
+            return task_id
+
+    def find_overdue_tasks(self, limit=None):
+        tasks = self.collections['tasks']
+        if self._query_sqlite():
+            with self._sqlite_lock:
+                ids = sqlite_storage.task_ids(self._sqlite(), limit=limit, **_sqlite_filters(None, None, None, None, True))
+        else:
+            with self._index_lock:
+                ids = self._ensure_task_index().overdue(date.today(), limit)
+        return {task_id: tasks[task_id] for task_id in ids if task_id in tasks}
+
+    def count_tasks(self, status=None, priority=None, category=None, assigned_to=None, overdue=False):
+        if not overdue and not category and not (priority and (status or assigned_to)):
+            with self._index_lock:
+                task_stats, _ = self._counters()
+                return task_stats.count(status=status, priority=priority, assigned_to=assigned_to)
+        if self._query_sqlite():
+            with self._sqlite_lock:
+                return sqlite_storage.count_tasks(self._sqlite(), **_sqlite_filters(status, priority, category, assigned_to, overdue))
+        with self._index_lock:
+            return self._ensure_task_index().count(
+                status=status, priority=priority, category=category, assigned_to=assigned_to,
+                overdue_before=date.today() if overdue else None
+            )
+
+    def count_tasks_by(self, field):
+        if field == 'priority':
+            with self._index_lock:
+                task_stats, _ = self._counters()
+                return dict(task_stats.by_priority)
+        if self._query_sqlite():
+            with self._sqlite_lock:
+                return sqlite_storage.count_tasks_by(self._sqlite(), field)
+        counts = {}
+        for task in self.collections['tasks'].values():
+            value = task.get(field)
+            counts[value] = counts.get(value, 0) + 1
+        return counts
+
+class TenantCollection(dict):
+    """Stands in for one collection of whichever store the current request is using,
+    so modules can keep importing collections by name"""
+
+    def __init__(self, name):
+        super().__init__()
+        self.name = name
+
+    def _target(self):
+        return current_store().collections[self.name]
+
+    @property
+    def loaded(self):
+        return self._target().loaded
+
+    @property
+    def lock(self):
+        return self._target().lock
+
+    __hash__ = None
+
+def _delegate(method):
+    def call(self, *args, **kwargs):
+        return getattr(self._target(), method)(*args, **kwargs)
+    call.__name__ = method
+    return call
+
+for _method in (
+    '__getitem__', '__setitem__', '__delitem__', '__contains__', '__iter__', '__len__',
+    '__eq__', '__ne__', '__repr__', 'keys', 'values', 'items', 'get', 'pop', 'popitem',
+    'setdefault', 'update', 'copy', 'clear', 'reset', 'snapshot', 'records', 'record'
+):
+    setattr(TenantCollection, _method, _delegate(_method))
+
+tasks = TenantCollection('tasks')
+reminders = TenantCollection('reminders')
+notifications = TenantCollection('notifications')
+project_summaries = TenantCollection('project_summaries')
+team_members = TenantCollection('team_members')
+project_analytics = TenantCollection('project_analytics')
+file_links = TenantCollection('file_links')
+team_stats = TenantCollection('team_stats')
+user_roles = TenantCollection('user_roles')
+
+# Called with each store once it has loaded its data
+_load_listeners = []
+# Called with (store, collection, key) for every saved change, key is None for a whole collection
+_change_listeners = []
+
+_default_store = Store()
+_tenant_stores = {}
+_tenant_lock = threading.Lock()
+_last_eviction = time.monotonic()
+_current_store = contextvars.ContextVar('current_store', default=None)
+# The (store, collection, key) changes saved inside the innermost batch() block
+_batch = contextvars.ContextVar('batch', default=None)
+
+def current_store():
+    """The store of the tenant the current request belongs to, the default store outside of one.
+    The default store reads its data files the first time it is used"""
+    store = _current_store.get() or _default_store
+    if not store._loaded:
+        store.ensure_loaded()
+    return store
+
+def tenant_key(team_id=None, channel_id=None):
+    """Directory name of the tenant a team/channel maps to under TENANCY, None for the default store"""
+    if TENANCY == 'team':
+        parts = [team_id]
+    elif TENANCY == 'channel':
+        parts = [channel_id]
+    elif TENANCY == 'team_channel':
+        parts = [team_id, channel_id]
+    else:
+        return None
+    if not all(parts):
+        return None
+    return '-'.join(re.sub(r'[^A-Za-z0-9_]', '_', part) for part in parts)
+
+def use_tenant(team_id=None, channel_id=None):
+    """Route data_manager calls made inside the block to the tenant's store, loading it on first use"""
+    return use_tenant_key(tenant_key(team_id, channel_id))
+
+@contextmanager
+def use_tenant_key(key):
+    """use_tenant() for a tenant_key(), None for the default store"""
+    if key is None:
+        store = _default_store
+    else:
+        with _tenant_lock:
+            store = _tenant_stores.get(key)
+            if store is None:
+                store = _tenant_stores[key] = Store(os.path.join(TENANT_DIR, key), key)
+            store.users += 1
+        store.ensure_loaded()
+    token = _current_store.set(store)
+    try:
+        yield store
+    finally:
+        _current_store.reset(token)
+        if key is not None:
+            with _tenant_lock:
+                store.users -= 1
+                store.last_used = time.monotonic()
+            _maybe_evict()
+
+def _maybe_evict():
+    global _last_eviction
+    now = time.monotonic()
+    if now - _last_eviction >= min(TENANT_IDLE_SECONDS, 60):
+        _last_eviction = now
+        evict_idle_tenants()
+
+def evict_idle_tenants(idle_seconds=None):
+    """Flush and drop tenant stores no request has used for idle_seconds, returns how many"""
+    if idle_seconds is None:
+        idle_seconds = TENANT_IDLE_SECONDS
+    now = time.monotonic()
+    with _tenant_lock:
+        idle = [key for key, store in _tenant_stores.items()
+                if store.users == 0 and now - store.last_used >= idle_seconds]
+        # Closed while holding the lock so a returning tenant reloads only after the flush
+        for key in idle:
+            _tenant_stores.pop(key).close()
+    return len(idle)
+
+def loaded_tenants():
+    """Keys of the tenant stores currently held in memory"""
+    with _tenant_lock:
+        return sorted(_tenant_stores)
+
+def tenant_keys():
+    """Keys of every tenant, in memory or saved under TENANT_DIR"""
+    with _tenant_lock:
+        keys = set(_tenant_stores)
+    if os.path.isdir(TENANT_DIR):
+        keys.update(name for name in os.listdir(TENANT_DIR) if os.path.isdir(os.path.join(TENANT_DIR, name)))
+    return sorted(keys)
+
+def read_collection(key, name):
+    """{key: record} of one collection of a tenant, None for the default store. A store in
+    memory answers from there, any other is read from its files without being loaded, so
+    no load listeners run and the tenant isn't kept in memory"""
+    with _tenant_lock:
+        store = _default_store if key is None else _tenant_stores.get(key)
+    if store is not None and store._loaded:
+        return store.collections[name].records()
+    if store is not None:
+        return store.read_collection(name)
+    reader = Store(os.path.join(TENANT_DIR, key), key)
+    try:
+        return reader.read_collection(name)
+    finally:
+        reader.close()
+
+def _all_stores():
+    with _tenant_lock:
+        return [_default_store] + list(_tenant_stores.values())
+
+def wait_for_compaction():
+    """Block until a running background compaction has finished"""
+    current_store().wait_for_compaction()
+
+def close_storage():
+    """Close open journal and database handles, e.g. before moving data files"""
+    _default_store.close()
+    evict_idle_tenants(0)
+
+def add_load_listener(listener):
+    """Call listener(store) whenever a store, the default one or a tenant's, has loaded its data"""
+    _load_listeners.append(listener)
+
+def add_change_listener(listener):
+    """Call listener(store, collection, key) for every change passed to save_data(), as it is saved"""
+    _change_listeners.append(listener)
+
+def load_data():
+    """Load data from the configured storage, replaying any journal on top of the JSON snapshot"""
+    current_store().load()
+
+def save_data(collection=None, key=None):
+    """Save data, pass the changed collection and key to journal just that record"""
+    store = current_store()
+    changes = _batch.get()
+    if changes is not None:
+        store._on_change(collection, key)
+        changes.append((store, collection, key))
+        return
+    store.save(collection, key)
+
+@contextmanager
+def batch():
+    """Hold back the writes of save_data() calls made inside the block and persist them
+    all with one write when it ends, also when it ends with an exception. Indexes and
+    counters still follow each change as it is saved"""
+    if _batch.get() is not None:
+        yield
+        return
+    changes = []
+    token = _batch.set(changes)
+    try:
+        yield
+    finally:
+        _batch.reset(token)
+        by_store = {}
+        for store, collection, key in changes:
+            by_store.setdefault(store, []).append((collection, key))
+        for store, store_changes in by_store.items():
+            store.save_batch(store_changes)
+
+def flush():
+    """Write any changes still pending in write-behind mode, returns True if a write happened"""
+    return any([store.flush() for store in _all_stores()])
+
+atexit.register(flush)
+
+def verify_aggregates():
+    """Recount tasks and projects from scratch and return the names of any running counters that drifted"""
+    return current_store().verify_aggregates()
+
+def rebuild_task_index():
+    """Build a fresh index from every task, returns it without installing it"""
+    index = TaskIndex()
+    index.rebuild(tasks)
+    return index
+
+def find_tasks(status=None, priority=None, category=None, assigned_to=None, overdue=False, after=None, limit=None):
+    """Return {task_id: task} for tasks matching every given filter, overdue
+    matches are ordered by due date. Pass the last id seen as after, and a limit,
+    to fetch one page of the other queries"""
+    return current_store().find_tasks(status, priority, category, assigned_to, overdue, after, limit)
+
+def find_overdue_tasks(limit=None):
+    """Return {task_id: task} for the first limit open tasks past their due date, oldest first"""
+    return current_store().find_overdue_tasks(limit)
+
+def count_tasks(status=None, priority=None, category=None, assigned_to=None, overdue=False):
+    """Count tasks matching every given filter"""
+    return current_store().count_tasks(status, priority, category, assigned_to, overdue)
+
+def count_tasks_by(field):
+    """Return {value: count} of tasks grouped by field, e.g. 'priority'"""
+    return current_store().count_tasks_by(field)
+
+def get_task_hours():
+    """Return (completed hours, open hours), using actual hours for completed tasks where recorded"""
+    store = current_store()
+    with store._index_lock:
+        task_stats, _ = store._counters()
+        return task_stats.completed_hours, task_stats.open_hours
+
+def count_projects(status=None):
+    """Count projects, optionally only those with the given status"""
+    if status is None:
+        return len(project_summaries)
+    store = current_store()
+    with store._index_lock:
+        _, project_stats = store._counters()
+        return project_stats.count(status)
+
+def _sqlite_filters(status, priority, category, assigned_to, overdue):
+    return {
+        'status': status or None,
+        'priority': priority or None,
+        'category': category or None,
+        'assigned_to': assigned_to or None,
+        'overdue_before': date.today().isoformat() if overdue else None
     }
-    with open(DATA_FILE, 'w') as f:
-        json.dump(data, f, indent=2, default=str)
+
+def migrate(source, target):
+    """Copy all data from one storage mode to another"""
+    global STORAGE_MODE
+    if source not in STORAGE_MODES or target not in STORAGE_MODES:
+        raise ValueError(f"Storage mode must be one of: {', '.join(STORAGE_MODES)}")
+    original_mode = STORAGE_MODE
+    try:
+        STORAGE_MODE = source
+        load_data()
+        STORAGE_MODE = target
+        save_data()
+    finally:
+        STORAGE_MODE = original_mode
 
 def get_task_counter():
     """Get current task counter"""
-    global task_counter
-    return task_counter
+    return current_store().task_counter
 
 def increment_task_counter():
     """Increment task counter"""
-    global task_counter
-    task_counter += 1
-    return task_counter 
\ No newline at end of file
+    store = current_store()
+    with store._counter_lock:
+        store.task_counter += 1
+        return store.task_counter
+
+def next_task_id():
+    """Return the task counter and increment it in one step, so concurrent creates get distinct ids"""
+    return current_store().next_task_id()
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4 or sys.argv[1] != 'migrate':
+        print(f"Usage: python -m utils.data_manager migrate <{'|'.join(STORAGE_MODES)}> <{'|'.join(STORAGE_MODES)}>")
+        sys.exit(1)
+    migrate(sys.argv[2], sys.argv[3])
+    print(f"Migrated {len(tasks)} tasks from {sys.argv[2]} to {sys.argv[3]} storage")
@@ -0,0 +1,107 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+import requests
+from flask import request, copy_current_request_context, Response
+
+from utils.data_manager import use_tenant
+from utils.slack_requests import is_slack_request, is_response_url
+
+# Routes wrapped in deferred() answer Slack at once and post their real reply to the
+# command's response_url from a pool of DEFERRED_WORKERS threads. At most
+# DEFERRED_QUEUE_DEPTH commands may be queued or running, later ones are turned away.
+DEFERRED_COMMANDS = os.environ.get('DEFERRED_COMMANDS', 'true').lower() == 'true'
+DEFERRED_WORKERS = int(os.environ.get('DEFERRED_WORKERS', '4'))
+DEFERRED_QUEUE_DEPTH = int(os.environ.get('DEFERRED_QUEUE_DEPTH', '50'))
+RESPONSE_URL_TIMEOUT = 5
+
+ACK_TEXT = "⏳ Working on it..."
+BUSY_TEXT = "⚠️ The bot is busy right now, please try that again in a moment."
+
+_executor = None
+_executor_lock = threading.Lock()
+_in_flight = 0
+_in_flight_lock = threading.Lock()
+
+def _pool():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=DEFERRED_WORKERS, thread_name_prefix='deferred')
+        return _executor
+
+def _reserve():
+    global _in_flight
+    with _in_flight_lock:
+        if _in_flight >= DEFERRED_QUEUE_DEPTH:
+            return False
+        _in_flight += 1
+        return True
+
+def _release():
+    global _in_flight
+    with _in_flight_lock:
+        _in_flight -= 1
+
+def in_flight():
+    """Number of deferred commands queued or running"""
+    with _in_flight_lock:
+        return _in_flight
+
+def _payload(result):
+    """Turn whatever a route handler returned into a response_url message"""
+    if isinstance(result, tuple):
+        result = result[0]
+    if isinstance(result, str):
+        return {'response_type': 'ephemeral', 'text': result}
+    if result.is_json:
+        return result.get_json()
+    return {'response_type': 'ephemeral', 'text': result.get_data(as_text=True)}
+
+def _run(handler, response_url, team_id, channel_id):
+    try:
+        with use_tenant(team_id, channel_id):
+            payload = _payload(handler())
+        if not payload.get('text'):
+            return
+        requests.post(response_url, json=payload, timeout=RESPONSE_URL_TIMEOUT)
+    except Exception:
+        logging.getLogger(__name__).exception(f"Deferred command failed for {response_url}")
+    finally:
+        _release()
+
+def deferred(handler):
+    """Run a slash command route off the request thread and deliver its reply via response_url.
+    Only commands signed by Slack are queued, and only a Slack response_url gets the reply"""
+    @wraps(handler)
+    def route(*args, **kwargs):
+        # Keep the raw body for the signature check, parsing the form would consume it
+        request.get_data(cache=True)
+        if not DEFERRED_COMMANDS or not request.form.get('response_url'):
+            return handler(*args, **kwargs)
+        if not is_slack_request():
+            return Response(status=403)
+        response_url = request.form['response_url']
+        if not is_response_url(response_url):
+            return Response(status=400)
+        if not _reserve():
+            return BUSY_TEXT
+        task = copy_current_request_context(lambda: handler(*args, **kwargs))
+        try:
+            _pool().submit(_run, task, response_url, request.form.get('team_id'), request.form.get('channel_id'))
+        except RuntimeError:
+            _release()
+            raise
+        return ACK_TEXT
+    return route
+
+def wait_for_deferred():
+    """Shut the worker pool down after the queued commands finish, a new pool starts on next use"""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
@@ -0,0 +1,252 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+from slack_sdk.errors import SlackApiError
+
+# Slack allows about one message per second per channel, with short bursts
+DISPATCH_CHANNEL_RATE = float(os.environ.get('DISPATCH_CHANNEL_RATE', '1.0'))
+DISPATCH_CHANNEL_BURST = int(os.environ.get('DISPATCH_CHANNEL_BURST', '3'))
+DISPATCH_MAX_RETRIES = int(os.environ.get('DISPATCH_MAX_RETRIES', '5'))
+DISPATCH_MAX_BACKOFF = float(os.environ.get('DISPATCH_MAX_BACKOFF', '30'))
+# Threads sending at once, each to a different channel
+DISPATCH_SENDERS = int(os.environ.get('DISPATCH_SENDERS', '4'))
+# Channels with a rate limit bucket before idle ones are forgotten
+_PRUNE_CHANNELS = 1024
+
+class TokenBucket:
+    """Allows rate sends per second on average and up to capacity at once"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now):
+        """Seconds until a token is available, 0 if one is available now"""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def full(self, now):
+        """Whether it has refilled to capacity, so a new bucket would behave the same"""
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+class _Message:
+    __slots__ = ('kwargs', 'future', 'attempts')
+
+    def __init__(self, kwargs):
+        self.kwargs = kwargs
+        self.future = Future()
+        self.attempts = 0
+
+def _retry_after(error):
+    """Seconds Slack asked us to wait for a rate limited call, None for any other error"""
+    response = error.response
+    if getattr(response, 'status_code', None) != 429 and response.get('error') != 'ratelimited':
+        return None
+    try:
+        return float(response.headers.get('Retry-After', 1))
+    except (TypeError, ValueError):
+        return 1.0
+
+def log_failure(sent, channel, context):
+    """Log, with its channel and what it was for, a message the dispatcher gives up on.
+    The dispatcher doesn't log dropped messages itself, so this is the one place they are.
+    sent is what chat_postMessage returned. Anything but a Future, such as a plain
+    WebClient's response, has already been sent and is left alone. Returns sent"""
+    if isinstance(sent, Future):
+        def done(future):
+            error = future.exception()
+            if error is not None:
+                logging.getLogger(__name__).error(f"Could not post {context} to {channel}: {error}")
+        sent.add_done_callback(done)
+    return sent
+
+class MessageDispatcher:
+    """Queues outbound chat_postMessage calls and sends them from a few background threads.
+
+    Messages to a channel go out one at a time in the order they were posted, channels
+    take turns, and each channel is held to a token bucket. Up to senders channels are
+    sent to at once. A 429 pauses all sending for its
+    Retry-After, other transient failures back off the channel exponentially, and a
+    message is given up on after max_retries retries. The rate limit state of channels
+    with nothing queued is forgotten once they are idle. Every other client method is
+    passed straight through, so the dispatcher can stand in for the WebClient.
+    """
+
+    def __init__(self, client, rate=None, burst=None, max_retries=None, max_backoff=None, senders=None):
+        self.client = client
+        self.senders = senders or DISPATCH_SENDERS
+        self.rate = rate or DISPATCH_CHANNEL_RATE
+        self.burst = burst or DISPATCH_CHANNEL_BURST
+        self.max_retries = DISPATCH_MAX_RETRIES if max_retries is None else max_retries
+        self.max_backoff = max_backoff or DISPATCH_MAX_BACKOFF
+        self._queues = OrderedDict()
+        self._buckets = {}
+        self._not_before = {}
+        self._prune_at = _PRUNE_CHANNELS
+        self._paused_until = 0.0
+        self._sending = 0
+        self._busy = set()
+        self._condition = threading.Condition()
+        self._threads = []
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def chat_postMessage(self, channel, **kwargs):
+        """Queue a message and return at once, before it is sent.
+
+        Returns a concurrent.futures.Future. Its result is Slack's response once the message
+        is sent. Its exception is the error the message was dropped with, so callers that
+        want to know about failures add a done callback, e.g. with log_failure().
+        """
+        message = _Message(dict(kwargs, channel=channel))
+        with self._condition:
+            self._queues.setdefault(channel, deque()).append(message)
+            if len(self._threads) < self.senders:
+                self._threads = [thread for thread in self._threads if thread.is_alive()]
+                while len(self._threads) < min(self.senders, len(self._queues)):
+                    thread = threading.Thread(target=self._run, daemon=True)
+                    thread.start()
+                    self._threads.append(thread)
+            self._condition.notify()
+        return message.future
+
+    def call(self, method, **kwargs):
+        """Call another Web API method in the calling thread, e.g. call('conversations_open', users=...).
+        It waits out the same 429 pauses as the queued messages, and a 429 it gets pauses them
+        too. A rate limited call is tried again up to max_retries times"""
+        for attempt in range(self.max_retries + 1):
+            with self._condition:
+                wait = self._paused_until - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                return getattr(self.client, method)(**kwargs)
+            except SlackApiError as e:
+                retry_after = _retry_after(e)
+                if retry_after is None or attempt == self.max_retries:
+                    raise
+                with self._condition:
+                    self._paused_until = max(self._paused_until, time.monotonic() + min(retry_after, self.max_backoff))
+
+    def conversations_open(self, **kwargs):
+        """conversations.open through call(), so a 429 is waited out"""
+        return self.call('conversations_open', **kwargs)
+
+    def pending(self):
+        """Number of messages queued or being sent"""
+        with self._condition:
+            return sum(len(queue) for queue in self._queues.values()) + self._sending
+
+    def drain(self, timeout=None):
+        """Block until every queued message was sent or given up on, returns whether it finished"""
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._queues and not self._sending, timeout)
+
+    def _next(self, now):
+        """(channel, 0) for the channel allowed to send now, else (None, seconds to wait)"""
+        if now < self._paused_until:
+            return None, self._paused_until - now
+        wait = None
+        for channel in self._queues:
+            # Another thread is sending this channel's head message
+            if channel in self._busy:
+                continue
+            delay = self._not_before.get(channel, 0.0) - now
+            if delay <= 0:
+                bucket = self._buckets.get(channel)
+                if bucket is None:
+                    if len(self._buckets) >= self._prune_at:
+                        self._prune(now)
+                    bucket = self._buckets[channel] = TokenBucket(self.rate, self.burst)
+                delay = bucket.delay(now)
+                if delay <= 0:
+                    bucket.take(now)
+                    # Let the other channels go first next time
+                    self._queues.move_to_end(channel)
+                    return channel, 0.0
+            wait = delay if wait is None else min(wait, delay)
+        return None, wait
+
+    def _prune(self, now):
+        """Forget the buckets and backoffs of channels with nothing queued whose bucket has
+        refilled. Runs whenever the number of buckets doubles, so it costs O(1) per message"""
+        for channel in [channel for channel, bucket in self._buckets.items()
+                        if channel not in self._queues and bucket.full(now)]:
+            del self._buckets[channel]
+        for channel in [channel for channel in self._not_before if channel not in self._queues]:
+            del self._not_before[channel]
+        self._prune_at = max(_PRUNE_CHANNELS, 2 * len(self._buckets))
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    channel, wait = self._next(time.monotonic())
+                    if channel is not None:
+                        break
+                    self._condition.wait(wait)
+                message = self._queues[channel][0]
+                message.attempts += 1
+                self._sending += 1
+                self._busy.add(channel)
+            try:
+                response = self.client.chat_postMessage(**message.kwargs)
+            except SlackApiError as e:
+                retry_after = _retry_after(e)
+                if retry_after is not None:
+                    self._retry(channel, message, e, pause=min(retry_after, self.max_backoff))
+                elif getattr(e.response, 'status_code', 200) >= 500:
+                    self._retry(channel, message, e)
+                else:
+                    self._finish(channel, message, error=e)
+            except Exception as e:
+                self._retry(channel, message, e)
+            else:
+                self._finish(channel, message, response=response)
+
+    def _retry(self, channel, message, error, pause=None):
+        if message.attempts > self.max_retries:
+            self._finish(channel, message, error=error)
+            return
+        with self._condition:
+            now = time.monotonic()
+            if pause is not None:
+                self._paused_until = max(self._paused_until, now + pause)
+            else:
+                self._not_before[channel] = now + min(0.5 * 2 ** (message.attempts - 1), self.max_backoff)
+            self._busy.discard(channel)
+            self._sending -= 1
+            self._condition.notify_all()
+
+    def _finish(self, channel, message, response=None, error=None):
+        with self._condition:
+            queue = self._queues[channel]
+            queue.popleft()
+            if not queue:
+                del self._queues[channel]
+            self._not_before.pop(channel, None)
+            self._busy.discard(channel)
+            self._sending -= 1
+            self._condition.notify_all()
+        if error is not None:
+            message.future.set_exception(error)
+        else:
+            message.future.set_result(response)
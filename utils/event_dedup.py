@@ -0,0 +1,114 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Slack retries an unacknowledged event after about 1 and 5 minutes, so remembering
+# ids for 10 minutes catches every redelivery
+EVENT_DEDUP_WINDOW = float(os.environ.get('EVENT_DEDUP_WINDOW', '600'))
+EVENT_DEDUP_SIZE = int(os.environ.get('EVENT_DEDUP_SIZE', '10000'))
+# Optional file of recently seen event ids, so a restart doesn't forget them
+EVENT_DEDUP_FILE = os.environ.get('EVENT_DEDUP_FILE', '')
+
+class EventDeduplicator:
+    """Remembers the event_ids of the last window seconds (at most max_size of them)
+    and reports redeliveries of an event that was already handled"""
+
+    def __init__(self, window=None, max_size=None, path=None, clock=time.time):
+        self.window = EVENT_DEDUP_WINDOW if window is None else window
+        self.max_size = max_size or EVENT_DEDUP_SIZE
+        self.path = EVENT_DEDUP_FILE if path is None else path
+        self.clock = clock
+        self.stats = {'events': 0, 'retries': 0, 'duplicates': 0}
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+        self._file = None
+        self._file_lines = 0
+        if self.path:
+            self._load()
+
+    def _load(self):
+        cutoff = self.clock() - self.window
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    event_id, _, seen_at = line.rstrip('\n').partition('\t')
+                    try:
+                        seen_at = float(seen_at)
+                    except ValueError:
+                        continue
+                    if seen_at > cutoff:
+                        self._seen[event_id] = seen_at
+                        self._seen.move_to_end(event_id)
+                    else:
+                        # Forgotten, see forget()
+                        self._seen.pop(event_id, None)
+        except FileNotFoundError:
+            pass
+        while len(self._seen) > self.max_size:
+            self._seen.popitem(last=False)
+        self._rewrite()
+
+    def _rewrite(self):
+        """Replace the file with just the ids still remembered"""
+        if self._file:
+            self._file.close()
+        tmp_file = self.path + '.tmp'
+        with open(tmp_file, 'w') as f:
+            f.writelines(f'{event_id}\t{seen_at}\n' for event_id, seen_at in self._seen.items())
+        os.replace(tmp_file, self.path)
+        self._file = open(self.path, 'a')
+        self._file_lines = len(self._seen)
+
+    def _expire(self, now):
+        """Forget ids older than the window, and the oldest ones until there is room for one more"""
+        cutoff = now - self.window
+        while self._seen:
+            event_id, seen_at = next(iter(self._seen.items()))
+            if seen_at > cutoff and len(self._seen) < self.max_size:
+                break
+            self._seen.popitem(last=False)
+
+    def is_duplicate(self, event_id, retry_num=None):
+        """Record event_id, returns True if it was already seen within the window"""
+        with self._lock:
+            self.stats['events'] += 1
+            if retry_num:
+                self.stats['retries'] += 1
+            if not event_id:
+                return False
+            now = self.clock()
+            self._expire(now)
+            if event_id in self._seen:
+                self.stats['duplicates'] += 1
+                return True
+            self._seen[event_id] = now
+            if self._file:
+                self._file.write(f'{event_id}\t{now}\n')
+                self._file.flush()
+                self._file_lines += 1
+                if self._file_lines > 2 * self.max_size:
+                    self._expire(now)
+                    self._rewrite()
+            return False
+
+    def forget(self, event_id):
+        """Drop a recorded event_id, so a redelivery of it is handled again"""
+        with self._lock:
+            if self._seen.pop(event_id, None) is not None and self._file:
+                self._file.write(f'{event_id}\t0\n')
+                self._file.flush()
+                self._file_lines += 1
+
+    def counters(self):
+        """Events received, how many were Slack retries, and how many duplicates were dropped"""
+        with self._lock:
+            return dict(self.stats, remembered=len(self._seen))
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+event_deduplicator = EventDeduplicator()
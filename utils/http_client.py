@@ -0,0 +1,187 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import requests
+from requests.adapters import HTTPAdapter
+
+INTEGRATION_TIMEOUT = float(os.environ.get('INTEGRATION_TIMEOUT', '3'))
+INTEGRATION_POOL_SIZE = int(os.environ.get('INTEGRATION_POOL_SIZE', '10'))
+INTEGRATION_CACHE_SIZE = int(os.environ.get('INTEGRATION_CACHE_SIZE', '1000'))
+# After this many upstream failures in a row, calls fail at once for CIRCUIT_RESET_SECONDS
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('CIRCUIT_FAILURE_THRESHOLD', '5'))
+CIRCUIT_RESET_SECONDS = float(os.environ.get('CIRCUIT_RESET_SECONDS', '30'))
+
+class IntegrationError(Exception):
+    """An upstream call that failed, with the HTTP status when there was a response"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+class CircuitOpenError(IntegrationError):
+    """Raised instead of calling an upstream that keeps failing"""
+
+class CircuitBreaker:
+    """Opens after failure_threshold failures in a row and stays open for reset_seconds.
+    Then one trial call is let through, its outcome closes or reopens the circuit"""
+
+    def __init__(self, failure_threshold=None, reset_seconds=None, clock=time.monotonic):
+        self.failure_threshold = failure_threshold or CIRCUIT_FAILURE_THRESHOLD
+        self.reset_seconds = CIRCUIT_RESET_SECONDS if reset_seconds is None else reset_seconds
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return 'closed'
+            if self._trial or self.clock() - self.opened_at >= self.reset_seconds:
+                return 'half_open'
+            return 'open'
+
+    def allow(self):
+        """Whether a call may go to the upstream now"""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self._trial or self.clock() - self.opened_at < self.reset_seconds:
+                return False
+            self._trial = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+            self._trial = False
+
+class IntegrationClient:
+    """GETs JSON from one upstream over a pooled session.
+
+    Answers are cached per key for ttl seconds and failures for negative_ttl
+    seconds. Concurrent calls for the same key share a single upstream request,
+    and a circuit breaker stops calling the upstream while it keeps failing.
+    """
+
+    def __init__(self, ttl, negative_ttl, timeout=None, pool_size=None, max_size=None,
+                 breaker=None, clock=time.monotonic):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.timeout = timeout or INTEGRATION_TIMEOUT
+        self.max_size = max_size or INTEGRATION_CACHE_SIZE
+        self.breaker = breaker or CircuitBreaker(clock=clock)
+        self.clock = clock
+        self.stats = {'hits': 0, 'misses': 0, 'coalesced': 0, 'upstream': 0, 'rejected': 0}
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size or INTEGRATION_POOL_SIZE)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def _cached(self, key):
+        """(True, entry) for a live cache entry, (False, None) otherwise. Callers hold _lock"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        if entry[0] <= self.clock():
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, entry
+
+    def _put(self, key, value, error=None):
+        ttl = self.ttl if error is None else self.negative_ttl
+        with self._lock:
+            self._entries[key] = (self.clock() + ttl, value, error)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get_json(self, url, params=None, key=None):
+        """The JSON body of GET url, raises IntegrationError for a failed or non-200 call.
+        key names the cache entry, by default the url and params"""
+        if key is None:
+            key = (url, tuple(sorted((params or {}).items())))
+        with self._lock:
+            found, entry = self._cached(key)
+            if found:
+                self.stats['hits'] += 1
+            else:
+                future = self._in_flight.get(key)
+                leader = future is None
+                if leader:
+                    future = self._in_flight[key] = Future()
+                    self.stats['misses'] += 1
+                else:
+                    self.stats['coalesced'] += 1
+        if found:
+            _, value, error = entry
+            if error is not None:
+                raise error
+            return value
+        if not leader:
+            return future.result()
+        try:
+            value = self._fetch(url, params)
+        except Exception as e:
+            if isinstance(e, IntegrationError) and not isinstance(e, CircuitOpenError):
+                self._put(key, None, e)
+            future.set_exception(e)
+            raise
+        else:
+            self._put(key, value)
+            future.set_result(value)
+            return value
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def _fetch(self, url, params):
+        if not self.breaker.allow():
+            with self._lock:
+                self.stats['rejected'] += 1
+            raise CircuitOpenError(f"{url} is failing, not calling it for now")
+        with self._lock:
+            self.stats['upstream'] += 1
+        try:
+            response = self.session.get(url, params=params, timeout=self.timeout)
+        except requests.RequestException as e:
+            self.breaker.record_failure()
+            raise IntegrationError(f"{url} could not be reached: {e}") from e
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+            raise IntegrationError(f"{url} answered {response.status_code}", response.status_code)
+        # A 4xx is about this request, not the upstream's health
+        self.breaker.record_success()
+        if response.status_code != 200:
+            raise IntegrationError(f"{url} answered {response.status_code}", response.status_code)
+        try:
+            return response.json()
+        except ValueError as e:
+            raise IntegrationError(f"{url} did not answer JSON", response.status_code) from e
+
+    def counters(self):
+        """Cache hits, misses, calls that joined an in-flight request, upstream calls, and
+        calls turned away by the open circuit"""
+        with self._lock:
+            return dict(self.stats, cached=len(self._entries), circuit=self.breaker.state)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
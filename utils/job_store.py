@@ -0,0 +1,73 @@
+import sqlite3
+import threading
+
+from utils.serialization import dumps_json, loads_json
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    next_run REAL NOT NULL,
+    action TEXT NOT NULL,
+    args TEXT NOT NULL,
+    trigger TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_next_run ON jobs(next_run);
+"""
+
+class JobStore:
+    """Scheduled jobs kept in SQLite as descriptors: the name of an action, its
+    arguments and the trigger, so they can be scheduled again after a restart.
+    next_run is a POSIX timestamp, indexed so a window of due jobs is one range scan"""
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def put(self, job_id, next_run, action, args, trigger):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs (id, next_run, action, args, trigger) VALUES (?, ?, ?, ?, ?)",
+                (job_id, next_run, action, dumps_json(args), dumps_json(trigger))
+            )
+
+    def put_many(self, rows):
+        """put() for many (job_id, next_run, action, args, trigger) rows in one transaction"""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO jobs (id, next_run, action, args, trigger) VALUES (?, ?, ?, ?, ?)",
+                [(job_id, next_run, action, dumps_json(args), dumps_json(trigger))
+                 for job_id, next_run, action, args, trigger in rows]
+            )
+
+    def delete(self, job_id):
+        """Returns whether there was a job with that id"""
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,)).rowcount > 0
+
+    def due_between(self, after, until):
+        """[(job_id, next_run, action, args, trigger)] with after < next_run <= until, soonest first.
+        after=None also returns every job that is already overdue"""
+        with self._lock:
+            if after is None:
+                rows = self._conn.execute(
+                    "SELECT id, next_run, action, args, trigger FROM jobs WHERE next_run <= ? ORDER BY next_run",
+                    (until,)
+                ).fetchall()
+            else:
+                rows = self._conn.execute(
+                    "SELECT id, next_run, action, args, trigger FROM jobs WHERE next_run > ? AND next_run <= ? "
+                    "ORDER BY next_run",
+                    (after, until)
+                ).fetchall()
+        return [(job_id, next_run, action, loads_json(args), loads_json(trigger))
+                for job_id, next_run, action, args, trigger in rows]
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
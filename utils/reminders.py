@@ -0,0 +1,161 @@
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime
+from functools import partial
+
+from utils import data_manager
+from utils.data_manager import reminders, save_data, use_tenant
+from utils.dispatcher import log_failure
+from utils.scheduler import Scheduler
+
+# Pending reminders held at once, new ones are refused beyond this
+REMINDER_MAX_PENDING = int(os.environ.get('REMINDER_MAX_PENDING', '200000'))
+# A reminder that came due more than this many seconds ago, e.g. while the bot was down, is dropped
+REMINDER_MISFIRE_GRACE = float(os.environ.get('REMINDER_MISFIRE_GRACE', '86400'))
+
+class ReminderLimitError(Exception):
+    """Raised instead of adding a reminder once REMINDER_MAX_PENDING are pending"""
+
+class ReminderEngine:
+    """Fires the reminders saved in data_manager.reminders when they come due.
+
+    Each reminder is a record keyed by its own id, so a user can have any number of
+    them. Due times are kept in the heap of the bot's shared scheduler, which main.py
+    sets before starting the engine, so adding and cancelling are O(log n). Without one
+    the engine uses a scheduler of its own, as in tests. Reminders are scheduled again
+    from the records whenever a store loads, and at start from the saved records of every
+    tenant, so they survive restarts even in a tenant nobody uses afterwards.
+    """
+
+    def __init__(self, client=None, clock=datetime.now, max_pending=None, misfire_grace=None, scheduler=None):
+        self.client = client
+        self.clock = clock
+        self.max_pending = max_pending or REMINDER_MAX_PENDING
+        self.misfire_grace = REMINDER_MISFIRE_GRACE if misfire_grace is None else misfire_grace
+        self._scheduler = scheduler
+        # job id -> due time of every reminder in the scheduler, the scheduler also holds other jobs
+        self._scheduled = {}
+        self._lock = threading.Lock()
+
+    @property
+    def scheduler(self):
+        if self._scheduler is None:
+            self._scheduler = Scheduler(workers=1, clock=self.clock)
+        return self._scheduler
+
+    @scheduler.setter
+    def scheduler(self, scheduler):
+        self._scheduler = scheduler
+
+    def add(self, user_id, channel_id, text, due, team_id=None):
+        """Save a reminder and schedule it, returns its id"""
+        if len(self) >= self.max_pending:
+            raise ReminderLimitError(f"{self.max_pending} reminders are already pending")
+        reminder_id = uuid.uuid4().hex[:8]
+        reminders[reminder_id] = {
+            'user_id': user_id,
+            'team_id': team_id,
+            'channel_id': channel_id,
+            'text': text,
+            'time': due
+        }
+        save_data('reminders', reminder_id)
+        self._schedule(reminder_id, reminders[reminder_id])
+        return reminder_id
+
+    def cancel(self, reminder_id, user_id=None):
+        """Delete a pending reminder, only if it is user_id's when given. Returns whether it was"""
+        reminder = reminders.get(reminder_id)
+        if not isinstance(reminder, dict) or (user_id is not None and reminder.get('user_id', reminder_id) != user_id):
+            return False
+        del reminders[reminder_id]
+        save_data('reminders', reminder_id)
+        job_id = self._job_id(reminder_id, reminder)
+        with self._lock:
+            self._scheduled.pop(job_id, None)
+        self.scheduler.remove_job(job_id)
+        return True
+
+    def pending(self, user_id):
+        """[(reminder_id, reminder)] of a user, soonest first"""
+        mine = [(reminder_id, reminder) for reminder_id, reminder in reminders.items()
+                if isinstance(reminder, dict) and reminder.get('user_id', reminder_id) == user_id]
+        return sorted(mine, key=lambda item: item[1]['time'])
+
+    def _job_id(self, reminder_id, reminder):
+        # Ids are only unique within the tenant store the record is saved in
+        return (reminder.get('team_id'), reminder.get('channel_id'), reminder_id)
+
+    def _schedule(self, reminder_id, reminder):
+        job_id = self._job_id(reminder_id, reminder)
+        with self._lock:
+            self._scheduled[job_id] = reminder['time']
+        # The scheduler skips reminders later than the grace and calls _drop for them instead
+        self.scheduler.add_job(
+            partial(self._fire, job_id, reminder['time']),
+            trigger='date',
+            run_date=reminder['time'],
+            id=job_id,
+            misfire_grace_time=self.misfire_grace,
+            on_misfire=partial(self._drop, job_id, reminder['time'])
+        )
+
+    def restore(self, store):
+        """Schedule every reminder saved in a store, called when a store loads"""
+        self._restore_records(store.collections['reminders'])
+
+    def restore_tenants(self):
+        """Schedule the reminders saved by every tenant. Their records are read from the tenants'
+        files, their stores are only loaded once a reminder fires"""
+        for key in data_manager.tenant_keys():
+            self._restore_records(data_manager.read_collection(key, 'reminders'))
+
+    def _restore_records(self, saved):
+        for reminder_id, reminder in saved.items():
+            if isinstance(reminder, dict) and isinstance(reminder.get('time'), datetime):
+                self._schedule(reminder_id, reminder)
+
+    def _take(self, job_id, due):
+        """Delete a reminder that came due, returns it or None when it was cancelled or
+        replaced by a newer reminder with the same id"""
+        team_id, channel_id, reminder_id = job_id
+        with self._lock:
+            if self._scheduled.get(job_id) == due:
+                del self._scheduled[job_id]
+        with use_tenant(team_id, channel_id):
+            reminder = reminders.get(reminder_id)
+            if reminder is None or reminder.get('time') != due:
+                return None
+            del reminders[reminder_id]
+            save_data('reminders', reminder_id)
+        return reminder
+
+    def _fire(self, job_id, due):
+        reminder = self._take(job_id, due)
+        if reminder is not None:
+            sent = self.client.chat_postMessage(channel=reminder['channel_id'], text=f"🔔 Reminder: {reminder['text']}")
+            log_failure(sent, reminder['channel_id'], f"reminder {job_id[2]}")
+
+    def _drop(self, job_id, due):
+        if self._take(job_id, due) is not None:
+            logging.getLogger(__name__).warning(f"Dropped reminder {job_id[2]}, it was due at {due}")
+
+    def run_due(self):
+        """Fire the reminders due now in the calling thread, returns how many"""
+        return self.scheduler.run_due()
+
+    def start(self):
+        """Start firing reminders on the scheduler. Loading the default store schedules the ones saved in it,
+        those of every tenant are scheduled from their files"""
+        data_manager.current_store()
+        self.restore_tenants()
+        self.scheduler.start()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._scheduled)
+
+reminder_engine = ReminderEngine()
+data_manager.add_load_listener(reminder_engine.restore)
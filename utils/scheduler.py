@@ -0,0 +1,334 @@
+import heapq
+import itertools
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+SCHEDULER_WORKERS = int(os.environ.get('SCHEDULER_WORKERS', '4'))
+# SQLite file that jobs given as an action survive restarts in, empty to keep them in memory only
+JOB_STORE_FILE = os.environ.get('JOB_STORE_FILE', 'scheduled_jobs.db')
+# Only jobs due within this many seconds are read from the store at a time
+JOB_LOAD_WINDOW = float(os.environ.get('JOB_LOAD_WINDOW', '3600'))
+# A run more than this many seconds late, e.g. because the bot was down, is skipped
+JOB_MISFIRE_GRACE = float(os.environ.get('JOB_MISFIRE_GRACE', '3600'))
+
+DAY_NAMES = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+
+def _days_of_week(spec):
+    """Weekday numbers for 'mon', 'mon-fri' or 'mon,wed,fri'"""
+    days = set()
+    for part in spec.lower().split(','):
+        first, _, last = part.strip().partition('-')
+        start = DAY_NAMES.index(first)
+        end = DAY_NAMES.index(last) if last else start
+        days.update(range(start, end + 1))
+    return days
+
+class DateTrigger:
+    """Fires once at run_date"""
+
+    __slots__ = ('run_date',)
+
+    def __init__(self, run_date):
+        self.run_date = run_date
+
+    def next_after(self, previous, now):
+        return self.run_date if previous is None else None
+
+    def to_dict(self):
+        return {'trigger': 'date', 'run_date': self.run_date.isoformat()}
+
+class IntervalTrigger:
+    """Fires every interval, the first time one interval after it is added"""
+
+    __slots__ = ('interval',)
+
+    def __init__(self, seconds=0, minutes=0, hours=0):
+        self.interval = timedelta(seconds=seconds, minutes=minutes, hours=hours)
+        if self.interval <= timedelta(0):
+            raise ValueError("interval must be positive")
+
+    def next_after(self, previous, now):
+        next_run = (previous or now) + self.interval
+        return next_run if next_run > now else now + self.interval
+
+    def to_dict(self):
+        return {'trigger': 'interval', 'seconds': self.interval.total_seconds()}
+
+class CronTrigger:
+    """Fires at hour:minute on the matching days: every day, some weekdays
+    (day_of_week='mon-fri') or one day of the month (day=1)"""
+
+    __slots__ = ('hour', 'minute', 'day_of_week', 'days_of_week', 'day')
+
+    def __init__(self, hour=0, minute=0, day_of_week=None, day=None):
+        self.hour = int(hour)
+        self.minute = int(minute)
+        self.day_of_week = day_of_week
+        self.days_of_week = _days_of_week(day_of_week) if day_of_week else None
+        self.day = int(day) if day is not None else None
+
+    def _matches(self, day):
+        if self.days_of_week is not None and day.weekday() not in self.days_of_week:
+            return False
+        return self.day is None or day.day == self.day
+
+    def next_after(self, previous, now):
+        day = now.date()
+        # Days missing from most months, such as the 31st, can take a while to come round
+        for _ in range(400):
+            if self._matches(day):
+                candidate = datetime(day.year, day.month, day.day, self.hour, self.minute)
+                if candidate > now:
+                    return candidate
+            day += timedelta(days=1)
+        return None
+
+    def to_dict(self):
+        return {'trigger': 'cron', 'hour': self.hour, 'minute': self.minute,
+                'day_of_week': self.day_of_week, 'day': self.day}
+
+TRIGGERS = {
+    'date': DateTrigger,
+    'interval': IntervalTrigger,
+    'cron': CronTrigger
+}
+
+def trigger_from_dict(data):
+    """The trigger a to_dict() result describes"""
+    args = dict(data)
+    trigger = TRIGGERS[args.pop('trigger')]
+    if 'run_date' in args:
+        args['run_date'] = datetime.fromisoformat(args['run_date'])
+    return trigger(**args)
+
+class Job:
+    """A scheduled call of func, or of the scheduler's action named action with args.
+    A run later than misfire_grace is skipped, and on_misfire is called instead"""
+
+    __slots__ = ('id', 'func', 'action', 'args', 'trigger', 'next_run', 'removed', 'misfire_grace', 'on_misfire')
+
+    def __init__(self, job_id, func, trigger, next_run, action=None, args=None, misfire_grace=None, on_misfire=None):
+        self.id = job_id
+        self.func = func
+        self.action = action
+        self.args = args
+        self.trigger = trigger
+        self.next_run = next_run
+        self.removed = False
+        self.misfire_grace = misfire_grace
+        self.on_misfire = on_misfire
+
+    def __repr__(self):
+        return f"Job({self.id!r}, next_run={self.next_run})"
+
+class Scheduler:
+    """Runs every timed job of the bot, from standups to one-off reminders.
+
+    Due times sit in a heap, and one thread sleeps until the earliest of them instead
+    of polling. Adding a job that is due sooner wakes it early. Jobs run on a pool of
+    workers so a slow one doesn't hold up the rest. add_job() takes the same
+    arguments as APScheduler's: add_job(func, trigger='cron', hour=9, minute=0).
+    A job with the id of an earlier one replaces it. Ids of jobs given as an action
+    are strings, jobs with a func can use any hashable id.
+
+    A job can name one of actions, with arguments, instead of a func. With a store,
+    those jobs are saved and scheduled again after a restart. Only the jobs due within
+    load_window seconds are read into the heap, the next window when that one runs out.
+    """
+
+    def __init__(self, workers=None, clock=datetime.now, store=None, actions=None,
+                 load_window=None, misfire_grace=None):
+        self.workers = workers or SCHEDULER_WORKERS
+        self.clock = clock
+        self.store = store
+        self.actions = dict(actions or {})
+        self.load_window = timedelta(seconds=load_window or JOB_LOAD_WINDOW)
+        self.misfire_grace = timedelta(seconds=JOB_MISFIRE_GRACE if misfire_grace is None else misfire_grace)
+        self.stats = {'wakeups': 0, 'runs': 0, 'failures': 0, 'misfires': 0, 'loaded': 0}
+        self._jobs = {}
+        self._heap = []
+        self._stale = 0
+        self._ids = itertools.count()
+        self._loaded_until = None
+        self._condition = threading.Condition()
+        self._thread = None
+        self._executor = None
+        self._running = False
+
+    def add_job(self, func=None, trigger='date', id=None, action=None, args=None,
+                misfire_grace_time=None, on_misfire=None, **trigger_args):
+        """Schedule func, or actions[action](**args). trigger is 'date' (run_date=), 'interval'
+        (seconds=, minutes=, hours=), 'cron' (hour=, minute=, day_of_week=, day=) or a trigger object.
+        misfire_grace_time (seconds) replaces the scheduler's misfire_grace for this job, and
+        on_misfire() is called in place of a run that was skipped for being too late"""
+        if isinstance(trigger, str):
+            trigger = TRIGGERS[trigger](**trigger_args)
+        job_id = id if id is not None else f'job-{next(self._ids)}'
+        next_run = trigger.next_after(None, self.clock())
+        misfire_grace = timedelta(seconds=misfire_grace_time) if misfire_grace_time is not None else None
+        job = Job(job_id, func, trigger, next_run, action, args, misfire_grace, on_misfire)
+        with self._condition:
+            previous = self._jobs.pop(job_id, None)
+            if previous is not None:
+                self._discard(previous)
+            if self.store is not None:
+                if action is not None and next_run is not None:
+                    self.store.put(job_id, next_run.timestamp(), action, args or {}, trigger.to_dict())
+                elif isinstance(job_id, str):
+                    self.store.delete(job_id)
+            if next_run is None:
+                return job
+            self._push(job)
+        return job
+
+    def _push(self, job):
+        """Put a job in the heap, waking the thread when it is the new earliest. Callers hold _condition"""
+        self._jobs[job.id] = job
+        wake = not self._heap or job.next_run < self._heap[0][0]
+        heapq.heappush(self._heap, (job.next_run, next(self._ids), job))
+        if wake:
+            self._condition.notify()
+
+    def remove_job(self, job_id):
+        """Unschedule a job, returns whether there was one with that id"""
+        with self._condition:
+            job = self._jobs.pop(job_id, None)
+            if job is not None:
+                self._discard(job)
+            stored = self.store is not None and isinstance(job_id, str) and self.store.delete(job_id)
+            return job is not None or stored
+
+    def _discard(self, job):
+        """Mark a job removed, its heap entry stays until popped. Once stale entries outnumber
+        live jobs the heap is rebuilt, so cancelling can't grow it. Callers hold _condition"""
+        job.removed = True
+        self._stale += 1
+        if self._stale > max(len(self._jobs), 1024):
+            self._heap = [entry for entry in self._heap if not entry[2].removed and entry[2].next_run == entry[0]]
+            heapq.heapify(self._heap)
+            self._stale = 0
+
+    def get_job(self, job_id):
+        with self._condition:
+            return self._jobs.get(job_id)
+
+    def get_jobs(self):
+        """The jobs in memory, soonest first. Stored jobs beyond the loaded window aren't included"""
+        with self._condition:
+            return sorted(self._jobs.values(), key=lambda job: job.next_run)
+
+    def __len__(self):
+        with self._condition:
+            return len(self._jobs)
+
+    def _load(self, now):
+        """Read the stored jobs due up to now + load_window into the heap. Callers hold _condition"""
+        until = now + self.load_window
+        after = self._loaded_until.timestamp() if self._loaded_until is not None else None
+        for job_id, next_run, action, args, trigger in self.store.due_between(after, until.timestamp()):
+            # A job added or rescheduled since the start is in memory already
+            if job_id in self._jobs:
+                continue
+            self._push(Job(job_id, None, trigger_from_dict(trigger), datetime.fromtimestamp(next_run), action, args))
+            self.stats['loaded'] += 1
+        self._loaded_until = until
+
+    def _pop_due(self, now):
+        """Take the jobs due by now off the heap and queue their next runs. Callers hold _condition"""
+        if self.store is not None and (self._loaded_until is None or now >= self._loaded_until):
+            self._load(now)
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            run_at, _, job = heapq.heappop(self._heap)
+            # Removed jobs, and entries left behind by a replaced job, are dropped here
+            if job.removed or job.next_run != run_at:
+                self._stale -= 1
+                continue
+            grace = self.misfire_grace if job.misfire_grace is None else job.misfire_grace
+            if now - run_at > grace:
+                self.stats['misfires'] += 1
+                logging.getLogger(__name__).warning(f"Skipped job {job.id}, it was due at {run_at}")
+                if job.on_misfire is not None:
+                    due.append(Job(job.id, job.on_misfire, job.trigger, run_at))
+            else:
+                due.append(job)
+            # Runs missed while the process was stopped or busy collapse into one
+            next_run = job.trigger.next_after(run_at, now)
+            job.next_run = next_run
+            if next_run is None:
+                del self._jobs[job.id]
+            else:
+                heapq.heappush(self._heap, (next_run, next(self._ids), job))
+            if self.store is not None and job.action is not None:
+                if next_run is None:
+                    self.store.delete(job.id)
+                else:
+                    self.store.put(job.id, next_run.timestamp(), job.action, job.args, job.trigger.to_dict())
+        return due
+
+    def _seconds_until_next(self, now):
+        while self._heap and (self._heap[0][2].removed or self._heap[0][2].next_run != self._heap[0][0]):
+            heapq.heappop(self._heap)
+            self._stale -= 1
+        wake_at = self._heap[0][0] if self._heap else None
+        if self._loaded_until is not None and (wake_at is None or self._loaded_until < wake_at):
+            wake_at = self._loaded_until
+        if wake_at is None:
+            return None
+        return max((wake_at - now).total_seconds(), 0)
+
+    def _run(self, job):
+        try:
+            if job.action is not None:
+                self.actions[job.action](**(job.args or {}))
+            else:
+                job.func()
+            outcome = 'runs'
+        except Exception:
+            outcome = 'failures'
+            logging.getLogger(__name__).exception(f"Scheduled job {job.id} failed")
+        with self._condition:
+            self.stats[outcome] += 1
+
+    def run_due(self):
+        """Run every job that is due now in the calling thread, returns how many ran"""
+        with self._condition:
+            due = self._pop_due(self.clock())
+        for job in due:
+            self._run(job)
+        return len(due)
+
+    def start(self):
+        """Start the scheduling thread and the worker pool"""
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='scheduler')
+            self._thread = threading.Thread(target=self._loop, daemon=True)
+            self._thread.start()
+
+    def shutdown(self, wait=True):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+
+    def _loop(self):
+        while True:
+            with self._condition:
+                if not self._running:
+                    return
+                due = self._pop_due(self.clock())
+                if not due:
+                    self._condition.wait(self._seconds_until_next(self.clock()))
+                    self.stats['wakeups'] += 1
+                    continue
+            for job in due:
+                self._executor.submit(self._run, job)
@@ -0,0 +1,137 @@
+import json
+from datetime import datetime
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+FORMATS = ('json', 'orjson', 'msgpack')
+DATETIME_TAG = '__datetime__'
+# Top-level key listing which sections of a JSON snapshot hold tagged datetimes
+TYPED_SECTIONS_KEY = '__typed_sections__'
+_DATETIME_EXT_CODE = 1
+
+def json_default(value):
+    """Tag datetimes so they load back as datetimes, records such as Task become
+    their dict form and anything else falls back to str"""
+    if isinstance(value, datetime):
+        return {DATETIME_TAG: value.isoformat()}
+    if hasattr(value, 'to_dict'):
+        return value.to_dict()
+    return str(value)
+
+def _revive(obj):
+    if len(obj) == 1 and DATETIME_TAG in obj:
+        return datetime.fromisoformat(obj[DATETIME_TAG])
+    return obj
+
+def _revive_nested(value):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            value[key] = _revive_nested(item)
+        return _revive(value)
+    if isinstance(value, list):
+        return [_revive_nested(item) for item in value]
+    return value
+
+def _encode_json_sections(state, dumps):
+    """Encode each top-level section on its own so the loader only has to
+    revive datetimes in the sections that actually contain them"""
+    typed = []
+    parts = []
+    for name, section in state.items():
+        found = []
+
+        def default(value):
+            if isinstance(value, datetime):
+                found.append(True)
+            return json_default(value)
+
+        parts.append((name, dumps(section, default)))
+        if found:
+            typed.append(name)
+    if typed:
+        parts.append((TYPED_SECTIONS_KEY, dumps(typed, json_default)))
+    return parts
+
+def _decode_json_snapshot(raw):
+    data = orjson.loads(raw) if orjson is not None else json.loads(raw)
+    if not isinstance(data, dict):
+        return data
+    typed = data.pop(TYPED_SECTIONS_KEY, None)
+    if typed is None:
+        if DATETIME_TAG.encode() in raw:
+            return _revive_nested(data)
+        return data
+    for name in typed:
+        data[name] = _revive_nested(data[name])
+    return data
+
+def dumps_json(value):
+    """Compact single-line JSON with tagged datetimes, for journal records and database rows"""
+    return json.dumps(value, default=json_default)
+
+def loads_json(text):
+    """Parse JSON text or bytes, restoring tagged datetimes"""
+    tag = DATETIME_TAG.encode() if isinstance(text, bytes) else DATETIME_TAG
+    if tag in text:
+        return json.loads(text, object_hook=_revive)
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+def _msgpack_default(value):
+    if isinstance(value, datetime):
+        return msgpack.ExtType(_DATETIME_EXT_CODE, value.isoformat().encode())
+    if hasattr(value, 'to_dict'):
+        return value.to_dict()
+    return str(value)
+
+def _msgpack_ext_hook(code, data):
+    if code == _DATETIME_EXT_CODE:
+        return datetime.fromisoformat(data.decode())
+    return msgpack.ExtType(code, data)
+
+def encode(value, fmt='json'):
+    """Serialize value to bytes in one of FORMATS"""
+    if fmt == 'json':
+        if not isinstance(value, dict):
+            return json.dumps(value, indent=2, default=json_default).encode()
+        parts = _encode_json_sections(
+            value, lambda section, default: json.dumps(section, indent=2, default=default).replace('\n', '\n  ')
+        )
+        body = ',\n'.join(f'  {json.dumps(str(name))}: {encoded}' for name, encoded in parts)
+        return ('{\n' + body + '\n}' if parts else '{}').encode()
+    if fmt == 'orjson':
+        if orjson is None:
+            raise RuntimeError("SNAPSHOT_FORMAT=orjson needs the orjson package: pip install orjson")
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if not isinstance(value, dict):
+            return orjson.dumps(value, default=json_default, option=option)
+        parts = _encode_json_sections(
+            value, lambda section, default: orjson.dumps(section, default=default, option=option)
+        )
+        return b'{' + b','.join(orjson.dumps(str(name)) + b':' + encoded for name, encoded in parts) + b'}'
+    if fmt == 'msgpack':
+        if msgpack is None:
+            raise RuntimeError("SNAPSHOT_FORMAT=msgpack needs the msgpack package: pip install msgpack")
+        return msgpack.packb(value, default=_msgpack_default)
+    raise ValueError(f"Snapshot format must be one of: {', '.join(FORMATS)}")
+
+def decode(raw):
+    """Deserialize bytes written by encode(), detecting the format from the first byte"""
+    head = raw.lstrip()[:1]
+    if head in (b'{', b'['):
+        return _decode_json_snapshot(raw)
+    # Every top-level msgpack map starts with a fixmap, map16 or map32 marker
+    if head and (0x80 <= head[0] <= 0x8f or head[0] in (0xde, 0xdf)):
+        if msgpack is None:
+            raise RuntimeError("This data file is msgpack encoded, install it with: pip install msgpack")
+        return msgpack.unpackb(raw, ext_hook=_msgpack_ext_hook, strict_map_key=False)
+    raise ValueError("Unrecognised data file format")
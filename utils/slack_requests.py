@@ -0,0 +1,47 @@
+import hashlib
+import hmac
+import logging
+import os
+import time
+
+from flask import current_app, request
+
+# Replies are only posted to response URLs starting with one of these, so a forged
+# payload can't make the bot send data anywhere else
+RESPONSE_URL_PREFIXES = ('https://hooks.slack.com/',)
+# Signed requests older than this many seconds are refused as replays
+MAX_REQUEST_AGE = 60 * 5
+
+def signing_secret():
+    """The Slack signing secret of the current app, create_app() sets it from SIGNING_SECRET"""
+    return current_app.config.get('SLACK_SIGNING_SECRET', os.environ.get('SIGNING_SECRET', ''))
+
+def is_signed(secret, body, timestamp, signature, now=None):
+    """Whether signature is Slack's v0 signature of body sent at timestamp, and recent enough"""
+    if not secret or not timestamp or not signature:
+        return False
+    try:
+        age = abs((now if now is not None else time.time()) - int(timestamp))
+    except ValueError:
+        return False
+    if age > MAX_REQUEST_AGE:
+        return False
+    expected = 'v0=' + hmac.new(secret.encode(), b'v0:' + timestamp.encode() + b':' + body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+def is_slack_request():
+    """Whether the current request carries a valid X-Slack-Signature. Call it before
+    request.form is read, Flask keeps no copy of the raw body once the form is parsed"""
+    body = request.get_data(cache=True)
+    if is_signed(signing_secret(), body, request.headers.get('X-Slack-Request-Timestamp'),
+                 request.headers.get('X-Slack-Signature')):
+        return True
+    logging.getLogger(__name__).warning(f"Refused a request to {request.path} without a valid Slack signature")
+    return False
+
+def is_response_url(url):
+    """Whether url is one of Slack's response URLs"""
+    if isinstance(url, str) and url.startswith(RESPONSE_URL_PREFIXES):
+        return True
+    logging.getLogger(__name__).warning(f"Refused to post to response_url {url!r}")
+    return False
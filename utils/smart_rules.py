@@ -0,0 +1,275 @@
+import logging
+import os
+import threading
+import uuid
+import weakref
+from datetime import datetime, timedelta
+from functools import partial
+
+from utils import data_manager
+from utils.data_manager import notifications, save_data
+from utils.dispatcher import log_failure
+from utils.scheduler import Scheduler
+
+# A project_deadline rule fires when a deadline comes this close
+DEADLINE_WINDOW_DAYS = int(os.environ.get('SMART_NOTIFY_DEADLINE_DAYS', '7'))
+
+CONDITIONS = ('task_completion', 'project_deadline')
+
+def _open_high_priority(task):
+    if task is None:
+        return False
+    priority = task.get('priority')
+    status = task.get('status')
+    return (isinstance(priority, str) and priority.lower() == 'high'
+            and not (isinstance(status, str) and status.lower() == 'completed'))
+
+def _deadline(project):
+    if not isinstance(project, dict) or not project.get('deadline'):
+        return None
+    try:
+        return datetime.strptime(project['deadline'], '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return None
+
+class _StoreRules:
+    """The rules of one store and what they watch in it: the ids of its open
+    high-priority tasks and of the projects inside the deadline window"""
+
+    def __init__(self):
+        self.rules = {condition: {} for condition in CONDITIONS}
+        self.open_high = set()
+        self.in_window = set()
+
+class RuleEngine:
+    """Standing /smart-notify rules that are checked as the data they watch changes.
+
+    task_completion fires when the last open high-priority task is completed or
+    deleted, project_deadline when a project's deadline comes within
+    DEADLINE_WINDOW_DAYS days, either because the deadline was changed or, through a
+    timer set for that day, because time passed. Both fire once per transition, and
+    each change only updates a set, so rules cost nothing while nothing they watch
+    changes. A rule with a time of day delivers at the next such time. At start the
+    deadline timers of every tenant are set from its saved rules and projects. Timers and
+    delayed notifications run on the bot's shared scheduler, which main.py sets before
+    starting the engine, or else on a scheduler of the engine's own, as in tests.
+    """
+
+    def __init__(self, client=None, scheduler=None, clock=datetime.now):
+        self.client = client
+        self.clock = clock
+        self._scheduler = scheduler
+        self.stats = {'changes': 0, 'fired': 0}
+        self._stores = weakref.WeakKeyDictionary()
+        self._lock = threading.RLock()
+
+    @property
+    def scheduler(self):
+        if self._scheduler is None:
+            self._scheduler = Scheduler(workers=1, clock=self.clock)
+        return self._scheduler
+
+    @scheduler.setter
+    def scheduler(self, scheduler):
+        self._scheduler = scheduler
+
+    def add_rule(self, condition, message, channel_id, user_id=None, at=None, team_id=None):
+        """Save a rule and start watching for it, returns its id. at is 'HH:MM' or None.
+        A rule whose condition already holds notifies once right away"""
+        if condition not in CONDITIONS:
+            raise ValueError(f"Unknown condition {condition}, use: {', '.join(CONDITIONS)}")
+        if at:
+            datetime.strptime(at, '%H:%M')
+        rule_id = uuid.uuid4().hex[:8]
+        rule = {
+            'condition': condition,
+            'message': message,
+            'channel_id': channel_id,
+            'user_id': user_id,
+            'team_id': team_id,
+            'time': at
+        }
+        notifications[rule_id] = rule
+        save_data('notifications', rule_id)
+        store = data_manager.current_store()
+        with self._lock:
+            state = self._state(store)
+            state.rules[condition][rule_id] = rule
+            if condition == 'task_completion' and not state.open_high:
+                self._notify(rule, f"🎉 Smart notification: {message}")
+            elif condition == 'project_deadline':
+                projects = store.collections['project_summaries']
+                for project_id in sorted(state.in_window):
+                    self._notify(rule, self._deadline_text(rule, project_id, projects.get(project_id)))
+        return rule_id
+
+    def remove_rule(self, rule_id, user_id=None):
+        """Delete a rule, only if it is user_id's when given. Returns whether it was"""
+        rule = notifications.get(rule_id)
+        if not isinstance(rule, dict) or rule.get('condition') not in CONDITIONS:
+            return False
+        if user_id is not None and rule.get('user_id') != user_id:
+            return False
+        del notifications[rule_id]
+        save_data('notifications', rule_id)
+        with self._lock:
+            state = self._stores.get(data_manager.current_store())
+            if state is not None:
+                state.rules[rule['condition']].pop(rule_id, None)
+        return True
+
+    def rules(self, user_id=None):
+        """{rule_id: rule} of the current store, only user_id's when given"""
+        return {rule_id: rule for rule_id, rule in notifications.items()
+                if isinstance(rule, dict) and rule.get('condition') in CONDITIONS
+                and (user_id is None or rule.get('user_id') == user_id)}
+
+    def _state(self, store):
+        """The store's rules, indexing what they watch the first time. This is the only
+        full pass over the store's tasks and projects. Callers hold _lock"""
+        state = self._stores.get(store)
+        if state is None:
+            state = self._stores[store] = _StoreRules()
+            self._task_changed(store, state, None, notify=False)
+            self._projects_changed(store, state, notify=False)
+        return state
+
+    def restore(self, store):
+        """Index the rules saved in a store, called when a store loads. Conditions that
+        already hold are taken as notified"""
+        rules = {rule_id: rule for rule_id, rule in store.collections['notifications'].items()
+                 if isinstance(rule, dict) and rule.get('condition') in CONDITIONS}
+        with self._lock:
+            self._stores.pop(store, None)
+            if not rules:
+                return
+            state = self._state(store)
+            for rule_id, rule in rules.items():
+                state.rules[rule['condition']][rule_id] = rule
+
+    def on_change(self, store, collection, key):
+        """Follow a saved change, called by data_manager"""
+        state = self._stores.get(store)
+        if state is None or collection not in ('tasks', 'project_summaries'):
+            return
+        with self._lock:
+            self.stats['changes'] += 1
+            if collection == 'tasks':
+                self._task_changed(store, state, key)
+            elif key is None:
+                self._projects_changed(store, state)
+            else:
+                self._check_project(store, state, key, store.collections['project_summaries'].get(key))
+
+    def _task_changed(self, store, state, key, notify=True):
+        had_open = bool(state.open_high)
+        tasks = store.collections['tasks']
+        if key is None:
+            state.open_high = {task_id for task_id, task in tasks.items() if _open_high_priority(task)}
+        elif _open_high_priority(tasks.get(key)):
+            state.open_high.add(key)
+        else:
+            state.open_high.discard(key)
+        if notify and had_open and not state.open_high:
+            for rule in list(state.rules['task_completion'].values()):
+                self._notify(rule, f"🎉 Smart notification: {rule['message']}")
+
+    def _projects_changed(self, store, state, notify=True):
+        previous = set(state.in_window)
+        state.in_window.clear()
+        for project_id, project in store.collections['project_summaries'].items():
+            self._check_project(store, state, project_id, project, notify and project_id not in previous)
+
+    def _check_project(self, store, state, project_id, project, notify=True):
+        """Move a project in or out of the deadline window, and set a timer for the day it
+        enters when that is still ahead. Callers hold _lock"""
+        deadline = _deadline(project)
+        today = self.clock().date()
+        # Keyed by tenant, not by store object, so the timer outlives an evicted store
+        job_id = ('deadline', store.key, project_id)
+        if deadline is None or (deadline - today).days > DEADLINE_WINDOW_DAYS:
+            state.in_window.discard(project_id)
+            if deadline is not None:
+                self._set_timer(store.key, project_id, deadline)
+            else:
+                self.scheduler.remove_job(job_id)
+            return
+        self.scheduler.remove_job(job_id)
+        if project_id in state.in_window:
+            return
+        state.in_window.add(project_id)
+        if notify:
+            for rule in list(state.rules['project_deadline'].values()):
+                self._notify(rule, self._deadline_text(rule, project_id, project))
+
+    def _set_timer(self, key, project_id, deadline):
+        """Check the project again on the day its deadline comes within the window"""
+        enters = deadline - timedelta(days=DEADLINE_WINDOW_DAYS)
+        self.scheduler.add_job(
+            partial(self._deadline_reached, key, project_id),
+            trigger='date',
+            run_date=datetime(enters.year, enters.month, enters.day),
+            id=('deadline', key, project_id)
+        )
+
+    def restore_tenants(self):
+        """Set the deadline timers of every tenant with a project_deadline rule. Rules and projects
+        are read from the tenants' files, a store is only loaded once one of its timers fires"""
+        today = self.clock().date()
+        for key in data_manager.tenant_keys():
+            saved_rules = data_manager.read_collection(key, 'notifications').values()
+            if not any(isinstance(rule, dict) and rule.get('condition') == 'project_deadline' for rule in saved_rules):
+                continue
+            for project_id, project in data_manager.read_collection(key, 'project_summaries').items():
+                deadline = _deadline(project)
+                if deadline is not None and (deadline - today).days > DEADLINE_WINDOW_DAYS:
+                    self._set_timer(key, project_id, deadline)
+
+    def _deadline_reached(self, key, project_id):
+        """The timer of the day a project enters the window, loads its tenant's store if it
+        was evicted meanwhile"""
+        with data_manager.use_tenant_key(key) as store:
+            with self._lock:
+                state = self._stores.get(store)
+                if state is None:
+                    return
+                # A store loaded since the timer was set took the project as already in the
+                # window without notifying, this is the transition it was waiting for
+                state.in_window.discard(project_id)
+                self._check_project(store, state, project_id, store.collections['project_summaries'].get(project_id))
+
+    def _deadline_text(self, rule, project_id, project):
+        return f"⚠️ Project deadline alert: {rule['message']} ({project.get('name', project_id)} is due {project['deadline']})"
+
+    def _notify(self, rule, text):
+        self.stats['fired'] += 1
+        post = partial(self._post, rule['channel_id'], text)
+        if not rule.get('time'):
+            post()
+            return
+        hour, minute = map(int, rule['time'].split(':'))
+        now = self.clock()
+        at = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if at <= now:
+            at += timedelta(days=1)
+        self.scheduler.add_job(post, trigger='date', run_date=at)
+
+    def _post(self, channel, text):
+        try:
+            log_failure(self.client.chat_postMessage(channel=channel, text=text), channel, 'smart notification')
+        except Exception:
+            logging.getLogger(__name__).exception(f"Smart notification to {channel} failed")
+
+    def run_due(self):
+        """Send the notifications and check the deadlines due now in the calling thread"""
+        return self.scheduler.run_due()
+
+    def start(self):
+        """Start the scheduler, with the deadline timers of the default store and of every tenant set"""
+        data_manager.current_store()
+        self.restore_tenants()
+        self.scheduler.start()
+
+rule_engine = RuleEngine()
+data_manager.add_load_listener(rule_engine.restore)
+data_manager.add_change_listener(rule_engine.on_change)
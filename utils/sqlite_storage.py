@@ -0,0 +1,155 @@
+import sqlite3
+
+from utils.serialization import dumps_json, loads_json
+
+TASK_INDEXES = ('status', 'priority', 'category', 'assigned_to', 'due_date')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    status TEXT COLLATE NOCASE,
+    priority TEXT COLLATE NOCASE,
+    category TEXT COLLATE NOCASE,
+    assigned_to TEXT,
+    due_date TEXT,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS records (
+    collection TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (collection, key)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+""" + ''.join(
+    f"CREATE INDEX IF NOT EXISTS idx_tasks_{column} ON tasks({column});\n" for column in TASK_INDEXES
+)
+
+def connect(path):
+    """Open the SQLite database at path and make sure the schema exists"""
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.executescript(_SCHEMA)
+    return conn
+
+def _task_row(task_id, task):
+    return (
+        task_id,
+        task.get('status'),
+        task.get('priority'),
+        task.get('category'),
+        task.get('assigned_to'),
+        task.get('due_date'),
+        dumps_json(task)
+    )
+
+def _put(conn, collection, key, value):
+    if collection == 'tasks':
+        conn.execute(
+            "INSERT OR REPLACE INTO tasks (id, status, priority, category, assigned_to, due_date, data) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            _task_row(int(key), value)
+        )
+    else:
+        conn.execute(
+            "INSERT OR REPLACE INTO records (collection, key, value) VALUES (?, ?, ?)",
+            (collection, str(key), dumps_json(value))
+        )
+
+def _delete_collection(conn, collection):
+    if collection == 'tasks':
+        conn.execute("DELETE FROM tasks")
+    else:
+        conn.execute("DELETE FROM records WHERE collection = ?", (collection,))
+
+def load(conn, collections):
+    """Read every collection back into a state dict"""
+    state = {name: {} for name in collections}
+    for task_id, data in conn.execute("SELECT id, data FROM tasks ORDER BY id"):
+        state['tasks'][task_id] = loads_json(data)
+    for collection, key, value in conn.execute("SELECT collection, key, value FROM records ORDER BY rowid"):
+        if collection in state:
+            state[collection][key] = loads_json(value)
+    row = conn.execute("SELECT value FROM meta WHERE name = 'task_counter'").fetchone()
+    state['task_counter'] = int(row[0]) if row else 1
+    return state
+
+def load_collection(conn, name):
+    """Read one collection back without the others"""
+    if name == 'tasks':
+        return {task_id: loads_json(data) for task_id, data in conn.execute("SELECT id, data FROM tasks ORDER BY id")}
+    return {key: loads_json(value) for key, value in
+            conn.execute("SELECT key, value FROM records WHERE collection = ? ORDER BY rowid", (name,))}
+
+def _write(conn, collection, key, value, deleted):
+    if key is None:
+        _delete_collection(conn, collection)
+        for item_key, item in value.items():
+            _put(conn, collection, item_key, item)
+    elif deleted:
+        if collection == 'tasks':
+            conn.execute("DELETE FROM tasks WHERE id = ?", (int(key),))
+        else:
+            conn.execute("DELETE FROM records WHERE collection = ? AND key = ?", (collection, str(key)))
+    else:
+        _put(conn, collection, key, value)
+
+def write_record(conn, collection, key, value, task_counter, deleted=False):
+    """Write one changed record, or replace a whole collection when key is None"""
+    write_records(conn, [(collection, key, value, deleted)], task_counter)
+
+def write_records(conn, records, task_counter):
+    """Write (collection, key, value, deleted) records in one transaction, as write_record does"""
+    with conn:
+        for collection, key, value, deleted in records:
+            _write(conn, collection, key, value, deleted)
+        conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('task_counter', ?)", (task_counter,))
+
+def write_state(conn, state, collections):
+    """Replace the whole database contents with state"""
+    with conn:
+        for name in collections:
+            _delete_collection(conn, name)
+            for key, value in state[name].items():
+                _put(conn, name, key, value)
+        conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('task_counter', ?)", (state['task_counter'],))
+
+def _where(status=None, priority=None, category=None, assigned_to=None, overdue_before=None, after_id=None):
+    clauses = []
+    params = []
+    if after_id is not None:
+        clauses.append("id > ?")
+        params.append(after_id)
+    for column, value in (('status', status), ('priority', priority), ('category', category), ('assigned_to', assigned_to)):
+        if value is not None:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+    if overdue_before is not None:
+        clauses.append("due_date < ? AND status != 'completed'")
+        params.append(overdue_before)
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+def task_ids(conn, limit=None, **filters):
+    """Ids of tasks matching the filters, in id order or due date order for overdue queries"""
+    where, params = _where(**filters)
+    order = "due_date, id" if filters.get('overdue_before') is not None else "id"
+    query = f"SELECT id FROM tasks{where} ORDER BY {order}"
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+    return [row[0] for row in conn.execute(query, params)]
+
+def count_tasks(conn, **filters):
+    """Number of tasks matching the filters"""
+    where, params = _where(**filters)
+    return conn.execute(f"SELECT COUNT(*) FROM tasks{where}", params).fetchone()[0]
+
+def count_tasks_by(conn, field):
+    """Map of field value to task count, grouped case-sensitively"""
+    if field not in TASK_INDEXES:
+        raise ValueError(f"Cannot group tasks by {field}")
+    return dict(conn.execute(
+        f"SELECT {field} COLLATE BINARY, COUNT(*) FROM tasks GROUP BY {field} COLLATE BINARY ORDER BY MIN(id)"
+    ))
@@ -1,20 +1,127 @@
-def send_standup_prompt(client, channel):
-    """Send daily standup prompt"""
-    client.chat_postMessage(
-        channel=channel,
-        text="🌅 **Daily Standup Time!**\n\nPlease reply with:\n1️⃣ What you worked on yesterday\n2️⃣ What the plan is for today\n3️⃣ Any blockers or updates"
-    )
-
-def send_weekly_standup_prompt(client, channel):
-    """Send weekly standup prompt"""
-    client.chat_postMessage(
-        channel=channel,
-        text="📅 **Weekly Standup Time!**\n\nPlease share:\n1️⃣ What you accomplished this week\n2️⃣ What you plan to work on next week\n3️⃣ Any challenges or insights"
-    )
-
-def send_monthly_standup_prompt(client, channel):
-    """Send monthly standup prompt"""
-    client.chat_postMessage(
-        channel=channel,
-        text="📊 **Monthly Review Time!**\n\nPlease reflect on:\n1️⃣ Key achievements this month\n2️⃣ Goals for next month\n3️⃣ Any process improvements or suggestions"
-    ) 
\ No newline at end of file
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from slack_sdk.errors import SlackApiError
+
+from utils import data_manager
+
+# Project channels that get the standup prompts besides SLACK_CHANNEL, comma separated
+STANDUP_CHANNELS = [channel.strip() for channel in os.environ.get('STANDUP_CHANNELS', '').split(',') if channel.strip()]
+# Whether every member in team_members also gets the prompts as a DM
+STANDUP_DMS = os.environ.get('STANDUP_DMS', 'false').lower() == 'true'
+# DM channels opened at once
+STANDUP_FANOUT_WORKERS = int(os.environ.get('STANDUP_FANOUT_WORKERS', '8'))
+
+DAILY_PROMPT = "🌅 **Daily Standup Time!**\n\nPlease reply with:\n1️⃣ What you worked on yesterday\n2️⃣ What the plan is for today\n3️⃣ Any blockers or updates"
+WEEKLY_PROMPT = "📅 **Weekly Standup Time!**\n\nPlease share:\n1️⃣ What you accomplished this week\n2️⃣ What you plan to work on next week\n3️⃣ Any challenges or insights"
+MONTHLY_PROMPT = "📊 **Monthly Review Time!**\n\nPlease reflect on:\n1️⃣ Key achievements this month\n2️⃣ Goals for next month\n3️⃣ Any process improvements or suggestions"
+
+class _Report:
+    """Collects the outcome of every recipient of one fan-out and resolves future with
+    {recipient: 'ok' or the error} once the last one is in"""
+
+    def __init__(self, recipients):
+        self.results = {}
+        self.remaining = len(recipients)
+        self.future = Future()
+        self._lock = threading.Lock()
+        if not self.remaining:
+            self.future.set_result(self.results)
+
+    def done(self, recipient, error=None):
+        with self._lock:
+            self.results[recipient] = 'ok' if error is None else _error(error)
+            self.remaining -= 1
+            if self.remaining:
+                return
+        failed = {recipient: result for recipient, result in self.results.items() if result != 'ok'}
+        logging.getLogger(__name__).info(f"Standup sent to {len(self.results) - len(failed)} of {len(self.results)} recipients")
+        if failed:
+            logging.getLogger(__name__).warning(f"Standup not delivered to: {failed}")
+        self.future.set_result(self.results)
+
+class StandupFanout:
+    """Sends a standup prompt to several channels and as a DM to each team member at once.
+
+    client is the bot's MessageDispatcher or a plain WebClient. DM channels are opened with
+    conversations.open on a pool of `workers` threads, and their ids are cached so a member
+    is only opened once. Each message is posted as soon as its channel is known. Through the
+    dispatcher, 429s are waited out and the messages go out concurrently within its
+    per-channel rate limits. send() returns right away with a Future of
+    {recipient: 'ok' or the error}, which is also logged once every recipient is settled.
+    """
+
+    def __init__(self, client=None, workers=None):
+        self.client = client
+        self.workers = workers or STANDUP_FANOUT_WORKERS
+        self._dm_channels = {}
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='standup')
+            return self._executor
+
+    def dm_channel(self, user_id):
+        """The id of the bot's DM channel with a user, opened the first time"""
+        with self._lock:
+            channel = self._dm_channels.get(user_id)
+        if channel is None:
+            channel = self.client.conversations_open(users=user_id)['channel']['id']
+            with self._lock:
+                self._dm_channels[user_id] = channel
+        return channel
+
+    def _post(self, recipient, channel, text, report):
+        try:
+            sent = self.client.chat_postMessage(channel=channel, text=text)
+        except Exception as e:
+            report.done(recipient, e)
+            return
+        if isinstance(sent, Future):
+            sent.add_done_callback(lambda future: report.done(recipient, future.exception()))
+        else:
+            # A plain WebClient has already sent it, or raised
+            report.done(recipient)
+
+    def _post_dm(self, user_id, text, report):
+        try:
+            channel = self.dm_channel(user_id)
+        except Exception as e:
+            report.done(user_id, e)
+            return
+        self._post(user_id, channel, text, report)
+
+    def send(self, text, channels=(), users=()):
+        """Post text to every channel and DM it to every user without waiting for either,
+        returns a Future of {recipient: 'ok' or error}"""
+        channels = list(dict.fromkeys(channels))
+        users = list(dict.fromkeys(users))
+        report = _Report(channels + users)
+        for channel in channels:
+            self._post(channel, channel, text, report)
+        for user_id in users:
+            self._pool().submit(self._post_dm, user_id, text, report)
+        return report.future
+
+def _error(e):
+    """What to report for a recipient the prompt didn't reach"""
+    if isinstance(e, SlackApiError):
+        return e.response.get('error') or str(e)
+    return str(e) or type(e).__name__
+
+standup_fanout = StandupFanout()
+
+def send_standup(text, channel):
+    """Fan a prompt out to channel, STANDUP_CHANNELS and, with STANDUP_DMS, the team_members of
+    the default store and of every tenant. The members are read without loading the tenants.
+    Returns the Future of the results without waiting"""
+    users = []
+    if STANDUP_DMS:
+        for key in [None] + data_manager.tenant_keys():
+            users.extend(data_manager.read_collection(key, 'team_members'))
+    return standup_fanout.send(text, ([channel] if channel else []) + STANDUP_CHANNELS, users)
@@ -0,0 +1,174 @@
+import sys
+
+FIELDS = (
+    'description', 'priority', 'category', 'status', 'created_by', 'created_at', 'due_date',
+    'estimated_hours', 'assigned_to', 'completed_at', 'actual_hours', 'comments', 'attachments'
+)
+_LAZY_LISTS = ('comments', 'attachments')
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+class Task:
+    """A task record that reads and writes like the task dicts it replaces.
+
+    Uses slots instead of a per-task dict, shares one string object per distinct
+    status, priority and category, and only creates the comments and attachments
+    lists once something touches them.
+    """
+
+    __slots__ = (
+        'description', '_priority', '_category', '_status', 'created_by', 'created_at', 'due_date',
+        'estimated_hours', 'assigned_to', 'completed_at', 'actual_hours', '_comments', '_attachments',
+        '_extra'
+    )
+
+    def __init__(self, description, priority='Normal', category='General', status='Open',
+                 created_by=None, created_at=None, due_date=None, estimated_hours=None,
+                 assigned_to=None, completed_at=None, actual_hours=None, comments=None,
+                 attachments=None):
+        self.description = description
+        self._priority = _intern(priority)
+        self._category = _intern(category)
+        self._status = _intern(status)
+        self.created_by = created_by
+        self.created_at = created_at
+        self.due_date = due_date
+        self.estimated_hours = estimated_hours
+        self.assigned_to = assigned_to
+        self.completed_at = completed_at
+        self.actual_hours = actual_hours
+        self._comments = comments or None
+        self._attachments = attachments or None
+        self._extra = None
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a Task from its external dict form, keeping any unknown keys"""
+        if isinstance(data, cls):
+            return data
+        task = cls(**{field: data[field] for field in FIELDS if field in data})
+        extra = {key: value for key, value in data.items() if key not in FIELDS}
+        if extra:
+            task._extra = extra
+        return task
+
+    def copy(self):
+        """A copy that later changes to this task, its comments or attachments don't show up in"""
+        task = Task.__new__(Task)
+        for slot in Task.__slots__:
+            setattr(task, slot, getattr(self, slot))
+        if self._comments is not None:
+            task._comments = list(self._comments)
+        if self._attachments is not None:
+            task._attachments = list(self._attachments)
+        if self._extra is not None:
+            task._extra = dict(self._extra)
+        return task
+
+    def to_dict(self):
+        """The external dict form, identical to what create_task used to store"""
+        data = {
+            'description': self.description,
+            'priority': self._priority,
+            'category': self._category,
+            'status': self._status,
+            'created_by': self.created_by,
+            'created_at': self.created_at,
+            'due_date': self.due_date,
+            'estimated_hours': self.estimated_hours,
+            'assigned_to': self.assigned_to,
+            'completed_at': self.completed_at,
+            'actual_hours': self.actual_hours,
+            'comments': list(self._comments or ()),
+            'attachments': list(self._attachments or ())
+        }
+        if self._extra:
+            data.update(self._extra)
+        return data
+
+    @property
+    def priority(self):
+        return self._priority
+
+    @priority.setter
+    def priority(self, value):
+        self._priority = _intern(value)
+
+    @property
+    def category(self):
+        return self._category
+
+    @category.setter
+    def category(self, value):
+        self._category = _intern(value)
+
+    @property
+    def status(self):
+        return self._status
+
+    @status.setter
+    def status(self, value):
+        self._status = _intern(value)
+
+    @property
+    def comments(self):
+        if self._comments is None:
+            self._comments = []
+        return self._comments
+
+    @property
+    def attachments(self):
+        if self._attachments is None:
+            self._attachments = []
+        return self._attachments
+
+    def __getitem__(self, key):
+        if key in FIELDS:
+            return getattr(self, key)
+        if self._extra and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in _LAZY_LISTS:
+            setattr(self, '_' + key, value)
+        elif key in FIELDS:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __contains__(self, key):
+        return key in FIELDS or bool(self._extra and key in self._extra)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return list(FIELDS) + list(self._extra or ())
+
+    def items(self):
+        return self.to_dict().items()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(FIELDS) + len(self._extra or ())
+
+    def __eq__(self, other):
+        if isinstance(other, Task):
+            return self.to_dict() == other.to_dict()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Task({self.to_dict()!r})"
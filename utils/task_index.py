@@ -0,0 +1,138 @@
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime
+
+INDEXED_FIELDS = ('status', 'priority', 'category', 'assigned_to')
+# These filters compare case-insensitively, assignees must match exactly
+_CASE_INSENSITIVE = ('status', 'priority', 'category')
+
+def _index_key(field, value):
+    if field in _CASE_INSENSITIVE and isinstance(value, str):
+        return value.lower()
+    return value
+
+def _due_key(task_id, task):
+    """(parsed due date, id) for open tasks with a due date, None for everything else"""
+    due_date = task.get('due_date')
+    status = task.get('status')
+    if not due_date or (isinstance(status, str) and status.lower() == 'completed'):
+        return None
+    try:
+        return (datetime.fromisoformat(due_date).date(), task_id)
+    except (TypeError, ValueError):
+        return None
+
+def _discard(ordered, item):
+    """Remove item from a sorted list if it is there"""
+    position = bisect_left(ordered, item)
+    if position < len(ordered) and ordered[position] == item:
+        del ordered[position]
+
+class TaskIndex:
+    """Maps each indexed field value to the sorted list of task ids holding it, keeps
+    every id in one sorted list, and open tasks with a due date in a list sorted by
+    that date. A page of ids starts with a bisect to the cursor, so it costs about its
+    own size, not the number of tasks"""
+
+    def __init__(self):
+        self._buckets = {field: {} for field in INDEXED_FIELDS}
+        self._entries = {}
+        self._ids = []
+        self._due = []
+        self._due_entries = {}
+
+    def rebuild(self, tasks):
+        """Throw the index away and build it again from every task"""
+        self._buckets = {field: {} for field in INDEXED_FIELDS}
+        self._entries = {}
+        self._ids = []
+        self._due = []
+        self._due_entries = {}
+        for task_id, task in tasks.items():
+            self.update(task_id, task)
+
+    def update(self, task_id, task):
+        """Re-file one task after it changed, pass task=None once it is deleted"""
+        old = self._entries.pop(task_id, None)
+        if old is not None:
+            for field, key in zip(INDEXED_FIELDS, old):
+                bucket = self._buckets[field].get(key)
+                if bucket is not None:
+                    _discard(bucket, task_id)
+                    if not bucket:
+                        del self._buckets[field][key]
+        old_due = self._due_entries.pop(task_id, None)
+        if old_due is not None:
+            _discard(self._due, old_due)
+        if task is None:
+            if old is not None:
+                _discard(self._ids, task_id)
+            return
+        if old is None:
+            insort(self._ids, task_id)
+        keys = tuple(_index_key(field, task.get(field)) for field in INDEXED_FIELDS)
+        for field, key in zip(INDEXED_FIELDS, keys):
+            insort(self._buckets[field].setdefault(key, []), task_id)
+        self._entries[task_id] = keys
+        due = _due_key(task_id, task)
+        if due is not None:
+            insort(self._due, due)
+            self._due_entries[task_id] = due
+
+    def overdue(self, before, limit=None):
+        """Ids of open tasks due before the given date, oldest due date first"""
+        end = bisect_left(self._due, (before,))
+        if limit is not None:
+            end = min(end, limit)
+        return [task_id for _, task_id in self._due[:end]]
+
+    def count_overdue(self, before):
+        return bisect_left(self._due, (before,))
+
+    def ids(self, overdue_before=None, after=None, limit=None, **filters):
+        """Ids of tasks matching every non-empty filter, in id order, or in due date
+        order when restricted to tasks overdue before a date. after and limit page
+        through the id ordered results"""
+        wanted = [
+            (INDEXED_FIELDS.index(field), _index_key(field, value))
+            for field, value in filters.items() if value
+        ]
+        entries = self._entries
+
+        def matches(task_id):
+            keys = entries[task_id]
+            return all(keys[position] == key for position, key in wanted)
+
+        if overdue_before is not None:
+            return [task_id for task_id in self.overdue(overdue_before) if matches(task_id)]
+        ordered = self._ids
+        if wanted:
+            # Walk the smallest bucket and check the other filters on each of its ids
+            ordered = min((self._buckets[INDEXED_FIELDS[position]].get(key, []) for position, key in wanted), key=len)
+        found = []
+        for position in range(0 if after is None else bisect_right(ordered, after), len(ordered)):
+            task_id = ordered[position]
+            if matches(task_id):
+                found.append(task_id)
+                if len(found) == limit:
+                    break
+        return found
+
+    def count(self, overdue_before=None, **filters):
+        """Number of tasks matching every non-empty filter"""
+        active = [(field, value) for field, value in filters.items() if value]
+        if overdue_before is not None:
+            if not active:
+                return self.count_overdue(overdue_before)
+            return len(self.ids(overdue_before, **filters))
+        if not active:
+            return len(self._entries)
+        if len(active) == 1:
+            field, value = active[0]
+            return len(self._buckets[field].get(_index_key(field, value), ()))
+        return len(self.ids(**filters))
+
+    def __eq__(self, other):
+        if not isinstance(other, TaskIndex):
+            return NotImplemented
+        return (self._buckets == other._buckets and self._entries == other._entries
+                and self._ids == other._ids and self._due == other._due)
@@ -0,0 +1,116 @@
+import math
+
+def _bump(counter, key, amount):
+    value = counter.get(key, 0) + amount
+    if value:
+        counter[key] = value
+    else:
+        counter.pop(key, None)
+
+def _hours(value):
+    try:
+        return float(value) if value is not None else 0.0
+    except (TypeError, ValueError):
+        return 0.0
+
+def _task_entry(task):
+    status = task.get('status')
+    status_key = status.lower() if isinstance(status, str) else status
+    if status_key == 'completed':
+        actual = task.get('actual_hours')
+        done_hours = _hours(actual if actual is not None else task.get('estimated_hours'))
+        open_hours = 0.0
+    else:
+        done_hours = 0.0
+        open_hours = _hours(task.get('estimated_hours'))
+    return (status_key, task.get('priority'), task.get('assigned_to'), done_hours, open_hours)
+
+class TaskStats:
+    """Running task totals, adjusted on every change instead of recounted per report"""
+
+    def __init__(self):
+        self.rebuild({})
+
+    def rebuild(self, tasks):
+        """Recount everything from scratch"""
+        self.total = 0
+        self.by_status = {}
+        self.by_priority = {}
+        self.by_assignee = {}
+        self.by_assignee_status = {}
+        self.completed_hours = 0.0
+        self.open_hours = 0.0
+        self._entries = {}
+        for task_id, task in tasks.items():
+            self.update(task_id, task)
+
+    def update(self, task_id, task):
+        """Swap the old contribution of one task for its current one, task=None once deleted"""
+        old = self._entries.pop(task_id, None)
+        if old is not None:
+            self._apply(old, -1)
+        if task is None:
+            return
+        entry = _task_entry(task)
+        self._apply(entry, 1)
+        self._entries[task_id] = entry
+
+    def _apply(self, entry, sign):
+        status, priority, assignee, done_hours, open_hours = entry
+        self.total += sign
+        _bump(self.by_status, status, sign)
+        _bump(self.by_priority, priority, sign)
+        _bump(self.by_assignee, assignee, sign)
+        _bump(self.by_assignee_status, (assignee, status), sign)
+        self.completed_hours += sign * done_hours
+        self.open_hours += sign * open_hours
+
+    def count(self, status=None, priority=None, assigned_to=None):
+        """Count for a filter combination the counters cover"""
+        if priority:
+            return sum(count for value, count in self.by_priority.items()
+                       if isinstance(value, str) and value.lower() == priority.lower())
+        if assigned_to and status:
+            return self.by_assignee_status.get((assigned_to, status.lower()), 0)
+        if assigned_to:
+            return self.by_assignee.get(assigned_to, 0)
+        if status:
+            return self.by_status.get(status.lower(), 0)
+        return self.total
+
+    def differences(self, other):
+        """Names of the counters that disagree with another TaskStats"""
+        found = [name for name in ('total', 'by_status', 'by_priority', 'by_assignee', 'by_assignee_status')
+                 if getattr(self, name) != getattr(other, name)]
+        found += [name for name in ('completed_hours', 'open_hours')
+                  if not math.isclose(getattr(self, name), getattr(other, name), abs_tol=1e-6)]
+        return found
+
+class ProjectStats:
+    """Running project counts per status"""
+
+    def __init__(self):
+        self.rebuild({})
+
+    def rebuild(self, projects):
+        self.by_status = {}
+        self._entries = {}
+        for project_id, project in projects.items():
+            self.update(project_id, project)
+
+    def update(self, project_id, project):
+        old = self._entries.pop(project_id, None)
+        if old is not None:
+            _bump(self.by_status, old, -1)
+        # Summaries made by /create-project-summary are plain strings without a status
+        if not isinstance(project, dict):
+            return
+        status = project.get('status')
+        _bump(self.by_status, status, 1)
+        self._entries[project_id] = status
+
+    def count(self, status):
+        return self.by_status.get(status, 0)
+
+    def differences(self, other):
+        return ['by_status'] if self.by_status != other.by_status else []
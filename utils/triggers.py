@@ -0,0 +1,217 @@
+import json
+import logging
+import os
+import re
+import threading
+
+from utils.data_manager import tasks, find_overdue_tasks
+from utils.dispatcher import log_failure
+
+# JSON file mapping a channel id, or "default", to a list of triggers such as
+# {"name": "praise", "phrases": ["good job"], "action": "react", "reaction": "thumbsup"}
+TRIGGERS_FILE = os.environ.get('TRIGGERS_FILE', '')
+
+DEFAULT_TRIGGERS = [
+    {'name': 'praise', 'phrases': ['good job', 'great work', 'excellent', 'awesome'],
+     'action': 'react', 'reaction': 'thumbsup'},
+    {'name': 'overdue', 'phrases': ['overdue', 'late', 'missed deadline'],
+     'action': 'overdue_digest'},
+    {'name': 'task_lookup', 'pattern': r'task\s*#(\d+)', 'action': 'task_lookup'},
+]
+
+# Numbered backreferences and conditionals, which would point at the wrong group once a
+# pattern sits inside the combined regex. A false hit only means the pattern runs alone
+_GROUP_REFERENCE = re.compile(r'\\[1-9]|\(\?\(')
+
+class TriggerMatcher:
+    """Every trigger of a channel compiled into one lookup table.
+
+    A phrase matches anywhere in the lowercased message, as `phrase in text.lower()`
+    always did, so "late" also matches "translate". All phrases share one regex, so a
+    message without any of them is ruled out by a single search no matter how many
+    triggers there are. A trigger may give a regex as pattern instead. Patterns share one
+    combined regex unless they refer to their own groups by number or can't be embedded,
+    those are searched on their own.
+    """
+
+    def __init__(self, triggers):
+        self.triggers = list(triggers)
+        phrases = {}
+        self._patterns = {}
+        self._separate = []
+        alternatives = []
+        for number, trigger in enumerate(self.triggers):
+            if 'pattern' in trigger:
+                self._patterns[number] = re.compile(trigger['pattern'], re.IGNORECASE)
+                # The group name maps a hit back to its trigger: it encloses the pattern's
+                # own groups, so it is the last group closed whichever of them matched
+                alternative = _named(number, self._patterns[number])
+                if alternative is None:
+                    self._separate.append(number)
+                else:
+                    alternatives.append(alternative)
+                continue
+            for phrase in trigger['phrases']:
+                if phrase:
+                    phrases.setdefault(phrase.lower(), []).append(number)
+        # The regex finds the longest phrase at a position, every other phrase there is a prefix of it
+        ordered = sorted(phrases, key=len, reverse=True)
+        self._phrases = {
+            phrase: [(prefix, number) for prefix in ordered if phrase.startswith(prefix) for number in phrases[prefix]]
+            for phrase in ordered
+        }
+        try:
+            either = _trie_pattern(ordered)
+            self._phrase_regex = re.compile(either) if ordered else None
+        except (RecursionError, re.error):
+            # Nested too deep, e.g. hundreds of phrases each one letter longer than the last.
+            # Longest first so the first that matches at a position is still the longest
+            either = '|'.join(map(re.escape, ordered))
+            self._phrase_regex = re.compile(either)
+        # An empty match at every position, capturing the phrase that starts there
+        self._phrase_starts = re.compile(f"(?=({either}))") if ordered else None
+        self._regex = re.compile('|'.join(alternatives), re.IGNORECASE) if alternatives else None
+
+    def match(self, text):
+        """[(trigger, match)] for each trigger found in text, in trigger order. match is the
+        phrase that fired, or the re.Match of a pattern trigger"""
+        if not text:
+            return []
+        found = {}
+        lowered = text.lower()
+        # Most messages trigger nothing, one search rules those out
+        first = self._phrase_regex.search(lowered) if self._phrase_regex is not None else None
+        if first is not None:
+            for start in self._phrase_starts.finditer(lowered, first.start()):
+                for phrase, number in self._phrases[start.group(1)]:
+                    if number not in found:
+                        found[number] = phrase
+        if not found and self._regex is None and not self._separate:
+            return []
+        if self._regex is not None:
+            for hit in self._regex.finditer(text):
+                number = int(hit.lastgroup[1:])
+                if number not in found:
+                    found[number] = self._patterns[number].match(text, hit.start())
+        for number in self._separate:
+            hit = self._patterns[number].search(text)
+            if hit is not None:
+                found[number] = hit
+        return [(self.triggers[number], found[number]) for number in sorted(found)]
+
+def _trie_pattern(phrases):
+    """A regex matching any of phrases literally, nested by shared prefix so a search takes
+    about one step per character instead of trying every phrase at each position. Where
+    several phrases match at one position it matches the longest"""
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[''] = None
+
+    def pattern(node):
+        branches = []
+        for char, child in node.items():
+            if not char:
+                continue
+            run = char
+            # A stretch no other phrase branches off or ends in is one literal
+            while len(child) == 1 and '' not in child:
+                (char, child), = child.items()
+                run += char
+            branches.append(re.escape(run) + pattern(child))
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        # Greedy, so a longer phrase wins over one that ends here
+        return f"(?:{body})?" if '' in node else body
+
+    return pattern(trie)
+
+def _named(number, compiled):
+    """A compiled pattern as the combined regex's alternative for trigger number, None if it
+    has to be searched on its own: its group names could clash with another trigger's, and
+    inline flags are only allowed at the very start of a regex"""
+    if compiled.groupindex or _GROUP_REFERENCE.search(compiled.pattern):
+        return None
+    alternative = f"(?P<t{number}>{compiled.pattern})"
+    try:
+        re.compile(alternative)
+    except re.error:
+        return None
+    return alternative
+
+_matchers = {}
+_matchers_lock = threading.Lock()
+_config = None
+
+def _load_config():
+    if not TRIGGERS_FILE:
+        return {'default': DEFAULT_TRIGGERS}
+    with open(TRIGGERS_FILE) as f:
+        config = json.load(f)
+    config.setdefault('default', DEFAULT_TRIGGERS)
+    return config
+
+def matcher_for(channel):
+    """The compiled matcher for a channel's triggers, built once per channel"""
+    global _config
+    with _matchers_lock:
+        if _config is None:
+            _config = _load_config()
+        key = channel if channel in _config else 'default'
+        matcher = _matchers.get(key)
+        if matcher is None:
+            matcher = _matchers[key] = TriggerMatcher(_config[key])
+        return matcher
+
+def reload_triggers():
+    """Read TRIGGERS_FILE again on next use"""
+    global _config
+    with _matchers_lock:
+        _config = None
+        _matchers.clear()
+
+def react(client, event, trigger, match):
+    client.reactions_add(channel=event['channel'], timestamp=event['ts'], name=trigger.get('reaction', 'thumbsup'))
+
+def overdue_digest(client, event, trigger, match):
+    overdue_tasks = find_overdue_tasks(limit=trigger.get('limit', 5))
+    if overdue_tasks:
+        overdue_message = "⚠️ **Overdue Tasks Detected:**\n"
+        for task in overdue_tasks.values():
+            overdue_message += f"• {task['description']} (Due: {task['due_date'][:10]})\n"
+        sent = client.chat_postMessage(channel=event['channel'], text=overdue_message)
+        log_failure(sent, event['channel'], f"{trigger['name']} trigger reply")
+
+def task_lookup(client, event, trigger, match):
+    try:
+        task_id = int(match.group(1))
+    except (IndexError, TypeError, ValueError):
+        return
+    task = tasks.get(task_id)
+    if task is None:
+        return
+    sent = client.chat_postMessage(
+        channel=event['channel'],
+        text=f"📋 Task {task_id}: {task['description']}\n🏷️ Status: {task['status']} | Priority: {task['priority']}"
+    )
+    log_failure(sent, event['channel'], f"{trigger['name']} trigger reply for task {task_id}")
+
+ACTIONS = {
+    'react': react,
+    'overdue_digest': overdue_digest,
+    'task_lookup': task_lookup
+}
+
+def run_triggers(client, event):
+    """Run the action of every trigger the event's text sets off, returns their names"""
+    fired = []
+    for trigger, match in matcher_for(event.get('channel')).match(event.get('text')):
+        try:
+            ACTIONS[trigger['action']](client, event, trigger, match)
+        except Exception:
+            logging.getLogger(__name__).exception(f"Trigger {trigger['name']} failed")
+        fired.append(trigger['name'])
+    return fired
@@ -0,0 +1,134 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from slack_sdk.errors import SlackApiError
+
+USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', '3600'))
+# Refilled twice per TTL, so a member's entry is renewed well before it expires
+USER_CACHE_REFRESH = USER_CACHE_TTL / 2
+# How long to remember that a user id does not exist
+USER_CACHE_NEGATIVE_TTL = float(os.environ.get('USER_CACHE_NEGATIVE_TTL', '300'))
+# Entries kept at least, warm() raises it to the workspace's member count
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', '10000'))
+USERS_LIST_PAGE_SIZE = 200
+
+_MISSING = object()
+
+def _profile(user):
+    """The fields the bot shows from a users.info / users.list member"""
+    profile = user.get('profile', {})
+    return {
+        'id': user['id'],
+        'name': user.get('name'),
+        'real_name': user.get('real_name') or profile.get('real_name'),
+        'display_name': profile.get('display_name') or user.get('real_name') or user.get('name'),
+        'email': profile.get('email'),
+        'deleted': user.get('deleted', False)
+    }
+
+class UserDirectory:
+    """Slack user profiles cached with a TTL and LRU eviction.
+
+    Lookups for ids Slack doesn't know are cached as misses for a shorter time.
+    warm() fills the cache from users.list, and update() applies user_change
+    events, so display_name() can render names without calling Slack.
+    """
+
+    def __init__(self, client=None, ttl=None, negative_ttl=None, max_size=None, clock=time.monotonic):
+        self.client = client
+        self.ttl = USER_CACHE_TTL if ttl is None else ttl
+        self.negative_ttl = USER_CACHE_NEGATIVE_TTL if negative_ttl is None else negative_ttl
+        self.max_size = max_size or USER_CACHE_SIZE
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return _MISSING
+            expires_at, profile = entry
+            if expires_at <= self.clock():
+                del self._entries[user_id]
+                return _MISSING
+            self._entries.move_to_end(user_id)
+            return profile
+
+    def _put(self, user_id, profile):
+        ttl = self.ttl if profile is not None else self.negative_ttl
+        with self._lock:
+            self._entries[user_id] = (self.clock() + ttl, profile)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def lookup(self, user_id):
+        """Profile dict for user_id, from the cache or users.info, None if Slack has no such user"""
+        profile = self._get(user_id)
+        if profile is not _MISSING:
+            return profile
+        try:
+            response = self.client.users_info(user=user_id)
+        except SlackApiError as e:
+            if e.response.get('error') == 'user_not_found':
+                self._put(user_id, None)
+                return None
+            raise
+        profile = _profile(response['user'])
+        self._put(user_id, profile)
+        return profile
+
+    def display_name(self, user_id):
+        """Cached display name for user_id, or user_id itself when it isn't cached. Never calls Slack"""
+        if not user_id:
+            return user_id
+        profile = self._get(user_id)
+        if profile is _MISSING or profile is None:
+            return user_id
+        return profile['display_name'] or user_id
+
+    def update(self, user):
+        """Store a user object from users.list or a user_change / team_join event"""
+        self._put(user['id'], _profile(user))
+
+    def warm(self):
+        """Load every workspace member through paginated users.list, returns how many were cached.
+        max_size grows to the member count, so later pages don't evict the first ones"""
+        count = 0
+        cursor = None
+        while True:
+            response = self.client.users_list(limit=USERS_LIST_PAGE_SIZE, cursor=cursor)
+            with self._lock:
+                self.max_size = max(self.max_size, count + len(response['members']))
+            for user in response['members']:
+                self.update(user)
+                count += 1
+            cursor = response.get('response_metadata', {}).get('next_cursor')
+            if not cursor:
+                return count
+
+    def warm_in_background(self):
+        """Warm the cache on a daemon thread so startup isn't held up by users.list"""
+        def run():
+            try:
+                self.warm()
+            except Exception:
+                logging.getLogger(__name__).exception("Could not warm the user directory")
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+# Shared by the command handlers, main.py hands it the Slack client at startup
+user_directory = UserDirectory()